@@ -0,0 +1,53 @@
+"""
+Benchmark: formato latino escalar (format_lat_number) vs vectorizado (format_lat_array).
+
+Uso (desde la raíz del repo):
+    python benchmarks/bench_formato_latino.py [n_valores]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data import format_lat_array, format_lat_number  # noqa: E402
+
+
+def medir(fn, repeticiones=3):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        fn()
+        mejor = min(mejor, time.perf_counter() - t0)
+    return mejor
+
+
+def main(n=1_000_000, decimals=2):
+    rng = np.random.default_rng(42)
+    valores = rng.lognormal(mean=6, sigma=3, size=n) * rng.choice([-1, 1], size=n)
+    valores[rng.random(n) < 0.01] = np.nan
+
+    t_escalar = medir(lambda: [format_lat_number(v, decimals=decimals) for v in valores], repeticiones=1)
+    t_vector = medir(lambda: format_lat_array(valores, decimals=decimals))
+
+    # además de la muestra aleatoria, valores justo en la mitad del último decimal,
+    # donde redondear el producto escalado podría no coincidir con el redondeo exacto
+    muestra = valores[rng.choice(n, size=min(n, 10_000), replace=False)]
+    mitades = (rng.integers(-10**6, 10**6, size=10_000) + 0.5) / 10**decimals
+    casos = np.concatenate([muestra, mitades, [0.005, 2.675, 1.005, 0.125, -0.015, 1e15 + 0.5]])
+    iguales = all(
+        a == format_lat_number(v, decimals=decimals)
+        for v, a in zip(casos, format_lat_array(casos, decimals=decimals))
+    )
+
+    print(f"valores:           {format_lat_number(n, decimals=0)}")
+    print(f"format_lat_number: {t_escalar:8.3f} s")
+    print(f"format_lat_array:  {t_vector:8.3f} s")
+    print(f"aceleración:       {t_escalar / t_vector:8.1f}x")
+    print(f"mismo resultado:   {'sí' if iguales else 'NO'}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -2,12 +2,24 @@ import os
 from io import BytesIO
 from datetime import datetime
 import re
+import json
+import signal
+import logging
+import threading
+import base64
+import hashlib
+import warnings
+import zipfile
+import zlib
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
 
 import numpy as np
 import pandas as pd
 import streamlit as st
 import matplotlib.pyplot as plt
-from matplotlib.ticker import FuncFormatter
+from matplotlib.ticker import Formatter
 
 # Importaciones opcionales
 PLOTLY_AVAILABLE = False
@@ -18,12 +30,40 @@ try:
 except ImportError:
     pass
 
+AGGRID_AVAILABLE = False
+try:
+    from st_aggrid import AgGrid, GridOptionsBuilder
+    AGGRID_AVAILABLE = True
+except ImportError:
+    pass
+
+PYARROW_AVAILABLE = False
+try:
+    import pyarrow  # noqa: F401  (motor de pd.read_parquet / to_parquet)
+    PYARROW_AVAILABLE = True
+except ImportError:
+    pass
+
+DUCKDB_AVAILABLE = False
+try:
+    import duckdb
+    DUCKDB_AVAILABLE = True
+except ImportError:
+    pass
+
+from estadistica_streaming import perfil_por_lotes
+
+logger = logging.getLogger(__name__)
+
 # =========================
 # Configuración inicial
 # =========================
 DATA_DIR = "archivos_subidos/datos"
 os.makedirs(DATA_DIR, exist_ok=True)
 
+# Copias Parquet de las hojas de Excel (carpeta oculta: listar_archivos no la muestra)
+PARQUET_CACHE_DIR = os.path.join(DATA_DIR, ".cache_parquet")
+
 # ❌ IMPORTANTE:
 # NO usar st.set_page_config() aquí.
 # Solo en app.py. Esto es lo que hace que el sidebar sea plegable y no se rompa.
@@ -37,7 +77,7 @@ def sb_is_open() -> bool:
 PLOTLY_CONFIG = {"locale": "pt-BR"}  # fuerza ',' decimal y '.' miles en Plotly
 
 
-def format_lat_number(x, decimals=2):
+def format_lat_number(x, decimals=2, thousands=".", decimal=","):
     """
     Formatea números con:
     - '.' miles
@@ -47,31 +87,129 @@ def format_lat_number(x, decimals=2):
         if x is None or (isinstance(x, float) and np.isnan(x)):
             return ""
         s = f"{float(x):,.{decimals}f}"  # 1,234,567.89
-        s = s.replace(",", "X").replace(".", ",").replace("X", ".")  # 1.234.567,89
-        return s
+        return s.translate(str.maketrans({",": thousands, ".": decimal}))  # 1.234.567,89
     except Exception:
         return str(x)
 
 
+# Tablas de los 1000 grupos de 3 dígitos, con y sin ceros a la izquierda
+_GRUPOS_3 = np.array([f"{i:03d}" for i in range(1000)])
+_GRUPOS_LIBRES = np.array([str(i) for i in range(1000)])
+
+
+def _componer_miles(enteros: np.ndarray, thousands: str) -> np.ndarray:
+    """Convierte enteros >= 0 a texto con separador de miles, por bloques de igual cantidad de grupos."""
+    n_grupos = np.ones(enteros.shape, dtype=np.int64)
+    for k in range(1, 7):
+        n_grupos += enteros >= 1000 ** k
+
+    out = np.empty(enteros.shape, dtype="<U32")
+    for g in np.unique(n_grupos):
+        sel = n_grupos == g
+        e = enteros[sel]
+        s = _GRUPOS_LIBRES[e // 1000 ** (g - 1)]
+        for k in range(g - 2, -1, -1):
+            s = np.char.add(np.char.add(s, thousands), _GRUPOS_3[(e // 1000 ** k) % 1000])
+        out[sel] = s
+    return out
+
+
+def format_lat_array(values, decimals=2, thousands=".", decimal=","):
+    """
+    Versión vectorizada de format_lat_number: formatea un array completo de una vez.
+    Devuelve un array de strings con la misma forma; NaN/None -> "".
+    `decimals` y los separadores son configurables (ej. thousands=" ", decimal=".").
+    """
+    arr = np.asarray(values)
+    try:
+        x = arr.astype("float64").ravel()
+    except (TypeError, ValueError):
+        flat = [format_lat_number(v, decimals, thousands, decimal) for v in arr.ravel()]
+        return np.array(flat, dtype=object).reshape(arr.shape)
+
+    out = np.full(x.shape, "", dtype="<U40")
+    escala = 10 ** decimals
+    finitos = np.isfinite(x)
+    with np.errstate(invalid="ignore", over="ignore"):
+        t = np.abs(x) * escala
+        # Cerca de ,5 el producto ya redondeó una vez y np.round(t) puede no coincidir con el
+        # redondeo exacto del decimal que hace format_lat_number (0.005 → "0,01", 2.675 → "2,67")
+        mitades = np.abs(t - np.floor(t) - 0.5) <= 4 * np.spacing(t)
+    # Sobre 2**53 el entero escalado deja de ser exacto: esos, las mitades y ±inf van por la vía escalar
+    rapidos = finitos & (t < 2 ** 53) & ~mitades
+    lentos = ~rapidos & ~np.isnan(x)
+
+    v = x[rapidos]
+    if v.size:
+        escalado = np.round(t[rapidos]).astype(np.int64)
+        s = _componer_miles(escalado // escala, thousands)
+        if decimals > 0:
+            if decimals <= 3:
+                frac = _GRUPOS_3[(escalado % escala) * 10 ** (3 - decimals)]
+                frac = frac.astype(f"<U{decimals}")  # recorta a los primeros `decimals` dígitos
+            else:
+                frac = np.char.zfill((escalado % escala).astype(str), decimals)
+            s = np.char.add(np.char.add(s, decimal), frac)
+        out[rapidos] = np.char.add(np.where(np.signbit(v), "-", ""), s)
+
+    if lentos.any():
+        out = out.astype(object)  # los valores enormes no caben en <U40
+        for i in np.flatnonzero(lentos):
+            out[i] = format_lat_number(x[i], decimals, thousands, decimal)
+
+    return out.reshape(arr.shape)
+
+
+class LatFormatter(Formatter):
+    """Formatter de Matplotlib en estilo latino; formatea todos los ticks de un eje en bloque."""
+
+    def __init__(self, decimals=0):
+        self.decimals = decimals
+
+    def __call__(self, x, pos=None):
+        return format_lat_number(x, decimals=self.decimals)
+
+    def format_ticks(self, values):
+        return format_lat_array(values, decimals=self.decimals).tolist()
+
+
 def mpl_lat_formatter(decimals=0):
-    def _fmt(x, pos=None):
-        return format_lat_number(x, decimals=decimals)
-    return FuncFormatter(_fmt)
+    return LatFormatter(decimals=decimals)
 
 
-def style_latino(df: pd.DataFrame, decimals=2):
+MAX_CELDAS_STYLER = 262_144  # tope de pandas (styler.render.max_elements) para formatear con Styler
+
+
+def texto_latino(df: pd.DataFrame, decimals=2):
     """
-    Styler para que st.dataframe muestre:
-    - '.' miles
-    - ',' decimales
-    SOLO para columnas numéricas.
+    Copia donde las columnas numéricas quedan como texto con '.' miles y ',' decimales,
+    formateadas por columna con format_lat_array. Para grillas que ya ordenan en el
+    servidor (AgGrid); en st.dataframe usar style_latino, que conserva los números.
     """
     num_cols = df.select_dtypes(include="number").columns.tolist()
     if not num_cols:
         return df
 
-    fmt_map = {c: (lambda v, d=decimals: format_lat_number(v, decimals=d)) for c in num_cols}
-    return df.style.format(fmt_map, na_rep="")
+    vista = df.copy()
+    for c in num_cols:
+        vista[c] = format_lat_array(vista[c].to_numpy(), decimals=decimals)
+    return vista
+
+
+def style_latino(df: pd.DataFrame, decimals=2):
+    """
+    Vista para st.dataframe con '.' miles y ',' decimales. Devuelve un Styler que solo
+    cambia cómo se muestran las columnas numéricas: los datos siguen siendo números, así
+    que ordenar por columna en la tabla ordena por valor y no como texto.
+    El Styler recorre cada celda: pasado MAX_CELDAS_STYLER (o con etiquetas repetidas,
+    que Styler no admite) se usa texto_latino; las tablas grandes van paginadas.
+    """
+    num_cols = df.select_dtypes(include="number").columns.tolist()
+    if not num_cols:
+        return df
+    if df.size > MAX_CELDAS_STYLER or not (df.index.is_unique and df.columns.is_unique):
+        return texto_latino(df, decimals=decimals)
+    return df.style.format(precision=decimals, thousands=".", decimal=",", na_rep="", subset=num_cols)
 
 
 def get_scale_factor_and_label(mode: str, series_max_abs: float):
@@ -149,76 +287,88 @@ def _nice_ticks(vmin: float, vmax: float, n: int = 6):
     else:
         step = 0.01
 
-    ticks = np.unique(np.round(raw / step) * step)
+    ticks = np.unique(np.round(raw / step) * step) + 0.0  # + 0.0 evita el tick "-0"
     return ticks.tolist()
 
 
-def apply_plotly_latino_format(fig, decimals=0):
-    fig.update_layout(separators=".,")  # miles="." decimal=","
+def _rango_columnas(df: pd.DataFrame, cols, factor: float = 1.0):
+    """
+    (mín, máx) de las columnas a partir de sus estadísticas (reducciones de pandas),
+    ya dividido por el factor de escala. None si no hay valores finitos.
+    """
+    try:
+        vmin = float(df[cols].min(numeric_only=True).min()) / float(factor)
+        vmax = float(df[cols].max(numeric_only=True).max()) / float(factor)
+    except Exception:
+        return None
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        return None
+    return vmin, vmax
 
-    # ---- EJE Y ----
-    y_all = []
-    for tr in fig.data:
-        if hasattr(tr, "y") and tr.y is not None:
-            try:
-                y_arr = np.asarray(tr.y, dtype="float64")
-                y_arr = y_arr[np.isfinite(y_arr)]
-                if y_arr.size:
-                    y_all.append(y_arr)
-            except Exception:
-                pass
 
-    if y_all:
-        y_concat = np.concatenate(y_all)
-        y_min, y_max = float(np.min(y_concat)), float(np.max(y_concat))
-        y_ticks = _nice_ticks(y_min, y_max, n=6)
-        y_text = [format_lat_number(v, decimals=decimals) for v in y_ticks]
+def _rango_trazas(fig, eje: str):
+    """
+    Respaldo cuando no se pasan estadísticas: reduce mín/máx traza por traza,
+    sin concatenar los datos. None si el eje no es numérico.
+    """
+    vmin, vmax = np.inf, -np.inf
+    for tr in fig.data:
+        vals = getattr(tr, eje, None) if eje in tr else None
+        if vals is None:
+            continue
+        arr = np.asarray(vals)
+        # texto/categorías y fechas (kind "M") no llevan ticks numéricos
+        if arr.dtype.kind not in "biuf":
+            return None
+        if arr.size:
+            with np.errstate(invalid="ignore"), warnings.catch_warnings():
+                warnings.simplefilter("ignore", RuntimeWarning)
+                vmin = min(vmin, float(np.nanmin(arr)))
+                vmax = max(vmax, float(np.nanmax(arr)))
+    if not (np.isfinite(vmin) and np.isfinite(vmax)):
+        return None
+    return vmin, vmax
+
+
+def apply_plotly_latino_format(fig, decimals=0, y_range=None, x_range=None):
+    """
+    Formato latino para figuras Plotly, calculado una vez por figura:
+    - separators=".," para que d3-format use '.' miles y ',' decimales
+    - ticks "bonitos" desde (mín, máx) de las columnas (`y_range` / `x_range`)
+    - hovertemplate con especificador d3, sin strings por punto
+    """
+    fmt = f",.{decimals}f"
+    fig.update_layout(separators=".,")  # miles="." decimal=","
 
+    # ---- EJE Y ----
+    if y_range is None:
+        y_range = _rango_trazas(fig, "y")
+    if y_range is not None:
+        y_ticks = _nice_ticks(y_range[0], y_range[1], n=6)
         fig.update_yaxes(
             tickmode="array",
             tickvals=y_ticks,
-            ticktext=y_text
+            ticktext=format_lat_array(y_ticks, decimals=decimals).tolist(),
+            hoverformat=fmt,
         )
 
     # ---- EJE X numérico ----
-    x_all = []
-    x_is_numeric = True
-    for tr in fig.data:
-        if hasattr(tr, "x") and tr.x is not None:
-            try:
-                x_arr = np.asarray(tr.x)
-                if x_arr.dtype.kind in ("U", "S", "O"):
-                    x_is_numeric = False
-                    break
-                x_num = np.asarray(tr.x, dtype="float64")
-                x_num = x_num[np.isfinite(x_num)]
-                if x_num.size:
-                    x_all.append(x_num)
-            except Exception:
-                x_is_numeric = False
-                break
-
-    if x_is_numeric and x_all:
-        x_concat = np.concatenate(x_all)
-        x_min, x_max = float(np.min(x_concat)), float(np.max(x_concat))
-        x_ticks = _nice_ticks(x_min, x_max, n=6)
-        x_text = [format_lat_number(v, decimals=decimals) for v in x_ticks]
-
+    if x_range is None:
+        x_range = _rango_trazas(fig, "x")
+    if x_range is not None:
+        x_ticks = _nice_ticks(x_range[0], x_range[1], n=6)
         fig.update_xaxes(
             tickmode="array",
             tickvals=x_ticks,
-            ticktext=x_text
+            ticktext=format_lat_array(x_ticks, decimals=decimals).tolist(),
+            hoverformat=fmt,
         )
 
     # ---- HOVER ----
     for tr in fig.data:
-        if hasattr(tr, "y") and tr.y is not None:
-            try:
-                y_vals = np.asarray(tr.y, dtype="float64")
-                tr.customdata = [format_lat_number(v, decimals=decimals) for v in y_vals]
-                tr.hovertemplate = "%{customdata}<extra></extra>"
-            except Exception:
-                pass
+        # las cajas con estadísticas precalculadas no traen `y`: usan hoverformat del eje
+        if tr.type in ("scatter", "scattergl", "bar", "box") and tr.y is not None:
+            tr.hovertemplate = f"%{{y:{fmt}}}<extra></extra>"
 
     return fig
 
@@ -230,6 +380,13 @@ def ext_archivo(path: str) -> str:
     return os.path.splitext(path)[1].lower()
 
 
+def es_dataset_parquet(path: str) -> bool:
+    """Carpeta con archivos .parquet (por ejemplo particionada estilo Hive: anio=2020/...)."""
+    if not os.path.isdir(path):
+        return False
+    return any(f.endswith(".parquet") for _, _, fs in os.walk(path) for f in fs)
+
+
 def listar_archivos():
     files = []
     for f in os.listdir(DATA_DIR):
@@ -238,6 +395,8 @@ def listar_archivos():
             ext = ext_archivo(p)
             if ext in [".csv", ".tsv", ".txt", ".xlsx", ".xls", ".xlsb", ".parquet", ".feather", ".dta"]:
                 files.append(f)
+        elif not f.startswith(".") and es_dataset_parquet(p):
+            files.append(f)
     return sorted(files, key=str.lower)
 
 
@@ -251,8 +410,43 @@ def excel_engine_for_ext(ext: str):
     return None
 
 
-def obtener_sheets_excel(path: str):
+def _sheets_xlsx(path: str):
+    # Solo lee xl/workbook.xml dentro del zip: no toca las celdas.
+    with zipfile.ZipFile(path) as zf:
+        root = ET.fromstring(zf.read("xl/workbook.xml"))
+    return [el.attrib["name"] for el in root.iter() if el.tag.rsplit("}", 1)[-1] == "sheet"]
+
+
+def _sheets_xls(path: str):
+    import xlrd
+    book = xlrd.open_workbook(path, on_demand=True)  # on_demand: no carga las hojas
+    try:
+        return book.sheet_names()
+    finally:
+        book.release_resources()
+
+
+def _sheets_xlsb(path: str):
+    from pyxlsb import open_workbook
+    with open_workbook(path) as wb:  # solo lee xl/workbook.bin
+        return list(wb.sheets)
+
+
+@st.cache_data(show_spinner=False)
+def obtener_sheets_excel(path: str, firma=None):
+    """
+    Lista las hojas leyendo solo los metadatos del libro.
+    Si el lector liviano falla, se recurre a pd.ExcelFile como antes.
+    """
     ext = ext_archivo(path)
+    lectores = {".xlsx": _sheets_xlsx, ".xls": _sheets_xls, ".xlsb": _sheets_xlsb}
+    try:
+        sheets = lectores[ext](path)
+        if sheets:
+            return sheets
+    except Exception:
+        pass
+
     engine = excel_engine_for_ext(ext)
     try:
         xls = pd.ExcelFile(path, engine=engine)
@@ -265,8 +459,205 @@ def obtener_sheets_excel(path: str):
             return []
 
 
-@st.cache_data(show_spinner=False)
-def leer_archivo(path: str, sheet_name=None):
+# =========================
+# CACHÉ EXCEL -> PARQUET
+# =========================
+def _prefijo_parquet(path: str) -> str:
+    # el nombre saneado es solo legible: "a b.xlsx" y "a_b.xlsx" darían lo mismo, el hash de la ruta no
+    base = re.sub(r"[^0-9A-Za-z_\-]+", "_", os.path.basename(path))
+    ruta = version_dataset(os.path.abspath(path))[:12]
+    return f"{base}_{ruta}__"
+
+
+def ruta_parquet_hoja(path: str, sheet, firma: str) -> str:
+    hoja = version_dataset(sheet)[:12]
+    return os.path.join(PARQUET_CACHE_DIR, f"{_prefijo_parquet(path)}{hoja}__{firma}.parquet")
+
+
+META_TIPOS_MIXTOS = b"hola_mundo.tipos_mixtos"
+# código por celda de una columna mixta guardada como texto -> cómo recuperar el valor
+TIPOS_MIXTOS = {1: int, 2: float, 3: lambda t: t == "True", 4: lambda t: pd.Timestamp(t).to_pydatetime()}
+
+
+def _codigo_tipo(v) -> int:
+    if isinstance(v, (bool, np.bool_)):
+        return 3
+    if isinstance(v, (int, np.integer)):
+        return 1
+    if isinstance(v, (float, np.floating)):
+        return 2
+    if isinstance(v, (datetime, np.datetime64)):
+        return 4
+    return 0  # texto, nulo u otro objeto: queda como texto
+
+
+def _preparar_para_parquet(df: pd.DataFrame):
+    """
+    Parquet exige nombres de columna de texto y columnas de un solo tipo.
+    Solo las columnas object que Arrow no puede guardar (ej. números y '-') pasan a texto;
+    el tipo original de cada celda queda como código (TIPOS_MIXTOS) para que
+    restaurar_tipos_mixtos devuelva los mismos valores que leer el Excel directo.
+    Devuelve (DataFrame, {columna: códigos int8}).
+    """
+    import pyarrow as pa
+
+    out = df.copy()
+    cols = [str(c) for c in out.columns]
+    out.columns = cols if len(set(cols)) == len(cols) else make_unique_columns(cols)
+
+    tipos = {}
+    for c in out.columns:
+        if out[c].dtype == "object":
+            try:
+                pa.array(out[c], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                valores = out[c].to_numpy(dtype=object)
+                tipos[c] = np.fromiter((_codigo_tipo(v) for v in valores), dtype=np.int8, count=len(valores))
+                out[c] = out[c].map(lambda v: v if pd.isna(v) else str(v))
+    return out, tipos
+
+
+def _tipos_mixtos_de_esquema(esquema) -> dict:
+    """{columna: códigos int8} guardados por _hoja_a_parquet en los metadatos del Parquet."""
+    crudo = (esquema.metadata or {}).get(META_TIPOS_MIXTOS)
+    if not crudo:
+        return {}
+    return {
+        c: np.frombuffer(zlib.decompress(base64.b64decode(b)), dtype=np.int8)
+        for c, b in json.loads(crudo).items()
+    }
+
+
+def restaurar_tipos_mixtos(df: pd.DataFrame, tipos: dict, inicio: int = 0) -> pd.DataFrame:
+    """
+    Devuelve a cada celda de las columnas mixtas su tipo original (ver _preparar_para_parquet).
+    `inicio` es la fila del archivo donde empieza `df`, para leer por lotes. Modifica `df`.
+    """
+    for c, codigos in tipos.items():
+        if c not in df.columns:
+            continue
+        cod = codigos[inicio:inicio + len(df)]
+        if not cod.any():
+            continue
+        texto = df[c].to_numpy(dtype=object)
+        valores = texto.copy()
+        for codigo, convertir in TIPOS_MIXTOS.items():
+            m = cod == codigo
+            if m.any():
+                valores[m] = [convertir(t) for t in texto[m]]
+        df[c] = pd.Series(valores, index=df.index, dtype=object)
+    return df
+
+
+def leer_parquet_hoja(ruta: str) -> pd.DataFrame:
+    """Lee la copia Parquet de una hoja con los tipos de las columnas mixtas restaurados."""
+    import pyarrow.parquet as pq
+
+    tabla = pq.read_table(ruta)
+    return restaurar_tipos_mixtos(tabla.to_pandas(), _tipos_mixtos_de_esquema(tabla.schema))
+
+
+def _hoja_a_parquet(path: str, sheet, destino: str) -> str:
+    # Función de nivel de módulo para poder ejecutarse en un ProcessPoolExecutor.
+    engine = excel_engine_for_ext(ext_archivo(path))
+    df = pd.read_excel(path, sheet_name=sheet, engine=engine)
+    df, tipos = _preparar_para_parquet(df)
+
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    if tipos:
+        codificados = {c: base64.b64encode(zlib.compress(t.tobytes())).decode("ascii") for c, t in tipos.items()}
+        tabla = tabla.replace_schema_metadata({**tabla.schema.metadata, META_TIPOS_MIXTOS: json.dumps(codificados)})
+    tmp = f"{destino}.{os.getpid()}.tmp"
+    pq.write_table(tabla, tmp)
+    os.replace(tmp, destino)  # atómico: otra sesión nunca ve un archivo a medias
+    return destino
+
+
+def _limpiar_parquet_obsoletos(path: str, firma: str):
+    prefijo = _prefijo_parquet(path)
+    for f in os.listdir(PARQUET_CACHE_DIR):
+        if f.startswith(prefijo) and not f.endswith(f"__{firma}.parquet"):
+            try:
+                os.remove(os.path.join(PARQUET_CACHE_DIR, f))
+            except OSError:
+                pass
+
+
+def convertir_libro_a_parquet(path: str, firma: str) -> dict:
+    """
+    Convierte todas las hojas del libro a Parquet, en paralelo (un proceso por hoja).
+    Devuelve {hoja: ruta_parquet} solo para las hojas convertidas correctamente.
+    """
+    os.makedirs(PARQUET_CACHE_DIR, exist_ok=True)
+    _limpiar_parquet_obsoletos(path, firma)
+
+    rutas = {s: ruta_parquet_hoja(path, s, firma) for s in obtener_sheets_excel(path, firma)}
+    pendientes = {s: r for s, r in rutas.items() if not os.path.exists(r)}
+
+    if len(pendientes) == 1:
+        s, r = next(iter(pendientes.items()))
+        try:
+            _hoja_a_parquet(path, s, r)
+        except Exception:
+            pass
+    elif pendientes:
+        workers = min(len(pendientes), os.cpu_count() or 1)
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            futuros = [ex.submit(_hoja_a_parquet, path, s, r) for s, r in pendientes.items()]
+            for fut in as_completed(futuros):
+                try:
+                    fut.result()
+                except Exception:
+                    pass  # esa hoja se seguirá leyendo directo desde Excel
+
+    return {s: r for s, r in rutas.items() if os.path.exists(r)}
+
+
+def parquet_de_hoja(path: str, sheet, firma: str):
+    """
+    Ruta Parquet de la hoja pedida; convierte el libro completo en el primer acceso.
+    `sheet` puede ser nombre o índice. Devuelve None si no hay copia disponible.
+    """
+    if isinstance(sheet, int):
+        sheets = obtener_sheets_excel(path, firma)
+        if not 0 <= sheet < len(sheets):
+            return None
+        sheet = sheets[sheet]
+
+    ruta = ruta_parquet_hoja(path, sheet, firma)
+    if os.path.exists(ruta):
+        return ruta
+    return convertir_libro_a_parquet(path, firma).get(sheet)
+
+
+def firma_archivo(path: str) -> str:
+    """
+    Firma barata del archivo en disco (mtime + tamaño).
+    Se usa como parte de la clave de caché para invalidarla cuando el archivo cambia.
+    En una carpeta Parquet: mtime más reciente, tamaño total y cantidad de archivos.
+    """
+    try:
+        if os.path.isdir(path):
+            infos = [
+                os.stat(os.path.join(raiz, f))
+                for raiz, _, fs in os.walk(path) for f in fs if f.endswith(".parquet")
+            ]
+            return f"{max((i.st_mtime_ns for i in infos), default=0)}-{sum(i.st_size for i in infos)}-{len(infos)}"
+        info = os.stat(path)
+        return f"{info.st_mtime_ns}-{info.st_size}"
+    except OSError:
+        return "0-0"
+
+
+def leer_archivo(path: str, sheet_name=None, firma=None):
+    # Sin caché propia: el resultado ya queda en cargar_dataset_limpio (cache_resource) y una
+    # segunda copia en st.cache_data duplicaba el dataset en memoria.
+    # `firma` ubica la copia Parquet de las hojas de Excel.
+    if os.path.isdir(path):
+        return pd.read_parquet(path)  # carpeta Parquet (particiones incluidas)
     ext = ext_archivo(path)
 
     if ext == ".csv":
@@ -279,6 +670,13 @@ def leer_archivo(path: str, sheet_name=None):
         engine = excel_engine_for_ext(ext)
         if sheet_name is None:
             sheet_name = 0
+        if PYARROW_AVAILABLE:
+            try:
+                ruta = parquet_de_hoja(path, sheet_name, firma or firma_archivo(path))
+                if ruta:
+                    return leer_parquet_hoja(ruta)
+            except Exception:
+                pass  # si la caché Parquet falla, se lee el Excel como siempre
         if engine:
             return pd.read_excel(path, sheet_name=sheet_name, engine=engine)
         return pd.read_excel(path, sheet_name=sheet_name)
@@ -317,19 +715,41 @@ def limpiar_df(df: pd.DataFrame, drop_blank=True) -> pd.DataFrame:
     return df2.reset_index(drop=True)
 
 
+def texto_a_numero(serie: pd.Series) -> pd.Series:
+    """Convierte texto con formato latino (miles '.', decimal ',') a número; lo demás queda NaN."""
+    s = serie.astype(str).str.strip()
+    s = s.str.replace("\u00a0", "", regex=False).str.replace(" ", "", regex=False)
+    s_lat = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
+    return pd.to_numeric(s_lat, errors="coerce")
+
+
 def intentar_convertir_numericos(df: pd.DataFrame, umbral=0.70) -> pd.DataFrame:
     out = df.copy()
     for c in out.columns:
-        if out[c].dtype == "object":
-            s = out[c].astype(str).str.strip()
-            s = s.str.replace("\u00a0", "", regex=False).str.replace(" ", "", regex=False)
-            s_lat = s.str.replace(".", "", regex=False).str.replace(",", ".", regex=False)
-            conv = pd.to_numeric(s_lat, errors="coerce")
+        # Texto puede llegar como object o como StringDtype (Parquet / pandas >= 3)
+        if out[c].dtype == "object" or isinstance(out[c].dtype, pd.StringDtype):
+            conv = texto_a_numero(out[c])
             if float(conv.notna().mean()) >= umbral:
                 out[c] = conv
     return out
 
 
+@st.cache_resource(show_spinner=False, max_entries=8)
+def cargar_dataset_limpio(path: str, sheet_name, firma: str, drop_blank: bool, auto_numeric: bool, umbral: float):
+    """
+    Lectura + limpieza + conversión numérica en una sola etapa cacheada.
+    La clave es (archivo, hoja, firma, drop_blank, auto_numeric, umbral) y la caché
+    es compartida entre sesiones, así que un rerun no vuelve a recorrer el dataset.
+
+    Devuelve siempre el MISMO objeto: tratarlo como de solo lectura.
+    """
+    df = leer_archivo(path, sheet_name=sheet_name, firma=firma)
+    df = limpiar_df(df, drop_blank=drop_blank)
+    if auto_numeric and not df.empty:
+        df = intentar_convertir_numericos(df, umbral=umbral)
+    return df
+
+
 def columnas_numericas(df):
     return df.select_dtypes(include="number").columns.tolist()
 
@@ -343,6 +763,21 @@ def df_to_csv_bytes(df: pd.DataFrame) -> bytes:
     return df.to_csv(index=False).encode("utf-8")
 
 
+@st.cache_data(show_spinner=False, max_entries=4)
+def csv_dataset_cacheado(_df: pd.DataFrame, version: str) -> bytes:
+    # `_df` no se hashea (sería O(filas)); la clave real es `version`.
+    return df_to_csv_bytes(_df)
+
+
+def version_dataset(*partes) -> str:
+    """
+    Clave corta que identifica el contenido del dataset activo
+    (archivo + firma + opciones de limpieza + tipos aplicados).
+    Las cachés que reciben el DataFrame como `_df` se indexan con ella.
+    """
+    return hashlib.sha1("|".join(map(str, partes)).encode("utf-8")).hexdigest()[:16]
+
+
 # =========================
 # CONVERSIÓN ROBUSTA DE FECHAS
 # =========================
@@ -403,7 +838,8 @@ def convertir_fecha_robusta(series: pd.Series) -> pd.Series:
 # TIPADO DE COLUMNAS
 # =========================
 def aplicar_tipo_columna(df: pd.DataFrame, col: str, tipo: str) -> pd.DataFrame:
-    out = df.copy()
+    # Copia superficial: solo se reasignan columnas completas, el frame de entrada no se toca.
+    out = df.copy(deep=False)
     if col not in out.columns:
         return out
 
@@ -460,7 +896,9 @@ def panel_tipado(df: pd.DataFrame):
             col_types[col] = tipo
             st.success(f"✓ Tipo guardado: {col} → {tipo}")
 
-    df2 = df.copy()
+    # df puede ser el frame compartido de cache_resource: copia superficial (sin duplicar datos)
+    # para que ninguna asignación posterior sobre df2 lo modifique.
+    df2 = df.copy(deep=False)
     for c, t in col_types.items():
         if c in df2.columns:
             df2 = aplicar_tipo_columna(df2, c, t)
@@ -479,43 +917,349 @@ def panel_tipado(df: pd.DataFrame):
 
 
 # =========================
-# ESTADÍSTICA DESCRIPTIVA
+# GRILLA PAGINADA (DATASET COMPLETO)
 # =========================
-def seccion_estadistica_descriptiva(df: pd.DataFrame):
-    st.header("Estadística Descriptiva")
+@st.cache_resource(show_spinner=False, max_entries=16)
+def _indices_grilla(_df: pd.DataFrame, version: str, filtro_col, filtro_txt: str, orden_col, ascendente: bool):
+    """
+    Posiciones de fila tras filtrar y ordenar en el servidor.
+    Se calcula una vez por (dataset, filtro, orden); cambiar de página no recorre el dataset.
+    """
+    idx = np.arange(len(_df))
+
+    if filtro_col and filtro_txt:
+        s = _df[filtro_col].astype(str)
+        mask = s.str.contains(filtro_txt, case=False, regex=False, na=False).to_numpy()
+        idx = idx[mask]
 
+    if orden_col:
+        vals = _df[orden_col].iloc[idx].reset_index(drop=True)
+        orden = vals.sort_values(ascending=ascendente, kind="stable", na_position="last").index.to_numpy()
+        idx = idx[orden]
+
+    return idx
+
+
+def mostrar_grilla_paginada(df: pd.DataFrame, version: str, key: str, decimals=2, height=500):
+    """
+    Grilla con paginación, orden y filtro resueltos en el servidor:
+    al navegador solo viaja la ventana visible, ya formateada en estilo latino (como texto
+    en AgGrid, que no reordena; con Styler en st.dataframe).
+    """
     cols = df.columns.tolist()
-    if not cols:
-        st.info("El dataset no tiene columnas.")
-        return
 
-    c1, c2 = st.columns([3, 1])
+    c1, c2, c3, c4 = st.columns([2, 2, 2, 1])
     with c1:
-        sel = st.multiselect(
-            "Variables a incluir en el análisis",
-            cols,
-            default=cols[: min(12, len(cols))],
-            help="Puedes mezclar variables numéricas y categóricas."
-        )
+        filtro_col = st.selectbox("Filtrar columna", ["(ninguna)"] + cols, key=f"{key}_fcol")
     with c2:
-        include_all = st.toggle("Incluir variables categóricas", value=True)
+        filtro_txt = st.text_input("Contiene", "", key=f"{key}_ftxt", disabled=filtro_col == "(ninguna)")
+    with c3:
+        orden_col = st.selectbox("Ordenar por", ["(orden original)"] + cols, key=f"{key}_ocol")
+    with c4:
+        ascendente = st.toggle("Ascendente", value=True, key=f"{key}_asc")
+
+    idx = _indices_grilla(
+        df,
+        version,
+        None if filtro_col == "(ninguna)" else filtro_col,
+        filtro_txt.strip(),
+        None if orden_col == "(orden original)" else orden_col,
+        ascendente,
+    )
+    total = len(idx)
+
+    c5, c6 = st.columns([1, 1])
+    with c5:
+        por_pagina = st.selectbox("Filas por página", [50, 100, 250, 500], index=1, key=f"{key}_pp")
+    n_paginas = max(1, -(-total // por_pagina))
+    with c6:
+        pagina = st.number_input("Página", 1, n_paginas, 1, key=f"{key}_pag")
+
+    ini = (int(pagina) - 1) * por_pagina
+    fin = min(ini + por_pagina, total)
+    pagina_df = df.iloc[idx[ini:fin]]  # solo las filas visibles
+
+    if AGGRID_AVAILABLE:
+        vista = texto_latino(pagina_df, decimals=decimals)
+        gb = GridOptionsBuilder.from_dataframe(vista)
+        # Orden y filtro ya se resolvieron en el servidor sobre el dataset completo
+        gb.configure_default_column(sortable=False, filter=False, resizable=True)
+        AgGrid(
+            vista,
+            gridOptions=gb.build(),
+            height=height,
+            key=f"{key}_aggrid_{version}_{filtro_col}_{orden_col}_{ascendente}_{pagina}_{por_pagina}",
+        )
+    else:
+        st.dataframe(style_latino(pagina_df, decimals=decimals), use_container_width=True, height=height, hide_index=True)
 
-    if not sel:
-        st.warning("⚠️ Selecciona al menos una variable.")
+    st.caption(
+        f"Filas {format_lat_number(ini + 1 if total else 0, decimals=0)}–{format_lat_number(fin, decimals=0)}"
+        f" de {format_lat_number(total, decimals=0)}"
+        + (f" (filtradas de {format_lat_number(len(df), decimals=0)})" if total != len(df) else "")
+        + f" · Página {format_lat_number(pagina, decimals=0)} de {format_lat_number(n_paginas, decimals=0)}"
+    )
+
+
+# =========================
+# FILTROS GLOBALES (ÍNDICES POR COLUMNA)
+# =========================
+MAX_CATEGORIAS_BITMAP = 64  # sobre esto se filtra con tabla de búsqueda sobre los códigos
+
+
+@st.cache_resource(show_spinner=False, max_entries=64)
+def indice_columna(_df: pd.DataFrame, version: str, col: str) -> dict:
+    """
+    Índice de una columna, construido una vez por (dataset, columna) y compartido sin copiar:
+    - categóricas: códigos enteros (-1 = nulo), categorías ordenadas y, si son pocas,
+      un bitmap empaquetado (np.packbits) por categoría;
+    - numéricas y fechas: posiciones de las filas válidas ordenadas por valor, para
+      resolver rangos con searchsorted.
+    """
+    s = _df[col]
+    n = len(s)
+    es_fecha = pd.api.types.is_datetime64_any_dtype(s)
+    es_num = pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+
+    if es_fecha or es_num:
+        validos = np.flatnonzero(s.notna().to_numpy())
+        if es_fecha:
+            valores = s.to_numpy(dtype="datetime64[ns]").astype(np.int64)[validos]
+        else:
+            valores = s.to_numpy(dtype="float64", na_value=np.nan)[validos]
+        orden = np.argsort(valores, kind="stable")
+        return {"tipo": "fecha" if es_fecha else "rango", "n": n, "posiciones": validos[orden], "ordenados": valores[orden]}
+
+    codigos, categorias = pd.factorize(s, sort=True)
+    codigos = codigos.astype(np.int32)
+    bitmaps = None
+    if len(categorias) <= MAX_CATEGORIAS_BITMAP:
+        bitmaps = np.stack([np.packbits(codigos == k) for k in range(len(categorias))]) if len(categorias) else None
+    return {"tipo": "cat", "n": n, "codigos": codigos, "categorias": categorias.tolist(), "bitmaps": bitmaps}
+
+
+def _bits_filtro(indice: dict, valor) -> np.ndarray:
+    """
+    Bitmap empaquetado de las filas que cumplen el filtro sobre una columna: en una
+    categórica, `valor` son posiciones en indice["categorias"]; en las demás, [desde, hasta].
+    """
+    n = indice["n"]
+    if indice["tipo"] == "cat":
+        categorias = indice["categorias"]
+        codigos_sel = [int(k) for k in valor if 0 <= int(k) < len(categorias)]
+        if indice["bitmaps"] is not None:
+            if not codigos_sel:
+                return np.zeros((n + 7) // 8, dtype=np.uint8)
+            return np.bitwise_or.reduce(indice["bitmaps"][codigos_sel], axis=0)
+        tabla = np.zeros(len(categorias) + 1, dtype=bool)  # la última posición es el nulo (-1)
+        tabla[codigos_sel] = True
+        return np.packbits(tabla[indice["codigos"]])
+
+    lo, hi = valor
+    if indice["tipo"] == "fecha":
+        lo, hi = pd.Timestamp(lo).value, pd.Timestamp(hi).value
+    ordenados = indice["ordenados"]
+    i0 = np.searchsorted(ordenados, lo, side="left")
+    i1 = np.searchsorted(ordenados, hi, side="right")
+    mascara = np.zeros(n, dtype=bool)
+    mascara[indice["posiciones"][i0:i1]] = True
+    return np.packbits(mascara)
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def aplicar_filtros_globales(_df: pd.DataFrame, version: str, filtros_json: str) -> pd.DataFrame:
+    """
+    Subconjunto de filas que cumple todos los filtros (AND entre columnas, OR dentro de
+    una categórica). Combina bitmaps empaquetados de los índices: 8 filas por byte.
+    Se comparte sin copiar entre reruns: tratarlo como solo lectura.
+    """
+    filtros = json.loads(filtros_json)
+    bits = None
+    for col, valor in filtros.items():
+        b = _bits_filtro(indice_columna(_df, version, col), valor)
+        bits = b if bits is None else bits & b
+    if bits is None:
+        return _df
+    filas = np.flatnonzero(np.unpackbits(bits, count=len(_df)))
+    return _df.iloc[filas].reset_index(drop=True)
+
+
+def panel_filtros_globales(df: pd.DataFrame, version: str, prefijo: str):
+    """
+    Filtros en la barra lateral que se aplican antes de todas las secciones.
+    Devuelve (df filtrado, versión que incluye los filtros, filtros aplicados): los filtros
+    son {columna: posiciones de las categorías elegidas en indice_columna} o
+    {columna: [desde, hasta]}, vacío si no hay. Se guardan posiciones y no valores porque
+    fechas, Decimal, etc. no vuelven iguales de JSON y no encontrarían su categoría.
+    """
+    st.sidebar.header("Filtros Globales")
+    filtro_cols = st.sidebar.multiselect("Filtrar por", df.columns.tolist(), key=f"{prefijo}_filtros_cols")
+    if not filtro_cols:
+        return df, version, {}
+
+    filtros = {}
+    for c in filtro_cols:
+        indice = indice_columna(df, version, c)
+        clave = f"{prefijo}_filtro_{c}"
+        if indice["tipo"] == "cat":
+            elegidos = st.sidebar.multiselect(c, indice["categorias"], key=clave)
+            if elegidos:
+                posicion = {v: k for k, v in enumerate(indice["categorias"])}
+                filtros[c] = sorted(posicion[v] for v in elegidos if v in posicion)
+            continue
+
+        ordenados = indice["ordenados"]
+        if len(ordenados) == 0 or ordenados[0] == ordenados[-1]:
+            st.sidebar.caption(f"{c}: sin rango para filtrar.")
+            continue
+        if indice["tipo"] == "fecha":
+            lo, hi = pd.Timestamp(ordenados[0]).to_pydatetime(), pd.Timestamp(ordenados[-1]).to_pydatetime()
+        elif pd.api.types.is_integer_dtype(df[c]):
+            lo, hi = int(ordenados[0]), int(ordenados[-1])
+        else:
+            lo, hi = float(ordenados[0]), float(ordenados[-1])
+        rango = st.sidebar.slider(c, lo, hi, (lo, hi), key=clave)
+        if rango != (lo, hi):
+            filtros[c] = [str(rango[0]), str(rango[1])] if indice["tipo"] == "fecha" else list(rango)
+
+    if not filtros:
+        return df, version, {}
+
+    filtros_json = json.dumps(filtros, sort_keys=True, ensure_ascii=False, default=str)
+    inicio = datetime.now()
+    df_filtrado = aplicar_filtros_globales(df, version, filtros_json)
+    ms = (datetime.now() - inicio).total_seconds() * 1000
+    st.sidebar.caption(
+        f"Filas tras filtros: {format_lat_number(len(df_filtrado), decimals=0)} de "
+        f"{format_lat_number(len(df), decimals=0)} ({format_lat_number(ms, decimals=1)} ms)"
+    )
+    return df_filtrado, version_dataset(version, "filtros", filtros_json), filtros
+
+
+# =========================
+# ESTADÍSTICA DESCRIPTIVA
+# =========================
+FILAS_POR_LOTE = 250_000  # filas por lote en el modo streaming
+
+
+def lotes_del_archivo(path: str, sheet_name=None, firma=None, columnas=None, filas_por_lote: int = FILAS_POR_LOTE):
+    """
+    Recorre el archivo por partes, sin cargarlo completo: row groups del Parquet (la copia
+    Parquet de la hoja, en Excel), lotes de un dataset Parquet en carpeta o trozos del CSV.
+    Los formatos sin lectura por partes se entregan en un solo lote. Genera DataFrames con
+    las `columnas` pedidas que existan (todas si es None), con los nombres normalizados
+    igual que en limpiar_df (make_unique_columns).
+    """
+    if os.path.isdir(path):
+        dataset = _dataset_parquet(path)
+        nombres = dataset.schema.names
+        limpios = dict(zip(nombres, make_unique_columns(nombres)))
+        cols = None if columnas is None else [c for c in nombres if limpios[c] in columnas]
+        for lote in dataset.to_batches(columns=cols, batch_size=filas_por_lote):
+            yield lote.to_pandas().rename(columns=limpios)
         return
 
-    d = df[sel].copy()
-    desc = d.describe(include=("all" if include_all else None))
+    ext = ext_archivo(path)
 
-    na = d.isna().sum().sort_values(ascending=False).to_frame("Cantidad de NA")
-    na["% de NA"] = (na["Cantidad de NA"] / len(d) * 100).round(2) if len(d) else 0.0
+    ruta_parquet = path if ext == ".parquet" else None
+    if ext in [".xlsx", ".xls", ".xlsb"] and PYARROW_AVAILABLE:
+        ruta_parquet = parquet_de_hoja(path, 0 if sheet_name is None else sheet_name, firma or firma_archivo(path))
+
+    if ruta_parquet and PYARROW_AVAILABLE:
+        import pyarrow.parquet as pq
+
+        archivo = pq.ParquetFile(ruta_parquet)
+        nombres = archivo.schema_arrow.names
+        tipos = _tipos_mixtos_de_esquema(archivo.schema_arrow)
+        limpios = dict(zip(nombres, make_unique_columns(nombres)))
+        cols = None if columnas is None else [c for c in nombres if limpios[c] in columnas]
+        inicio = 0
+        for lote in archivo.iter_batches(batch_size=filas_por_lote, columns=cols):
+            df = restaurar_tipos_mixtos(lote.to_pandas(), tipos, inicio)
+            inicio += len(df)
+            yield df.rename(columns=limpios)
+        return
+
+    if ext in [".csv", ".tsv", ".txt"]:
+        opciones = {".csv": {}, ".tsv": {"sep": "\t"}, ".txt": {"sep": None, "engine": "python"}}[ext]
+        with pd.read_csv(path, chunksize=filas_por_lote, **opciones) as lector:
+            for lote in lector:
+                lote.columns = make_unique_columns(lote.columns)
+                yield lote if columnas is None else lote[[c for c in lote.columns if c in columnas]]
+        return
+
+    df = leer_archivo(path, sheet_name, firma)
+    df.columns = make_unique_columns(df.columns)
+    yield df if columnas is None else df[[c for c in df.columns if c in columnas]]
+
+
+@st.cache_data(show_spinner=False, max_entries=8)
+def columnas_del_archivo(path: str, sheet_name, firma: str) -> list:
+    """Nombres de columna (normalizados) leyendo solo el primer lote de una fila."""
+    primero = next(lotes_del_archivo(path, sheet_name, firma, filas_por_lote=1), pd.DataFrame())
+    return primero.columns.tolist()
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def perfil_streaming(path: str, sheet_name, firma: str, columnas: tuple, drop_blank: bool, auto_numeric: bool, umbral: float):
+    """
+    Perfil en una pasada (ver estadistica_streaming), con la misma limpieza que
+    cargar_dataset_limpio aplicada lote a lote. `firma` invalida la caché si el archivo cambia.
+    """
+    # para descartar filas en blanco hay que ver todas las columnas, no solo las pedidas
+    lotes = lotes_del_archivo(path, sheet_name, firma, None if drop_blank else list(columnas))
+    return perfil_por_lotes(
+        lotes,
+        list(columnas),
+        quitar_en_blanco=drop_blank,
+        convertir=texto_a_numero if auto_numeric else None,
+        umbral=umbral,
+    )
+
+
+def _mostrar_perfil_streaming(fuente: dict, sel, include_all: bool):
+    with st.spinner("Recorriendo el archivo por lotes..."):
+        perfil = perfil_streaming(
+            fuente["path"], fuente["sheet"], fuente["firma"], tuple(sel),
+            fuente["drop_blank"], fuente["auto_numeric"], fuente["umbral"],
+        )
+
+    desc, na = perfil["resumen"], perfil["faltantes"]
+    if not include_all:
+        desc = desc.drop(columns=list(perfil["frecuentes"]), errors="ignore").dropna(how="all")
+
+    faltan = [c for c in sel if c not in perfil["faltantes"].index]
+    if faltan:
+        st.caption(f"Sin datos en el archivo (no se incluyen): {', '.join(faltan)}")
+    st.caption(
+        f"Una pasada sobre {format_lat_number(perfil['filas'], decimals=0)} filas, con la limpieza y la "
+        "conversión numérica de la barra lateral (sin el tipado manual). Media, desviación, mínimo, máximo "
+        "y faltantes son exactos; cuantiles, distintos y frecuencias son aproximados, con las cotas de la "
+        "tabla de abajo."
+    )
 
     st.subheader("Resumen Estadístico")
     st.dataframe(style_latino(desc, decimals=2), use_container_width=True, height=360)
 
+    if not perfil["cotas"].empty:
+        st.subheader("Cotas de Error")
+        cotas = perfil["cotas"]
+        if not include_all:
+            cotas = cotas[~cotas["variable"].isin(list(perfil["frecuentes"]))]
+        st.dataframe(style_latino(cotas, decimals=2), use_container_width=True, hide_index=True)
+
+    if include_all and perfil["frecuentes"]:
+        with st.expander("Valores más frecuentes", expanded=False):
+            for c, top in perfil["frecuentes"].items():
+                st.markdown(f"**{c}**")
+                st.dataframe(style_latino(top, decimals=0), use_container_width=True, hide_index=True)
+
     st.subheader("Análisis de Valores Faltantes")
     st.dataframe(style_latino(na, decimals=2), use_container_width=True, height=320)
+    return desc, na
 
+
+def _descargas_descriptivas(desc: pd.DataFrame, na: pd.DataFrame):
     col1, col2 = st.columns(2)
     with col1:
         st.download_button(
@@ -533,27 +1277,227 @@ def seccion_estadistica_descriptiva(df: pd.DataFrame):
         )
 
 
-# =========================
-# ILUSTRACIONES
-# =========================
-def seccion_ilustraciones(df: pd.DataFrame, scale_mode: str):
-    st.header("Ilustraciones y Visualizaciones")
-
-    if not PLOTLY_AVAILABLE:
-        st.warning("⚠️ Plotly no está instalado. Instala con: pip install plotly")
-        st.info("Se usará Matplotlib como alternativa.")
-
-    cols_num = columnas_numericas(df)
-    cols_cat = columnas_no_numericas(df)
+def seccion_perfil_por_lotes(fuente: dict):
+    """
+    Estadística descriptiva sin cargar el dataset: recorre el archivo por lotes con memoria
+    acotada. `fuente`: {"path", "sheet", "firma", "drop_blank", "auto_numeric", "umbral"}.
+    """
+    st.subheader("Estadística Descriptiva por Lotes")
 
-    if df.empty:
-        st.info("Dataset vacío.")
+    cols = columnas_del_archivo(fuente["path"], fuente["sheet"], fuente["firma"])
+    if not cols:
+        st.info("El dataset no tiene columnas.")
         return
 
-    tipo_grafico = st.selectbox(
-        "Selecciona el tipo de gráfico",
-        [
-            "Gráfico de Barras",
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        sel = st.multiselect(
+            "Variables a incluir en el análisis",
+            cols,
+            default=cols[: min(12, len(cols))],
+            help="Puedes mezclar variables numéricas y categóricas."
+        )
+    with c2:
+        include_all = st.toggle("Incluir variables categóricas", value=True, key="lotes_cat")
+
+    if not sel:
+        st.warning("⚠️ Selecciona al menos una variable.")
+        return
+
+    desc, na = _mostrar_perfil_streaming(fuente, sel, include_all)
+    _descargas_descriptivas(desc, na)
+
+
+def seccion_estadistica_descriptiva(df: pd.DataFrame):
+    st.header("Estadística Descriptiva")
+
+    cols = df.columns.tolist()
+    if not cols:
+        st.info("El dataset no tiene columnas.")
+        return
+
+    c1, c2 = st.columns([3, 1])
+    with c1:
+        sel = st.multiselect(
+            "Variables a incluir en el análisis",
+            cols,
+            default=cols[: min(12, len(cols))],
+            help="Puedes mezclar variables numéricas y categóricas."
+        )
+    with c2:
+        include_all = st.toggle("Incluir variables categóricas", value=True)
+
+    if not sel:
+        st.warning("⚠️ Selecciona al menos una variable.")
+        return
+
+    d = df[sel].copy()
+    desc = d.describe(include=("all" if include_all else None))
+
+    na = d.isna().sum().sort_values(ascending=False).to_frame("Cantidad de NA")
+    na["% de NA"] = (na["Cantidad de NA"] / len(d) * 100).round(2) if len(d) else 0.0
+
+    st.subheader("Resumen Estadístico")
+    st.dataframe(style_latino(desc, decimals=2), use_container_width=True, height=360)
+
+    st.subheader("Análisis de Valores Faltantes")
+    st.dataframe(style_latino(na, decimals=2), use_container_width=True, height=320)
+
+    _descargas_descriptivas(desc, na)
+
+
+# =========================
+# CACHÉ DE FIGURAS (ESPECIFICACIÓN CANÓNICA)
+# =========================
+def clave_figura(spec: dict) -> str:
+    """Serialización canónica de la especificación de un gráfico (claves ordenadas, valores como texto)."""
+    return json.dumps(spec, sort_keys=True, ensure_ascii=False, default=str)
+
+
+MAX_BYTES_FIGURA_CACHE = 2 * 2**20  # JSON más grande no se guarda: se reconstruye en cada rerun
+
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def _figura_json_cacheada(clave: str, _construir):
+    """
+    JSON de la figura, o (None, notas) si pasa de MAX_BYTES_FIGURA_CACHE: st.cache_data no
+    acota bytes, así que con 64 entradas el peor caso queda en ~128 MB y las figuras
+    pesadas (p. ej. decenas de miles de puntos SVG) no desplazan al resto.
+    """
+    fig, notas = _construir()
+    fig_json = fig.to_json()
+    return (fig_json if len(fig_json) <= MAX_BYTES_FIGURA_CACHE else None), notas
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def filas_completas(_df: pd.DataFrame, version: str, columnas: tuple) -> int:
+    """Filas sin nulos en ninguna de `columnas`; una vez por versión del dataset."""
+    return int(_df[list(columnas)].notna().all(axis=1).sum())
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def rangos_completos(_df: pd.DataFrame, version: str, x_col: str, y_cols: tuple):
+    """(rango de x, rango conjunto de las y) sobre filas completas, sin escalar; una vez por versión."""
+    data = _df[[x_col, *y_cols]].dropna()
+    return _rango_columnas(data, [x_col]), _rango_columnas(data, list(y_cols))
+
+
+def mostrar_figura_plotly(spec: dict, construir):
+    """
+    Dibuja el gráfico descrito por `spec`. `construir()` devuelve (fig, notas) y solo se
+    ejecuta si la especificación no está en caché; el JSON de la figura se comparte entre
+    reruns y sesiones. `spec` debe incluir todo lo que cambia la figura (tipo de gráfico,
+    columnas, filtros, escala y versión del dataset).
+    """
+    construida = {}
+
+    def _construir():
+        construida["fig"], construida["notas"] = construir()
+        return construida["fig"], construida["notas"]
+
+    fig_json, notas = _figura_json_cacheada(clave_figura(spec), _construir)
+    if fig_json is None:
+        # demasiado grande para la caché: se usa la recién construida o se vuelve a construir
+        fig, notas = (construida["fig"], construida["notas"]) if construida else construir()
+    else:
+        # el JSON ya salió de una figura validada: reconstruirla sin volver a validar
+        fig = go.Figure(json.loads(fig_json), _validate=False)
+    st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+    for nota in notas:
+        st.caption(nota)
+
+
+MAX_FIGURAS_VIVAS = 10  # figuras de pyplot abiertas a la vez antes de avisar de una fuga
+
+
+def contar_figuras_vivas() -> int:
+    """Figuras de Matplotlib registradas en pyplot (abiertas) en este proceso."""
+    return len(plt.get_fignums())
+
+
+# El estado de pyplot (figura actual, registro de figuras) es global al proceso y lo
+# comparten los hilos de todas las sesiones: construir, rasterizar y cerrar van en serie.
+_PYPLOT_LOCK = threading.Lock()
+
+
+def _rasterizar_figura(construir, formato: str):
+    """
+    Ejecuta `construir()` y rasteriza la figura con los mismos parámetros que st.pyplot.
+    Bajo _PYPLOT_LOCK, las figuras que se abrieron en el intento son todas de este
+    `construir` (también las de plt.xticks/plt.tight_layout sobre la figura actual) y se
+    cierran siempre, también si algo falló. Devuelve (bytes, notas).
+    """
+    with _PYPLOT_LOCK:
+        abiertas = set(plt.get_fignums())
+        fig = None
+        try:
+            fig, notas = construir()
+            buf = BytesIO()
+            fig.savefig(buf, format=formato, dpi=200, bbox_inches="tight")
+        finally:
+            if fig is not None:
+                plt.close(fig)
+            for num in set(plt.get_fignums()) - abiertas:
+                plt.close(num)
+    return buf.getvalue(), notas
+
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def _figura_matplotlib_cacheada(clave: str, formato: str, _construir):
+    """
+    Bytes de la figura rasterizada, o (None, notas) si pasan de MAX_BYTES_FIGURA_CACHE,
+    con los mismos topes que _figura_json_cacheada: un PNG a 200 dpi pesa cientos de KB.
+    """
+    datos, notas = _construir()
+    return (datos if len(datos) <= MAX_BYTES_FIGURA_CACHE else None), notas
+
+
+def mostrar_figura_matplotlib(spec: dict, construir, formato: str = "png"):
+    """
+    Equivalente de `mostrar_figura_plotly` para los gráficos de Matplotlib: `construir()`
+    devuelve (fig, notas), la figura se rasteriza a PNG (o SVG) y se cierra en el acto, y
+    los bytes quedan en caché por especificación, así un rerun no crea figuras nuevas.
+    """
+    rasterizada = {}
+
+    def _construir():
+        rasterizada["datos"], rasterizada["notas"] = _rasterizar_figura(construir, formato)
+        return rasterizada["datos"], rasterizada["notas"]
+
+    datos, notas = _figura_matplotlib_cacheada(clave_figura(spec), formato, _construir)
+    if datos is None:
+        # demasiado grande para la caché: se usa la recién rasterizada o se vuelve a rasterizar
+        datos, notas = (rasterizada["datos"], rasterizada["notas"]) if rasterizada else _rasterizar_figura(construir, formato)
+    st.image(datos.decode("utf-8") if formato == "svg" else datos, use_container_width=True)
+    for nota in notas:
+        st.caption(nota)
+
+    vivas = contar_figuras_vivas()
+    if vivas > MAX_FIGURAS_VIVAS:
+        logger.warning("Hay %d figuras de Matplotlib abiertas: posible fuga de memoria.", vivas)
+
+
+# =========================
+# ILUSTRACIONES
+# =========================
+def seccion_ilustraciones(df: pd.DataFrame, scale_mode: str, version: str):
+    st.header("Ilustraciones y Visualizaciones")
+
+    if not PLOTLY_AVAILABLE:
+        st.warning("⚠️ Plotly no está instalado. Instala con: pip install plotly")
+        st.info("Se usará Matplotlib como alternativa.")
+
+    cols_num = columnas_numericas(df)
+    cols_cat = columnas_no_numericas(df)
+
+    if df.empty:
+        st.info("Dataset vacío.")
+        return
+
+    tipo_grafico = st.selectbox(
+        "Selecciona el tipo de gráfico",
+        [
+            "Gráfico de Barras",
             "Gráfico de Líneas",
             "Gráfico de Pastel (Pie)",
             "Gráfico de Dispersión",
@@ -567,21 +1511,30 @@ def seccion_ilustraciones(df: pd.DataFrame, scale_mode: str):
     st.divider()
 
     if tipo_grafico == "Gráfico de Barras":
-        render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode)
+        render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode, version)
     elif tipo_grafico == "Gráfico de Líneas":
-        render_line_chart_mejorado(df, cols_num, cols_cat, scale_mode)
+        render_line_chart_mejorado(df, cols_num, cols_cat, scale_mode, version)
     elif tipo_grafico == "Gráfico de Pastel (Pie)":
-        render_pie_chart_mejorado(df, cols_cat)
+        render_pie_chart_mejorado(df, cols_cat, version)
     elif tipo_grafico == "Gráfico de Dispersión":
-        render_scatter_chart_plotly(df, cols_num, scale_mode)
+        render_scatter_chart_plotly(df, cols_num, scale_mode, version)
     elif tipo_grafico == "Gráfico de Dispersión (Múltiples Variables)":
-        render_scatter_multiple(df, cols_num, scale_mode)
+        render_scatter_multiple(df, cols_num, scale_mode, version)
     elif tipo_grafico == "Gráfico de Área":
-        render_area_chart_mejorado(df, cols_num, cols_cat, scale_mode)
+        render_area_chart_mejorado(df, cols_num, cols_cat, scale_mode, version)
     elif tipo_grafico == "Histograma":
-        render_histogram_plotly(df, cols_num, scale_mode)
+        render_histogram_plotly(df, cols_num, scale_mode, version)
     elif tipo_grafico == "Box Plot":
-        render_boxplot_plotly(df, cols_num, cols_cat, scale_mode)
+        render_boxplot_plotly(df, cols_num, cols_cat, scale_mode, version)
+
+
+def _rangos_escalados(df, version: str, x_col: str, y_cols, scale_mode: str):
+    """Rangos de `rangos_completos` con las y en las unidades del gráfico (divididas por el factor de escala)."""
+    rango_x, rango_y = rangos_completos(df, version, x_col, tuple(y_cols))
+    factor, _ = _scale_info_for_ycols(df, y_cols, scale_mode)
+    if rango_y is not None:
+        rango_y = (rango_y[0] / factor, rango_y[1] / factor)
+    return rango_x, rango_y
 
 
 def _scale_info_for_ycols(df, y_cols, scale_mode: str):
@@ -595,7 +1548,143 @@ def _scale_info_for_ycols(df, y_cols, scale_mode: str):
     return factor, label
 
 
-def render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
+# =========================
+# AGREGACIÓN AGRUPADA (MOTOR COMÚN)
+# =========================
+MEDIDAS_AGREGACION = {
+    "Promedio": "mean",
+    "Suma": "sum",
+    "Mediana": "median",
+    "Conteo": "count",
+    "Mínimo": "min",
+    "Máximo": "max",
+    "Percentil": "p",
+}
+
+
+def _cuantil_medida(medida: str):
+    """'median' -> 0.5, 'p90' -> 0.9; None si la medida no es un cuantil."""
+    if medida == "median":
+        return 0.5
+    if medida.startswith("p") and medida[1:].isdigit():
+        return int(medida[1:]) / 100.0
+    return None
+
+
+def _codigos_grupo(df: pd.DataFrame, claves):
+    """Códigos enteros por fila (-1 si alguna clave es nula) y etiquetas en orden de aparición."""
+    if len(claves) == 1:
+        codigos, etiquetas = pd.factorize(df[claves[0]], sort=False)
+        return codigos.astype(np.int64), pd.Index(etiquetas, name=claves[0])
+    g = df.groupby(list(claves), sort=False, dropna=True)
+    codigos = g.ngroup().fillna(-1).to_numpy(dtype=np.int64)
+    return codigos, g.size().index
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def agregar_por_grupos(_df: pd.DataFrame, version: str, claves: tuple, valores: tuple, medidas: tuple) -> pd.DataFrame:
+    """
+    Calcula todas las `medidas` de cada columna de `valores` agrupando por `claves`, sobre
+    códigos enteros de grupo. Suma, conteo y promedio salen de bincount y mínimo y máximo de
+    fmin/fmax.at, sin ordenar. Solo si se piden medianas o percentiles se ordena, una vez por
+    columna (valores con argsort y luego por código de grupo con un sort estable, radix para
+    enteros cortos), y se leen por posición dentro de cada grupo.
+
+    Los nulos se descartan por columna: una fila con nulo en una variable sigue contando en
+    las demás (como groupby de pandas y el cubo), no se elimina la fila completa.
+    Devuelve un DataFrame con índice = grupos y columnas MultiIndex (valor, medida).
+    """
+    codigos, etiquetas = _codigos_grupo(_df, claves)
+    n_grupos = len(etiquetas)
+    tipo_codigo = np.int16 if n_grupos <= np.iinfo(np.int16).max else np.int64
+    hay_cuantiles = any(_cuantil_medida(m) is not None for m in medidas)
+    salida = {}
+
+    for col in valores:
+        v = _df[col].to_numpy(dtype="float64", na_value=np.nan)
+        ok = (codigos >= 0) & ~np.isnan(v)
+        c, v = codigos[ok], v[ok]
+
+        conteo = np.bincount(c, minlength=n_grupos)
+        hay = conteo > 0
+
+        if hay_cuantiles:
+            orden = np.argsort(v)
+            orden = orden[np.argsort(c[orden].astype(tipo_codigo), kind="stable")]
+            v_ordenado = v[orden]
+            inicio = np.concatenate(([0], np.cumsum(conteo)[:-1]))
+
+            def _en_posicion(pos):
+                r = np.full(n_grupos, np.nan)
+                r[hay] = v_ordenado[pos[hay]]
+                return r
+
+        for medida in medidas:
+            if medida == "count":
+                r = conteo.astype("float64")
+            elif medida == "sum":
+                r = np.bincount(c, weights=v, minlength=n_grupos)
+            elif medida == "mean":
+                r = np.divide(np.bincount(c, weights=v, minlength=n_grupos), conteo,
+                              out=np.full(n_grupos, np.nan), where=hay)
+            elif medida in ("min", "max"):
+                r = np.full(n_grupos, np.inf if medida == "min" else -np.inf)
+                (np.fmin if medida == "min" else np.fmax).at(r, c, v)
+                r[~hay] = np.nan
+            else:
+                q = _cuantil_medida(medida)
+                if q is None:
+                    raise ValueError(f"Medida de agregación desconocida: {medida}")
+                # interpolación lineal, igual que pandas/numpy por defecto
+                pos = q * np.maximum(conteo - 1, 0)
+                bajo = np.floor(pos).astype(np.int64)
+                alto = np.ceil(pos).astype(np.int64)
+                r = _en_posicion(inicio + bajo)
+                r_alto = _en_posicion(inicio + alto)
+                r = r + (r_alto - r) * (pos - bajo)
+            salida[(col, medida)] = r
+
+    res = pd.DataFrame(salida, index=etiquetas)
+    res.columns = pd.MultiIndex.from_tuples(res.columns, names=["valor", "medida"])
+    return res
+
+
+def tabla_agregada(df: pd.DataFrame, version: str, clave: str, valores, medida: str) -> pd.DataFrame:
+    """
+    Una sola medida por columna, en formato plano [clave] + valores (para los gráficos).
+    Los nulos se descartan por columna, no por fila (ver agregar_por_grupos).
+    Si `df` es el dataset activo (ver cubo_para_consultas), la clave es una dimensión del cubo
+    y la medida es aditiva o un extremo, se responde desde el cubo; las medianas y
+    percentiles necesitan las filas y van al motor común. Nunca construye un cubo.
+    """
+    if medida in ("sum", "count", "mean", "min", "max"):
+        cubo, filtros = cubo_para_consultas(version)
+        if cubo is not None and clave in cubo["dims"] and set(valores) <= set(cubo["valores"]):
+            res = rollup_cubo(cubo, (clave,), tuple(valores), medida, filtros, omitir_nulos=True)
+            return res.rename_axis(clave).reset_index()
+    res = agregar_por_grupos(df, version, (clave,), tuple(valores), (medida,))
+    return res.xs(medida, axis=1, level="medida").rename_axis(columns=None).reset_index()
+
+
+def _control_agregacion(key: str):
+    """Selector de medida. Devuelve (medida interna, etiqueta para títulos)."""
+    etiqueta = st.selectbox("Agregación", list(MEDIDAS_AGREGACION), key=f"{key}_agregacion")
+    medida = MEDIDAS_AGREGACION[etiqueta]
+    if medida == "p":
+        pct = st.slider("Percentil", 1, 99, 90, key=f"{key}_percentil")
+        return f"p{pct}", f"Percentil {pct}"
+    return medida, etiqueta
+
+
+def _escala_agregado(tabla: pd.DataFrame, cols, medida: str, scale_mode: str):
+    """Factor y unidad según los valores agregados (una suma puede cambiar de escala); los conteos no se escalan."""
+    if medida == "count":
+        return 1.0, "conteos"
+    mx = np.nanmax(np.abs(tabla[cols].to_numpy(dtype="float64")), initial=0.0)
+    return get_scale_factor_and_label(scale_mode, mx)
+
+
+def render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode: str, version: str):
     if not cols_cat and not cols_num:
         st.warning("No hay columnas disponibles para graficar.")
         return
@@ -614,7 +1703,7 @@ def render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
         st.info("Selecciona al menos una variable numérica.")
         return
 
-    factor, unit_label = _scale_info_for_ycols(df, num_cols, scale_mode)
+    medida, etiqueta_medida = _control_agregacion(key="bar")
 
     st.subheader("Filtro de Categorías")
     categorias_unicas = sorted(df[cat_col].dropna().unique().tolist())
@@ -642,50 +1731,234 @@ def render_bar_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
         st.warning("Selecciona al menos una categoría.")
         return
 
-    data = df[df[cat_col].isin(categorias_seleccionadas)][[cat_col] + num_cols].dropna()
-    cat_order = data[cat_col].drop_duplicates().tolist()
+    def preparar():
+        grouped = tabla_agregada(df, version, cat_col, num_cols, medida)
+        grouped = grouped[grouped[cat_col].isin(categorias_seleccionadas)]
+        factor, unit_label = _escala_agregado(grouped, num_cols, medida, scale_mode)
+        return grouped, factor, unit_label
+
+    titulo = f"{etiqueta_medida} de {', '.join(num_cols)} por {cat_col}"
+    spec = {
+        "grafico": "barras", "version": version, "escala": scale_mode,
+        "x": cat_col, "y": num_cols, "medida": medida, "categorias": categorias_seleccionadas,
+    }
 
     if PLOTLY_AVAILABLE:
-        fig = go.Figure()
-        for num_col in num_cols:
-            grouped = data.groupby(cat_col, sort=False)[num_col].mean().reindex(cat_order)
-            y_scaled = scale_values(grouped.values, factor)
-            fig.add_trace(go.Bar(x=grouped.index, y=y_scaled, name=num_col))
-
-        fig.update_layout(
-            xaxis_title=cat_col,
-            yaxis_title=f"Valores (en {unit_label})",
-            barmode="group",
-            height=500
-        )
-        fig = set_title_with_unit_plotly(fig, f"Comparación de {', '.join(num_cols)} por {cat_col}", unit_label)
-        fig = apply_plotly_latino_format(fig, decimals=0)
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        def construir():
+            grouped, factor, unit_label = preparar()
+            cat_order = grouped[cat_col].tolist()
+            fig = go.Figure()
+            for num_col in num_cols:
+                y_scaled = scale_values(grouped[num_col].values, factor)
+                fig.add_trace(go.Bar(x=cat_order, y=y_scaled, name=num_col))
+            y_range = _rango_columnas(grouped, num_cols, factor)
+            if y_range is not None:
+                # las barras parten de 0: el eje debe incluirlo
+                y_range = (min(y_range[0], 0.0), max(y_range[1], 0.0))
+
+            fig.update_layout(
+                xaxis_title=cat_col,
+                yaxis_title=f"Valores (en {unit_label})",
+                barmode="group",
+                height=500
+            )
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
+            return apply_plotly_latino_format(fig, decimals=0, y_range=y_range), []
+
+        mostrar_figura_plotly(spec, construir)
 
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        x = np.arange(len(cat_order))
-        width = 0.8 / len(num_cols)
-
-        for i, num_col in enumerate(num_cols):
-            grouped = data.groupby(cat_col, sort=False)[num_col].mean().reindex(cat_order)
-            y_scaled = scale_values(grouped.values, factor)
-            ax.bar(x + i * width, y_scaled, width, label=num_col)
-
-        ax.set_xlabel(cat_col)
-        ax.set_ylabel(f"Valores (en {unit_label})")
-        set_title_with_unit_matplotlib(ax, f"Comparación por {cat_col}", unit_label)
-
-        ax.set_xticks(x + width * (len(num_cols) - 1) / 2)
-        ax.set_xticklabels(cat_order, rotation=45, ha="right")
-        ax.legend()
-        ax.grid(True, alpha=0.3)
+        def construir():
+            grouped, factor, unit_label = preparar()
+            cat_order = grouped[cat_col].tolist()
+            fig, ax = plt.subplots(figsize=(12, 6))
+            x = np.arange(len(cat_order))
+            width = 0.8 / len(num_cols)
+
+            for i, num_col in enumerate(num_cols):
+                y_scaled = scale_values(grouped[num_col].values, factor)
+                ax.bar(x + i * width, y_scaled, width, label=num_col)
+
+            ax.set_xlabel(cat_col)
+            ax.set_ylabel(f"Valores (en {unit_label})")
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+
+            ax.set_xticks(x + width * (len(num_cols) - 1) / 2)
+            ax.set_xticklabels(cat_order, rotation=45, ha="right")
+            ax.legend()
+            ax.grid(True, alpha=0.3)
 
-        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
+
+
+# =========================
+# DECIMACIÓN DE SERIES LARGAS (LTTB / MÍN-MÁX)
+# =========================
+UMBRAL_DECIMACION = 5_000  # filas: bajo esto se dibuja la serie completa
+
+
+def _indices_lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Largest-Triangle-Three-Buckets: elige n_out puntos que preservan la forma visual
+    (picos incluidos). x debe venir ordenado. Un ciclo por bucket, vectorizado dentro.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    bordes = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    idx = np.empty(n_out, dtype=np.int64)
+    idx[0], idx[-1] = 0, n - 1
+
+    a = 0
+    for i in range(n_out - 2):
+        ini, fin = bordes[i], bordes[i + 1]
+        sig_fin = bordes[i + 2] if i + 2 < len(bordes) else n
+        avg_x = x[fin:sig_fin].mean()
+        avg_y = y[fin:sig_fin].mean()
+
+        xb, yb = x[ini:fin], y[ini:fin]
+        areas = np.abs((x[a] - avg_x) * (yb - y[a]) - (x[a] - xb) * (avg_y - y[a]))
+        a = ini + int(np.argmax(areas))
+        idx[i + 1] = a
+    return idx
+
+
+def _indices_minmax(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Mínimo y máximo de cada bucket (≈ 2 puntos por píxel), sin ciclos de Python."""
+    n = len(y)
+    n_buckets = max(1, n_out // 2)
+    if n <= n_out:
+        return np.arange(n)
+
+    inicios = np.unique(np.linspace(0, n, n_buckets + 1).astype(np.int64)[:-1])
+    tam = np.diff(np.append(inicios, n))
+    bucket = np.repeat(np.arange(len(inicios)), tam)
+
+    extremos = [inicios, inicios + tam - 1]
+    for red in (np.minimum, np.maximum):
+        valor = red.reduceat(y, inicios)
+        es_extremo = y == np.repeat(valor, tam)
+        _, primera = np.unique(bucket[es_extremo], return_index=True)
+        extremos.append(np.flatnonzero(es_extremo)[primera])
+    return np.unique(np.concatenate(extremos))
+
+
+def decimar_indices(x: np.ndarray, ys, n_out: int, metodo: str) -> np.ndarray:
+    """
+    Índices (ordenados) a conservar para dibujar varias series que comparten x.
+    Se une la selección de cada serie, así todas conservan sus picos y el mismo eje x.
+    """
+    sel = []
+    for y in ys:
+        if metodo == "LTTB":
+            sel.append(_indices_lttb(x, y, n_out))
+        else:
+            sel.append(_indices_minmax(y, n_out))
+    return np.unique(np.concatenate(sel)) if sel else np.arange(len(x))
+
+
+def _x_numerico(s: pd.Series) -> np.ndarray:
+    if pd.api.types.is_datetime64_any_dtype(s):
+        return s.to_numpy(dtype="datetime64[ns]").astype(np.int64).astype("float64")
+    return s.to_numpy(dtype="float64")
+
+
+def _controles_decimacion(df: pd.DataFrame, x_col: str, key: str):
+    """
+    Para series largas con eje x numérico o de fechas: controles de zoom por rango y de
+    decimación en el servidor. Devuelve los parámetros elegidos (None si la serie es corta),
+    que luego aplica `decimar_serie` y que forman parte de la especificación del gráfico.
+    """
+    n = len(df)
+    if n <= UMBRAL_DECIMACION:
+        return None
+
+    c1, c2 = st.columns(2)
+    with c1:
+        metodo = st.selectbox(
+            "Reducción de puntos",
+            ["LTTB", "Mín/Máx por bucket", "Sin reducción"],
+            key=f"{key}_metodo_decim",
+            help="LTTB conserva la forma de la curva; Mín/Máx conserva exactamente los picos de cada tramo.",
+        )
+    with c2:
+        ancho = st.slider(
+            "Resolución (puntos por serie ≈ ancho en píxeles)",
+            300, 4000, 1500, 100,
+            key=f"{key}_ancho_decim",
+            disabled=metodo == "Sin reducción",
+        )
+
+    rango = None
+    x_min, x_max = df[x_col].min(), df[x_col].max()
+    if pd.notna(x_min) and pd.notna(x_max):
+        if pd.api.types.is_datetime64_any_dtype(df[x_col]):
+            x_min, x_max = x_min.to_pydatetime(), x_max.to_pydatetime()
+        else:
+            x_min, x_max = float(x_min), float(x_max)
+        if x_min < x_max:
+            rango = st.slider("Rango del eje X (zoom)", x_min, x_max, (x_min, x_max), key=f"{key}_zoom")
 
+    return {"metodo": metodo, "ancho": ancho, "rango": rango}
 
-def render_line_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
+
+def decimar_serie(data: pd.DataFrame, x_col: str, y_cols, params):
+    """
+    Aplica los parámetros de `_controles_decimacion`: ordena por x, recorta al rango y,
+    si hace falta, decima. Al acotar el rango se vuelve a decimar, con más detalle, solo
+    ese tramo. Devuelve (DataFrame a dibujar, notas para mostrar bajo el gráfico).
+    """
+    if params is None:
+        return data, []
+
+    n = len(data)
+    data = data.sort_values(x_col, kind="stable")
+    if params["rango"] is not None:
+        lo, hi = params["rango"]
+        data = data[(data[x_col] >= lo) & (data[x_col] <= hi)]
+
+    metodo, ancho = params["metodo"], params["ancho"]
+    if metodo == "Sin reducción" or len(data) <= ancho:
+        return data, []
+
+    idx = decimar_indices(
+        _x_numerico(data[x_col]),
+        [data[c].to_numpy(dtype="float64") for c in y_cols],
+        ancho,
+        metodo,
+    )
+    nota = (
+        f"Serie reducida con {metodo}: {format_lat_number(len(idx), decimals=0)} de "
+        f"{format_lat_number(len(data), decimals=0)} puntos en el rango "
+        f"({format_lat_number(n, decimals=0)} en total)."
+    )
+    return data.iloc[idx], [nota]
+
+
+def _controles_serie(df: pd.DataFrame, x_col: str, key: str) -> dict:
+    """Controles de líneas/área: agregación si el eje X es categórico, decimación si es numérico o de fechas."""
+    if not (pd.api.types.is_numeric_dtype(df[x_col]) or pd.api.types.is_datetime64_any_dtype(df[x_col])):
+        medida, etiqueta_medida = _control_agregacion(key=key)
+        return {"medida": medida, "etiqueta_medida": etiqueta_medida, "decimacion": None}
+    return {"medida": None, "etiqueta_medida": None, "decimacion": _controles_decimacion(df, x_col, key=key)}
+
+
+def _datos_serie(df: pd.DataFrame, version: str, x_col: str, y_cols, scale_mode: str, ctrl: dict):
+    """Aplica los controles de `_controles_serie`. Devuelve (data, factor, unidad, notas)."""
+    if ctrl["medida"] is not None:
+        data = tabla_agregada(df, version, x_col, y_cols, ctrl["medida"])
+        factor, unit_label = _escala_agregado(data, y_cols, ctrl["medida"], scale_mode)
+        return data, factor, unit_label, []
+    factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
+    data, notas = decimar_serie(df[[x_col] + y_cols].dropna(), x_col, y_cols, ctrl["decimacion"])
+    return data, factor, unit_label, notas
+
+
+def render_line_chart_mejorado(df, cols_num, cols_cat, scale_mode: str, version: str):
     if not cols_num:
         st.warning("No hay columnas numéricas disponibles.")
         return
@@ -704,46 +1977,59 @@ def render_line_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
         st.info("Selecciona al menos una variable para el eje Y.")
         return
 
-    factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
-
-    data = df[[x_col] + y_cols].dropna()
-    if not (pd.api.types.is_numeric_dtype(data[x_col]) or pd.api.types.is_datetime64_any_dtype(data[x_col])):
-        data = data.groupby(x_col, sort=False)[y_cols].mean().reset_index()
+    ctrl = _controles_serie(df, x_col, key="line")
+    titulo = f"Tendencia de {', '.join(y_cols)}"
+    if ctrl["medida"] is not None:
+        titulo = f"{ctrl['etiqueta_medida']} de {', '.join(y_cols)} por {x_col}"
+    spec = {"grafico": "lineas", "version": version, "escala": scale_mode, "x": x_col, "y": y_cols, **ctrl}
 
     if PLOTLY_AVAILABLE:
-        data_plot = data.copy()
-        for y in y_cols:
-            data_plot[y] = scale_values(data_plot[y].values, factor)
+        def construir():
+            data, factor, unit_label, notas = _datos_serie(df, version, x_col, y_cols, scale_mode, ctrl)
+            data_plot = data.copy()
+            for y in y_cols:
+                data_plot[y] = scale_values(data_plot[y].values, factor)
+
+            fig = px.line(data_plot, x=x_col, y=y_cols, markers=len(data_plot) <= 500)
+            fig.update_layout(height=500, yaxis_title=f"Valores (en {unit_label})")
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
+            fig = apply_plotly_latino_format(
+                fig,
+                decimals=0,
+                y_range=_rango_columnas(data_plot, y_cols),
+                x_range=_rango_columnas(data_plot, [x_col]) if pd.api.types.is_numeric_dtype(data_plot[x_col]) else None,
+            )
+            return fig, notas
 
-        fig = px.line(data_plot, x=x_col, y=y_cols, markers=True)
-        fig.update_layout(height=500, yaxis_title=f"Valores (en {unit_label})")
-        fig = set_title_with_unit_plotly(fig, f"Tendencia de {', '.join(y_cols)}", unit_label)
-        fig = apply_plotly_latino_format(fig, decimals=0)
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        mostrar_figura_plotly(spec, construir)
 
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for y_col in y_cols:
-            ax.plot(
-                data[x_col],
-                scale_values(data[y_col].values, factor),
-                marker="o",
-                label=y_col,
-                linewidth=2
-            )
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
-        set_title_with_unit_matplotlib(ax, f"Tendencia de {', '.join(y_cols)}", unit_label)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=30, ha="right")
-        plt.tight_layout()
+        def construir():
+            data, factor, unit_label, notas = _datos_serie(df, version, x_col, y_cols, scale_mode, ctrl)
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for y_col in y_cols:
+                ax.plot(
+                    data[x_col],
+                    scale_values(data[y_col].values, factor),
+                    marker="o" if len(data) <= 500 else None,
+                    label=y_col,
+                    linewidth=2
+                )
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            plt.setp(ax.get_xticklabels(), rotation=30, ha="right")
+            fig.tight_layout()
 
-        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, notas
+
+        mostrar_figura_matplotlib(spec, construir)
 
 
-def render_pie_chart_mejorado(df, cols_cat):
+def render_pie_chart_mejorado(df, cols_cat, version: str):
     if not cols_cat:
         st.warning("No hay columnas categóricas disponibles.")
         return
@@ -776,22 +2062,173 @@ def render_pie_chart_mejorado(df, cols_cat):
         st.warning("Selecciona al menos una categoría.")
         return
 
-    vc = df[df[cat_col].isin(categorias_seleccionadas)][cat_col].value_counts()
+    def conteos():
+        return df[df[cat_col].isin(categorias_seleccionadas)][cat_col].value_counts()
 
+    spec = {"grafico": "pastel", "version": version, "x": cat_col, "categorias": categorias_seleccionadas}
     if PLOTLY_AVAILABLE:
-        fig = px.pie(values=vc.values, names=vc.index)
-        fig.update_layout(height=500)
-        fig.update_layout(separators=".,")
-        fig = set_title_with_unit_plotly(fig, f"Distribución de {cat_col}", "conteos")
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        def construir():
+            vc = conteos()
+            fig = px.pie(values=vc.values, names=vc.index)
+            fig.update_layout(height=500)
+            fig.update_layout(separators=".,")
+            return set_title_with_unit_plotly(fig, f"Distribución de {cat_col}", "conteos"), []
+
+        mostrar_figura_plotly(spec, construir)
     else:
-        fig, ax = plt.subplots(figsize=(10, 10))
-        ax.pie(vc.values, labels=vc.index, autopct="%1.1f%%", startangle=90)
-        ax.set_title(f"Distribución de {cat_col}", fontsize=14)
-        st.pyplot(fig)
+        def construir():
+            vc = conteos()
+            fig, ax = plt.subplots(figsize=(10, 10))
+            ax.pie(vc.values, labels=vc.index, autopct="%1.1f%%", startangle=90)
+            ax.set_title(f"Distribución de {cat_col}", fontsize=14)
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
+
+
+# =========================
+# DISPERSIÓN A GRAN ESCALA (WebGL / DENSIDAD)
+# =========================
+UMBRAL_WEBGL = 50_000         # sobre esto: Scattergl en vez de SVG
+UMBRAL_DENSIDAD = 1_000_000   # sobre esto: grilla de densidad calculada en el servidor
+
+
+def _slider_rango(etiqueta: str, rango, key: str):
+    """Slider (desde, hasta) sobre `rango`; la clave incluye los límites para no arrastrar un valor viejo."""
+    if rango is None or not rango[0] < rango[1]:
+        return rango
+    lo, hi = float(rango[0]), float(rango[1])
+    return st.slider(etiqueta, lo, hi, (lo, hi), step=(hi - lo) / 1000, key=f"{key}_{lo:.6g}_{hi:.6g}")
+
+
+def _controles_dispersion(n_total: int, key: str, rangos=None):
+    """
+    Decide cómo dibujar n_total puntos. Devuelve (modo, parámetro):
+    ("svg", None) | ("webgl", None) | ("densidad", bins) |
+    ("muestra", {"tam": tamaño, "x": (desde, hasta), "y": (desde, hasta)}).
+    `rangos()` devuelve (rango_x, rango_y) en las unidades del gráfico; solo se llama
+    al explorar una muestra, para acotarla al rango visible de los ejes.
+    """
+    if n_total <= UMBRAL_WEBGL:
+        return "svg", None
+    if n_total <= UMBRAL_DENSIDAD:
+        return "webgl", None
+
+    ver_muestra = st.toggle(
+        "Explorar una muestra de puntos (en vez de la densidad)",
+        value=False,
+        key=f"{key}_ver_muestra",
+    )
+    if ver_muestra:
+        tam = st.slider("Puntos en la muestra", 10_000, UMBRAL_DENSIDAD, 100_000, 10_000, key=f"{key}_tam_muestra")
+        rango_x, rango_y = rangos() if rangos is not None else (None, None)
+        c1, c2 = st.columns(2)
+        with c1:
+            rango_x = _slider_rango("Rango del eje X", rango_x, f"{key}_rango_x")
+        with c2:
+            rango_y = _slider_rango("Rango del eje Y", rango_y, f"{key}_rango_y")
+        return "muestra", {"tam": tam, "x": rango_x, "y": rango_y}
+    bins = st.slider("Resolución de la grilla de densidad", 50, 400, 200, 50, key=f"{key}_bins_densidad")
+    return "densidad", bins
+
+
+def _figura_dispersion(x, ys: dict, modo: str, param, marker=None):
+    """
+    Construye la dispersión según el modo. `ys` es {nombre: valores_y} (ya escalados).
+    Devuelve (fig, elementos_dibujados): puntos, o celdas no vacías en modo densidad.
+    """
+    x = np.asarray(x, dtype="float64")
+    fig = go.Figure()
+
+    if modo == "densidad":
+        y_min = min(float(np.min(y)) for y in ys.values())
+        y_max = max(float(np.max(y)) for y in ys.values())
+        rango = [[float(np.min(x)), float(np.max(x))], [y_min, y_max]]
+        colores = px.colors.qualitative.Plotly
+        n_celdas = 0
+
+        for i, (nombre, y) in enumerate(ys.items()):
+            conteos, xe, ye = np.histogram2d(x, y, bins=param, range=rango)
+            n_celdas += int(np.count_nonzero(conteos))
+            xc, yc = (xe[:-1] + xe[1:]) / 2, (ye[:-1] + ye[1:]) / 2
+            if len(ys) == 1:
+                z = conteos.T
+                z[z == 0] = np.nan  # celdas vacías transparentes
+                fig.add_trace(go.Heatmap(
+                    x=xc, y=yc, z=z,
+                    colorscale="Viridis",
+                    colorbar=dict(title="Puntos"),
+                    name=nombre,
+                    hovertemplate="Puntos: %{z:,.0f}<extra></extra>",
+                ))
+            else:
+                color = colores[i % len(colores)]
+                fig.add_trace(go.Contour(
+                    x=xc, y=yc, z=conteos.T,
+                    contours_coloring="lines",
+                    colorscale=[[0, color], [1, color]],
+                    showscale=False,
+                    showlegend=True,
+                    name=nombre,
+                    hovertemplate=f"{nombre}<br>Puntos: %{{z:,.0f}}<extra></extra>",
+                ))
+        return fig, n_celdas
+
+    if modo == "muestra":
+        # drill-down: solo filas dentro del rango de los ejes, con el presupuesto de
+        # puntos repartido entre las series
+        rng = np.random.default_rng(0)  # semilla fija: la muestra no cambia entre reruns
+        por_serie = max(1, param["tam"] // len(ys))
+        en_x = _dentro_de(x, param["x"])
+        n_render = 0
+        for nombre, y in ys.items():
+            y = np.asarray(y, dtype="float64")
+            idx = np.flatnonzero(en_x & _dentro_de(y, param["y"]))
+            if len(idx) > por_serie:
+                idx = np.sort(rng.choice(idx, size=por_serie, replace=False))
+            fig.add_trace(go.Scattergl(x=x[idx], y=y[idx], mode="markers", name=nombre, marker=marker))
+            n_render += len(idx)
+        if param["x"] is not None:
+            fig.update_xaxes(range=list(param["x"]))
+        if param["y"] is not None:
+            fig.update_yaxes(range=list(param["y"]))
+        return fig, n_render
+
+    idx = slice(None)
+    trazo = go.Scatter if modo == "svg" else go.Scattergl
+    n_render = 0
+    for nombre, y in ys.items():
+        xs, yv = x[idx], np.asarray(y)[idx]
+        fig.add_trace(trazo(x=xs, y=yv, mode="markers", name=nombre, marker=marker))
+        n_render += len(xs)
+    return fig, n_render
+
+
+def _dentro_de(v: np.ndarray, rango) -> np.ndarray:
+    if rango is None:
+        return np.ones(len(v), dtype=bool)
+    return (v >= rango[0]) & (v <= rango[1])
+
+
+def _nota_dispersion(modo: str, param, n_render: int, n_total: int) -> str:
+    if modo == "densidad":
+        return (
+            f"Celdas de densidad dibujadas: {format_lat_number(n_render, decimals=0)} "
+            f"(grilla de {param}×{param} por serie), que resumen "
+            f"{format_lat_number(n_total, decimals=0)} puntos (densidad agregada en el servidor)."
+        )
+    detalle = {
+        "svg": "SVG",
+        "webgl": "WebGL",
+        "muestra": "WebGL, muestra aleatoria dentro del rango de los ejes",
+    }[modo]
+    return (
+        f"Puntos renderizados: {format_lat_number(n_render, decimals=0)} de "
+        f"{format_lat_number(n_total, decimals=0)} ({detalle})."
+    )
 
 
-def render_scatter_multiple(df, cols_num, scale_mode: str):
+def render_scatter_multiple(df, cols_num, scale_mode: str, version: str):
     if len(cols_num) < 2:
         st.warning("Se necesitan al menos 2 columnas numéricas.")
         return
@@ -811,48 +2248,69 @@ def render_scatter_multiple(df, cols_num, scale_mode: str):
         st.info("Selecciona al menos una variable para el eje Y.")
         return
 
-    factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
-    data = df[[x_col] + y_cols].dropna()
-
     if PLOTLY_AVAILABLE:
-        fig = go.Figure()
-        for y_col in y_cols:
-            fig.add_trace(go.Scatter(
-                x=data[x_col],
-                y=scale_values(data[y_col].values, factor),
-                mode="markers",
-                name=y_col,
-                marker=dict(size=8, opacity=0.6)
-            ))
-        fig.update_layout(
-            xaxis_title=x_col,
-            yaxis_title=f"Valores (en {unit_label})",
-            height=500
+        n_total = filas_completas(df, version, (x_col, *y_cols)) * len(y_cols)
+        modo, param = _controles_dispersion(
+            n_total, key="scatter_multi",
+            rangos=lambda: _rangos_escalados(df, version, x_col, y_cols, scale_mode),
         )
-        fig = set_title_with_unit_plotly(fig, f"Dispersión: {', '.join(y_cols)} vs {x_col}", unit_label)
-        fig = apply_plotly_latino_format(fig, decimals=0)
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
-    else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for y_col in y_cols:
-            ax.scatter(
-                data[x_col],
-                scale_values(data[y_col].values, factor),
-                label=y_col,
-                alpha=0.6,
-                s=50
+
+        def construir():
+            factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
+            data = df[[x_col] + y_cols].dropna()
+            fig, n_render = _figura_dispersion(
+                data[x_col].values,
+                {y_col: scale_values(data[y_col].values, factor) for y_col in y_cols},
+                modo,
+                param,
+                marker=dict(size=8 if modo == "svg" else 4, opacity=0.6),
             )
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
-        set_title_with_unit_matplotlib(ax, f"Dispersión: {', '.join(y_cols)} vs {x_col}", unit_label)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.tight_layout()
-        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+            fig.update_layout(
+                xaxis_title=x_col,
+                yaxis_title=f"Valores (en {unit_label})",
+                height=500
+            )
+            fig = set_title_with_unit_plotly(fig, f"Dispersión: {', '.join(y_cols)} vs {x_col}", unit_label)
+            fig = apply_plotly_latino_format(
+                fig,
+                decimals=0,
+                y_range=param["y"] if modo == "muestra" else _rango_columnas(data, y_cols, factor),
+                x_range=param["x"] if modo == "muestra" else _rango_columnas(data, [x_col]),
+            )
+            return fig, [_nota_dispersion(modo, param, n_render, n_total)]
+
+        spec = {
+            "grafico": "dispersion_multiple", "version": version, "escala": scale_mode,
+            "x": x_col, "y": y_cols, "modo": modo, "param": param,
+        }
+        mostrar_figura_plotly(spec, construir)
+    else:
+        def construir():
+            factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
+            data = df[[x_col] + y_cols].dropna()
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for y_col in y_cols:
+                ax.scatter(
+                    data[x_col],
+                    scale_values(data[y_col].values, factor),
+                    label=y_col,
+                    alpha=0.6,
+                    s=50
+                )
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, f"Dispersión: {', '.join(y_cols)} vs {x_col}", unit_label)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            fig.tight_layout()
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, []
 
+        spec = {"grafico": "dispersion_multiple", "version": version, "escala": scale_mode, "x": x_col, "y": y_cols}
+        mostrar_figura_matplotlib(spec, construir)
 
-def render_scatter_chart_plotly(df, cols_num, scale_mode: str):
+
+def render_scatter_chart_plotly(df, cols_num, scale_mode: str, version: str):
     if len(cols_num) < 2:
         st.warning("Se necesitan al menos 2 columnas numéricas.")
         return
@@ -863,29 +2321,56 @@ def render_scatter_chart_plotly(df, cols_num, scale_mode: str):
     with col2:
         y_col = st.selectbox("Eje Y", [c for c in cols_num if c != x_col])
 
-    factor, unit_label = _scale_info_for_ycols(df, [y_col], scale_mode)
-    data = df[[x_col, y_col]].dropna()
-
     if PLOTLY_AVAILABLE:
-        data_plot = data.copy()
-        data_plot[y_col] = scale_values(data_plot[y_col].values, factor)
-        fig = px.scatter(data_plot, x=x_col, y=y_col)
-        fig.update_layout(height=500, yaxis_title=f"{y_col} (en {unit_label})")
-        fig = set_title_with_unit_plotly(fig, f"{y_col} vs {x_col}", unit_label)
-        fig = apply_plotly_latino_format(fig, decimals=0)
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        n_total = filas_completas(df, version, (x_col, y_col))
+        modo, param = _controles_dispersion(
+            n_total, key="scatter_simple",
+            rangos=lambda: _rangos_escalados(df, version, x_col, [y_col], scale_mode),
+        )
+
+        def construir():
+            factor, unit_label = _scale_info_for_ycols(df, [y_col], scale_mode)
+            data = df[[x_col, y_col]].dropna()
+            fig, n_render = _figura_dispersion(
+                data[x_col].values,
+                {y_col: scale_values(data[y_col].values, factor)},
+                modo,
+                param,
+                marker=dict(opacity=0.6),
+            )
+            fig.update_layout(height=500, xaxis_title=x_col, yaxis_title=f"{y_col} (en {unit_label})", showlegend=False)
+            fig = set_title_with_unit_plotly(fig, f"{y_col} vs {x_col}", unit_label)
+            fig = apply_plotly_latino_format(
+                fig,
+                decimals=0,
+                y_range=param["y"] if modo == "muestra" else _rango_columnas(data, [y_col], factor),
+                x_range=param["x"] if modo == "muestra" else _rango_columnas(data, [x_col]),
+            )
+            return fig, [_nota_dispersion(modo, param, n_render, n_total)]
+
+        spec = {
+            "grafico": "dispersion", "version": version, "escala": scale_mode,
+            "x": x_col, "y": y_col, "modo": modo, "param": param,
+        }
+        mostrar_figura_plotly(spec, construir)
     else:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.scatter(data[x_col], scale_values(data[y_col].values, factor), alpha=0.6, s=50)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel(f"{y_col} (en {unit_label})", fontsize=12)
-        set_title_with_unit_matplotlib(ax, f"{y_col} vs {x_col}", unit_label)
-        ax.grid(True, alpha=0.3)
-        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+        def construir():
+            factor, unit_label = _scale_info_for_ycols(df, [y_col], scale_mode)
+            data = df[[x_col, y_col]].dropna()
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.scatter(data[x_col], scale_values(data[y_col].values, factor), alpha=0.6, s=50)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel(f"{y_col} (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, f"{y_col} vs {x_col}", unit_label)
+            ax.grid(True, alpha=0.3)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, []
 
+        spec = {"grafico": "dispersion", "version": version, "escala": scale_mode, "x": x_col, "y": y_col}
+        mostrar_figura_matplotlib(spec, construir)
 
-def render_area_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
+
+def render_area_chart_mejorado(df, cols_num, cols_cat, scale_mode: str, version: str):
     if not cols_num:
         st.warning("No hay columnas numéricas disponibles.")
         return
@@ -900,37 +2385,116 @@ def render_area_chart_mejorado(df, cols_num, cols_cat, scale_mode: str):
         st.info("Selecciona al menos una variable para el eje Y.")
         return
 
-    factor, unit_label = _scale_info_for_ycols(df, y_cols, scale_mode)
-    data = df[[x_col] + y_cols].dropna()
-
-    if not (pd.api.types.is_numeric_dtype(data[x_col]) or pd.api.types.is_datetime64_any_dtype(data[x_col])):
-        data = data.groupby(x_col, sort=False)[y_cols].mean().reset_index()
+    ctrl = _controles_serie(df, x_col, key="area")
+    titulo = f"Área: {', '.join(y_cols)}"
+    if ctrl["medida"] is not None:
+        titulo = f"Área: {ctrl['etiqueta_medida'].lower()} de {', '.join(y_cols)} por {x_col}"
+    spec = {"grafico": "area", "version": version, "escala": scale_mode, "x": x_col, "y": y_cols, **ctrl}
 
     if PLOTLY_AVAILABLE:
-        data_plot = data.copy()
-        for y in y_cols:
-            data_plot[y] = scale_values(data_plot[y].values, factor)
-        fig = px.area(data_plot, x=x_col, y=y_cols)
-        fig.update_layout(height=500, yaxis_title=f"Valores (en {unit_label})")
-        fig = set_title_with_unit_plotly(fig, f"Área: {', '.join(y_cols)}", unit_label)
-        fig = apply_plotly_latino_format(fig, decimals=0)
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        def construir():
+            data, factor, unit_label, notas = _datos_serie(df, version, x_col, y_cols, scale_mode, ctrl)
+            data_plot = data.copy()
+            for y in y_cols:
+                data_plot[y] = scale_values(data_plot[y].values, factor)
+            fig = px.area(data_plot, x=x_col, y=y_cols)
+            fig.update_layout(height=500, yaxis_title=f"Valores (en {unit_label})")
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
+            # px.area apila las series: el máximo del eje es la suma por fila
+            y_range = _rango_columnas(data_plot, y_cols)
+            if y_range is not None:
+                apilado = data_plot[y_cols].clip(lower=0).sum(axis=1).max()
+                y_range = (min(y_range[0], 0.0), max(y_range[1], float(apilado)))
+            fig = apply_plotly_latino_format(
+                fig,
+                decimals=0,
+                y_range=y_range,
+                x_range=_rango_columnas(data_plot, [x_col]) if pd.api.types.is_numeric_dtype(data_plot[x_col]) else None,
+            )
+            return fig, notas
+
+        mostrar_figura_plotly(spec, construir)
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        xs = np.arange(len(data))
-        for y_col in y_cols:
-            ax.fill_between(xs, scale_values(data[y_col].values, factor), alpha=0.5, label=y_col)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
-        set_title_with_unit_matplotlib(ax, f"Área: {', '.join(y_cols)}", unit_label)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.tight_layout()
-        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+        def construir():
+            data, factor, unit_label, notas = _datos_serie(df, version, x_col, y_cols, scale_mode, ctrl)
+            fig, ax = plt.subplots(figsize=(12, 6))
+            xs = np.arange(len(data))
+            for y_col in y_cols:
+                ax.fill_between(xs, scale_values(data[y_col].values, factor), alpha=0.5, label=y_col)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            fig.tight_layout()
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, notas
 
+        mostrar_figura_matplotlib(spec, construir)
 
-def render_histogram_plotly(df, cols_num, scale_mode: str):
+
+MAX_OUTLIERS_BOX = 200  # outliers dibujados por grupo (los más extremos)
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def histograma_servidor(_df: pd.DataFrame, version: str, col: str, bins: int, factor: float):
+    """Conteos y bordes de bins calculados en el servidor con np.histogram (clave: versión, columna, bins, escala)."""
+    v = _df[col].to_numpy(dtype="float64", na_value=np.nan)
+    v = v[np.isfinite(v)] / float(factor)
+    conteos, bordes = np.histogram(v, bins=bins)
+    return conteos, bordes
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def estadisticas_boxplot(_df: pd.DataFrame, version: str, y_col: str, x_col, factor: float, max_outliers: int = MAX_OUTLIERS_BOX):
+    """
+    Cuartiles, bigotes (1,5·IQR) y outliers por grupo, en pasadas agrupadas vectorizadas.
+    Devuelve (stats, outliers): stats tiene una fila por grupo y outliers como máximo
+    `max_outliers` filas por grupo, así el tamaño no depende del número de filas.
+    """
+    cols = [y_col] if x_col is None else [x_col, y_col]
+    d = _df[cols].dropna()
+    if d.empty:
+        # sin valores válidos no hay cuartiles: tablas vacías para que la sección lo avise
+        stats = pd.DataFrame(columns=["grupo", "n", "q1", "mediana", "q3", "bigote_inf", "bigote_sup", "n_outliers"])
+        return stats, pd.DataFrame(columns=["grupo", "valor"])
+    y = d[y_col].to_numpy(dtype="float64") / float(factor)
+    if x_col is None:
+        codes, grupos = np.zeros(len(y), dtype=np.int64), pd.Index([y_col])
+    else:
+        codes, grupos = pd.factorize(d[x_col], sort=False)  # orden de aparición, como px.box
+
+    g = pd.Series(y).groupby(codes, sort=True)
+    q = g.quantile([0.25, 0.5, 0.75]).unstack()
+    q1, med, q3 = q[0.25].to_numpy(), q[0.5].to_numpy(), q[0.75].to_numpy()
+    iqr = q3 - q1
+    lim_inf, lim_sup = q1 - 1.5 * iqr, q3 + 1.5 * iqr
+
+    dentro = (y >= lim_inf[codes]) & (y <= lim_sup[codes])
+    bigotes = pd.Series(y[dentro]).groupby(codes[dentro], sort=True).agg(["min", "max"]).reindex(range(len(grupos)))
+
+    stats = pd.DataFrame({
+        "grupo": grupos.astype(str),
+        "n": g.size().to_numpy(),
+        "q1": q1,
+        "mediana": med,
+        "q3": q3,
+        "bigote_inf": bigotes["min"].to_numpy(),
+        "bigote_sup": bigotes["max"].to_numpy(),
+        "n_outliers": np.bincount(codes[~dentro], minlength=len(grupos)),
+    })
+
+    fuera = pd.DataFrame({"codigo": codes[~dentro], "valor": y[~dentro]})
+    fuera["dist"] = np.abs(fuera["valor"].to_numpy() - med[fuera["codigo"].to_numpy()])
+    fuera = fuera.sort_values("dist", ascending=False).groupby("codigo", sort=False).head(max_outliers)
+    outliers = pd.DataFrame({
+        "grupo": stats["grupo"].to_numpy()[fuera["codigo"].to_numpy()],
+        "valor": fuera["valor"].to_numpy(),
+    })
+    return stats, outliers
+
+
+def render_histogram_plotly(df, cols_num, scale_mode: str, version: str):
     if not cols_num:
         st.warning("No hay columnas numéricas disponibles.")
         return
@@ -939,27 +2503,44 @@ def render_histogram_plotly(df, cols_num, scale_mode: str):
     bins = st.slider("Número de bins", 10, 100, 30)
 
     factor, unit_label = _scale_info_for_ycols(df, [col], scale_mode)
-    data = df[col].dropna()
-    data_scaled = scale_values(data.values, factor)
+    conteos, bordes = histograma_servidor(df, version, col, bins, factor)
+    if not conteos.sum():
+        st.info("La variable no tiene valores válidos.")
+        return
 
+    spec = {"grafico": "histograma", "version": version, "escala": scale_mode, "x": col, "bins": bins}
     if PLOTLY_AVAILABLE:
-        fig = px.histogram(data_scaled, nbins=bins)
-        fig.update_layout(height=500, xaxis_title=f"{col} (en {unit_label})")
-        fig = set_title_with_unit_plotly(fig, f"Histograma de {col}", unit_label)
-        fig.update_layout(separators=".,")
-        st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
+        def construir():
+            centros = (bordes[:-1] + bordes[1:]) / 2
+            fig = go.Figure(go.Bar(
+                x=centros,
+                y=conteos,
+                width=np.diff(bordes),
+                customdata=np.column_stack([bordes[:-1], bordes[1:]]),
+                hovertemplate="[%{customdata[0]:,.2f} ; %{customdata[1]:,.2f})<br>Frecuencia: %{y:,.0f}<extra></extra>",
+                name=col,
+            ))
+            fig.update_layout(height=500, bargap=0, xaxis_title=f"{col} (en {unit_label})", yaxis_title="Frecuencia")
+            fig = set_title_with_unit_plotly(fig, f"Histograma de {col}", unit_label)
+            fig.update_layout(separators=".,")
+            return fig, []
+
+        mostrar_figura_plotly(spec, construir)
     else:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(data_scaled, bins=bins, edgecolor="black")
-        ax.set_xlabel(f"{col} (en {unit_label})", fontsize=12)
-        ax.set_ylabel("Frecuencia", fontsize=12)
-        set_title_with_unit_matplotlib(ax, f"Histograma de {col}", unit_label)
-        ax.grid(True, alpha=0.3)
-        ax.xaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.hist(bordes[:-1], bins=bordes, weights=conteos, edgecolor="black")
+            ax.set_xlabel(f"{col} (en {unit_label})", fontsize=12)
+            ax.set_ylabel("Frecuencia", fontsize=12)
+            set_title_with_unit_matplotlib(ax, f"Histograma de {col}", unit_label)
+            ax.grid(True, alpha=0.3)
+            ax.xaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
 
 
-def render_boxplot_plotly(df, cols_num, cols_cat, scale_mode: str):
+def render_boxplot_plotly(df, cols_num, cols_cat, scale_mode: str, version: str):
     if not cols_num:
         st.warning("No hay columnas numéricas disponibles.")
         return
@@ -974,53 +2555,1669 @@ def render_boxplot_plotly(df, cols_num, cols_cat, scale_mode: str):
             x_col = "Ninguno"
 
     factor, unit_label = _scale_info_for_ycols(df, [y_col], scale_mode)
+    grupo = None if x_col == "Ninguno" else x_col
+    stats, outliers = estadisticas_boxplot(df, version, y_col, grupo, factor)
+    if stats.empty:
+        st.info("La variable no tiene valores válidos.")
+        return
 
-    if x_col == "Ninguno":
-        data = df[[y_col]].dropna()
-        data_plot = data.copy()
-        data_plot[y_col] = scale_values(data_plot[y_col].values, factor)
+    titulo = f"Box Plot de {y_col}" if grupo is None else f"Box Plot de {y_col} por {x_col}"
+    spec = {"grafico": "caja", "version": version, "escala": scale_mode, "y": y_col, "grupo": grupo}
 
-        if PLOTLY_AVAILABLE:
-            fig = px.box(data_plot, y=y_col)
-            fig.update_layout(height=500, yaxis_title=f"{y_col} (en {unit_label})")
-            fig = set_title_with_unit_plotly(fig, f"Box Plot de {y_col}", unit_label)
-            fig = apply_plotly_latino_format(fig, decimals=0)
-            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
-        else:
-            fig, ax = plt.subplots(figsize=(8, 6))
-            ax.boxplot(data_plot[y_col].values)
+    if PLOTLY_AVAILABLE:
+        def construir():
+            fig = go.Figure(go.Box(
+                x=stats["grupo"],
+                q1=stats["q1"],
+                median=stats["mediana"],
+                q3=stats["q3"],
+                lowerfence=stats["bigote_inf"],
+                upperfence=stats["bigote_sup"],
+                name=y_col,
+                boxpoints=False,
+            ))
+            if not outliers.empty:
+                fig.add_trace(go.Scatter(
+                    x=outliers["grupo"],
+                    y=outliers["valor"],
+                    mode="markers",
+                    name="Outliers",
+                    marker=dict(size=5, opacity=0.6),
+                ))
+            fig.update_layout(height=500, yaxis_title=f"{y_col} (en {unit_label})", showlegend=False)
+            if grupo is not None:
+                fig.update_layout(xaxis_title=x_col)
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
+            y_range = (
+                float(np.nanmin(np.append(stats["bigote_inf"], outliers["valor"]))),
+                float(np.nanmax(np.append(stats["bigote_sup"], outliers["valor"]))),
+            )
+            return apply_plotly_latino_format(fig, decimals=0, y_range=y_range), []
+
+        mostrar_figura_plotly(spec, construir)
+    else:
+        def construir():
+            fig, ax = plt.subplots(figsize=(8, 6) if grupo is None else (10, 6))
+            cajas = [
+                {
+                    "label": r.grupo,
+                    "q1": r.q1,
+                    "med": r.mediana,
+                    "q3": r.q3,
+                    "whislo": r.bigote_inf,
+                    "whishi": r.bigote_sup,
+                    "fliers": outliers.loc[outliers["grupo"] == r.grupo, "valor"].to_numpy(),
+                }
+                for r in stats.itertuples(index=False)
+            ]
+            ax.bxp(cajas)
             ax.set_ylabel(f"{y_col} (en {unit_label})", fontsize=12)
-            set_title_with_unit_matplotlib(ax, f"Box Plot de {y_col}", unit_label)
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+            if grupo is not None:
+                plt.setp(ax.get_xticklabels(), rotation=45, ha="right")
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
+
+    n_out = int(stats["n_outliers"].sum())
+    if n_out > len(outliers):
+        st.caption(
+            f"Se dibujan {format_lat_number(len(outliers), decimals=0)} de {format_lat_number(n_out, decimals=0)} "
+            f"outliers (los {MAX_OUTLIERS_BOX} más extremos de cada grupo)."
+        )
+
+
+# =========================
+# CUBO PRE-AGREGADO (DIMENSIONES CATEGÓRICAS)
+# =========================
+MAX_CATEGORIAS_CUBO = 500   # texto con más valores distintos no entra como dimensión
+MAX_VALORES_DIM_NUMERICA = 50  # enteros tipo año/mes/zona
+MAX_DIMENSIONES_CUBO = 6
+ESTADISTICOS_CUBO = {
+    "Suma": "sum",
+    "Conteo": "count",
+    "Promedio": "mean",
+    "Mínimo": "min",
+    "Máximo": "max",
+    "Desv. estándar": "std",
+    "Varianza": "var",
+}
+ETIQUETA_SIN_DATO = "(sin dato)"
+# enteros que se tratan como dimensión aunque sean numéricos: años y códigos de calendario o zona
+PATRON_DIM_NUMERICA = re.compile(r"^(a[ñn]y?i?o|year|mes|month|d[ií]a|trimestre|semestre|zona|c[oó]d)", re.IGNORECASE)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def perfilar_dimensiones(_df: pd.DataFrame, version: str) -> list:
+    """
+    Columnas de baja cardinalidad aptas como dimensión del cubo: primero texto/categóricas
+    con hasta MAX_CATEGORIAS_CUBO valores, luego enteros con hasta MAX_VALORES_DIM_NUMERICA
+    que parecen año o código (por nombre o por estar entre 1900 y 2100); dentro de cada
+    grupo, de menor a mayor cardinalidad. Un entero cualquiera con pocos valores suele ser
+    una medida (conteos, muchos ceros), por eso no basta la cardinalidad. Se descartan las
+    columnas con más de un 20% de nulos y las fechas.
+    """
+    candidatas = []
+    for c in _df.columns:
+        s = _df[c]
+        if pd.api.types.is_datetime64_any_dtype(s) or s.isna().mean() > 0.2:
+            continue
+        numerica = pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+        if numerica:
+            v = s.dropna().to_numpy(dtype="float64")
+            if len(v) == 0 or not np.all(v == np.round(v)):
+                continue
+            parece_anyo = v.min() >= 1900 and v.max() <= 2100
+            if not (parece_anyo or PATRON_DIM_NUMERICA.match(str(c).strip())):
+                continue
+        limite = MAX_VALORES_DIM_NUMERICA if numerica else MAX_CATEGORIAS_CUBO
+        n_distintos = s.nunique(dropna=True)
+        if 2 <= n_distintos <= limite and n_distintos < max(len(s), 1):
+            candidatas.append((numerica, n_distintos, c))
+    return [c for *_, c in sorted(candidatas, key=lambda t: t[:2])[:MAX_DIMENSIONES_CUBO]]
+
+
+def _combinar_codigos(codigos: list, cardinalidades: list):
+    """
+    Combina códigos por dimensión en un id denso de grupo (radix mixto, re-densificando
+    antes de desbordar). Los grupos quedan en orden lexicográfico de los códigos.
+    Devuelve (id de grupo por fila, primera fila de cada grupo).
+    """
+    n = len(codigos[0]) if codigos else 0
+    if not codigos:
+        return np.zeros(n, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    combinado = np.zeros(n, dtype=np.int64)
+    base = 1
+    for cod, card in zip(codigos, cardinalidades):
+        if base * card >= 2**62:
+            _, combinado = np.unique(combinado, return_inverse=True)
+            base = int(combinado.max()) + 1
+        combinado = combinado * card + cod
+        base *= card
+    _, primera, gid = np.unique(combinado, return_index=True, return_inverse=True)
+    return gid.astype(np.int64), primera
+
+
+def _acumular(gid: np.ndarray, n_grupos: int, conteo, suma, m2, minimo, maximo) -> dict:
+    """
+    Estadísticos suficientes por grupo; sumas con bincount y extremos con fmin/fmax.at
+    (ignoran NaN). `m2` es la suma de cuadrados de desvíos respecto de la media de cada
+    parte; se combina al estilo de Chan, M2 = Σ M2_i + Σ n_i·(media_i − media)², con la
+    media del grupo ya calculada: no resta sumas grandes, a diferencia de sumsq − sum²/n.
+    """
+    mn = np.full(n_grupos, np.inf)
+    mx = np.full(n_grupos, -np.inf)
+    np.fmin.at(mn, gid, minimo)
+    np.fmax.at(mx, gid, maximo)
+    cnt = np.bincount(gid, weights=conteo, minlength=n_grupos)
+    sm = np.bincount(gid, weights=suma, minlength=n_grupos)
+    vacio = cnt == 0
+    mn[vacio] = np.nan
+    mx[vacio] = np.nan
+    media = np.divide(sm, cnt, out=np.zeros(n_grupos), where=~vacio)
+    hay = conteo > 0
+    media_parte = np.divide(suma, conteo, out=np.zeros(len(conteo)), where=hay)
+    desvio = np.where(hay, media_parte - media[gid], 0.0)
+    return {
+        "count": cnt,
+        "sum": sm,
+        "m2": np.bincount(gid, weights=m2 + conteo * desvio * desvio, minlength=n_grupos),
+        "min": mn,
+        "max": mx,
+    }
+
+
+@st.cache_resource(show_spinner=False, max_entries=8)
+def construir_cubo(_df: pd.DataFrame, version: str, dims: tuple, valores: tuple) -> dict:
+    """
+    Materializa el cubo: una celda por combinación observada de `dims` con conteo, suma,
+    mínimo, máximo y M2 (suma de cuadrados de desvíos) de cada columna de `valores`. Los nulos de una
+    dimensión forman su propia categoría para que los totales cuadren con los datos.
+    Se comparte sin copiar entre sesiones: tratarlo como solo lectura.
+    """
+    inicio = datetime.now()
+    codigos, categorias = [], {}
+    for d in dims:
+        cod, cats = pd.factorize(_df[d], sort=False, use_na_sentinel=False)
+        codigos.append(cod.astype(np.int64))
+        categorias[d] = pd.Index(cats, name=d)
+    gid, primera = _combinar_codigos(codigos, [len(categorias[d]) for d in dims])
+    n_celdas = len(primera)
+
+    stats = {}
+    for col in valores:
+        v = _df[col].to_numpy(dtype="float64", na_value=np.nan)
+        ok = ~np.isnan(v)
+        v0 = np.where(ok, v, 0.0)
+        stats[col] = _acumular(gid, n_celdas, ok.astype("float64"), v0, np.zeros(len(v)), v, v)
+
+    return {
+        "dims": dims,
+        "valores": valores,
+        "categorias": categorias,
+        "codigos": {d: cod[primera].astype(np.int32) for d, cod in zip(dims, codigos)},
+        "stats": stats,
+        "celdas": n_celdas,
+        "filas": len(_df),
+        "segundos": (datetime.now() - inicio).total_seconds(),
+    }
+
+
+def cubo_del_dataset(df: pd.DataFrame, version: str) -> dict:
+    """Cubo por defecto: dimensiones del perfilador y todas las columnas numéricas restantes."""
+    dims = tuple(perfilar_dimensiones(df, version))
+    valores = tuple(c for c in columnas_numericas(df) if c not in dims)
+    return construir_cubo(df, version, dims, valores)
+
+
+def _filtros_en_celdas(cubo: dict, df: pd.DataFrame, version: str, filtros: dict):
+    """
+    Traduce filtros globales (ver panel_filtros_globales) sobre el dataset `df` de `version`
+    a filtros de celdas del cubo, como posiciones en cubo["categorias"]: las posiciones de
+    indice_columna se pasan a sus categorías (los objetos originales, sin pasar por JSON) y
+    estas a su posición en el cubo; un rango sobre una dimensión numérica, a las categorías
+    que caen dentro. None si alguna columna filtrada no es dimensión.
+    """
+    celdas = {}
+    for col, valor in filtros.items():
+        if col not in cubo["dims"]:
+            return None
+        cats = cubo["categorias"][col]
+        indice = indice_columna(df, version, col)
+        if indice["tipo"] == "cat":
+            elegidas = [indice["categorias"][k] for k in valor]
+            pos = cats.astype(object).get_indexer(pd.Index(elegidas, dtype=object))
+            celdas[col] = pos[pos >= 0].tolist()
+        else:
+            lo, hi = valor
+            celdas[col] = np.flatnonzero((cats >= lo) & (cats <= hi)).tolist()
+    return celdas
+
+
+def registrar_cubo_base(df: pd.DataFrame, version: str, filtros: dict, version_filtrada: str):
+    """
+    Materializa el cubo por defecto del dataset sin filtrar (una vez por versión ingerida) y
+    lo deja en la sesión junto con los filtros globales, para que las consultas sobre el
+    dataset filtrado se respondan con un roll-up restringido a esas celdas.
+    """
+    cubo = cubo_del_dataset(df, version)
+    st.session_state["cubo_base"] = {
+        "df": df,
+        "version": version,
+        "cubo": cubo,
+        "filtros": filtros,
+        "version_filtrada": version_filtrada,
+    }
+
+
+def cubo_para_consultas(version: str):
+    """
+    (cubo, filtros de celdas) con que se responde una consulta sobre el dataset de `version`,
+    o (None, None) si no es el dataset activo (p. ej. un resultado SQL) o si algún filtro
+    global cae sobre una columna que no es dimensión: esas consultas van a las filas.
+    """
+    base = st.session_state.get("cubo_base")
+    if not base or base["version_filtrada"] != version:
+        return None, None
+    filtros = _filtros_en_celdas(base["cubo"], base["df"], base["version"], base["filtros"])
+    return (None, None) if filtros is None else (base["cubo"], filtros)
+
+
+def rollup_cubo(cubo: dict, claves: tuple, valores: tuple, estadistico: str,
+                filtros: dict = None, omitir_nulos: bool = False) -> pd.DataFrame:
+    """
+    Agrega el cubo a las `claves` (roll-up) después de restringir las celdas a `filtros`
+    {dimensión: [posiciones en cubo["categorias"]]} (drill-down). Nunca toca las filas originales.
+    El promedio sale de conteo y suma; la varianza, de M2 combinado (ver _acumular).
+    Los grupos con clave nula se rotulan ETIQUETA_SIN_DATO, o se omiten con `omitir_nulos`.
+    """
+    sel = np.ones(cubo["celdas"], dtype=bool)
+    for d, elegidos in (filtros or {}).items():
+        permitidos = np.zeros(len(cubo["categorias"][d]), dtype=bool)
+        permitidos[np.asarray(elegidos, dtype=np.int64)] = True
+        sel &= permitidos[cubo["codigos"][d]]
+
+    codigos = [cubo["codigos"][d][sel] for d in claves]
+    gid, primera = _combinar_codigos(codigos, [len(cubo["categorias"][d]) for d in claves])
+    if not claves:
+        gid = np.zeros(int(sel.sum()), dtype=np.int64)
+    n_grupos = len(primera)
+
+    salida = {}
+    for col in valores:
+        s = {k: a[sel] for k, a in cubo["stats"][col].items()}
+        g = _acumular(gid, n_grupos, s["count"], s["sum"], s["m2"], s["min"], s["max"])
+        n, hay = g["count"], g["count"] > 0
+        if estadistico in ("sum", "count", "min", "max"):
+            r = g[estadistico]
+        elif estadistico == "mean":
+            r = np.divide(g["sum"], n, out=np.full(n_grupos, np.nan), where=hay)
+        else:
+            # varianza muestral
+            gl = n - 1
+            r = np.divide(g["m2"], gl, out=np.full(n_grupos, np.nan), where=gl > 0)
+            if estadistico == "std":
+                r = np.sqrt(r)
+        salida[col] = r
+
+    if not claves:
+        return pd.DataFrame(salida, index=pd.Index(["Total"]))
+
+    niveles, nulos = [], np.zeros(n_grupos, dtype=bool)
+    for d, c in zip(claves, codigos):
+        nivel = cubo["categorias"][d][c[primera]]
+        if nivel.hasnans:
+            nulos |= nivel.isna()
+            nivel = nivel.astype(object).where(nivel.notna(), ETIQUETA_SIN_DATO)
+        niveles.append(nivel)
+    indice = pd.MultiIndex.from_arrays(niveles) if len(claves) > 1 else niveles[0]
+    res = pd.DataFrame(salida, index=indice)
+    return res[~nulos] if omitir_nulos else res
+
+
+def seccion_tabla_dinamica(df: pd.DataFrame, version: str):
+    st.header("Tabla Dinámica")
+    st.caption(
+        "Las agregaciones se responden desde un cubo pre-agregado (conteo, suma, mínimo, máximo y "
+        "suma de cuadrados de desvíos por combinación de dimensiones), no desde las filas originales."
+    )
+
+    perfiladas = perfilar_dimensiones(df, version)
+    candidatas = columnas_no_numericas(df) + [c for c in columnas_numericas(df) if c in perfiladas]
+    dims = st.multiselect(
+        "Dimensiones del cubo",
+        candidatas,
+        default=[c for c in perfiladas if c in candidatas],
+        key="pivot_dims",
+        help="Por defecto, las columnas de baja cardinalidad detectadas por el perfilador.",
+    )
+    if not dims:
+        st.warning("Selecciona al menos una dimensión.")
+        return
+    valores_cubo = tuple(c for c in columnas_numericas(df) if c not in dims)
+    if not valores_cubo:
+        st.warning("No quedan columnas numéricas para agregar.")
+        return
+
+    # con filtros globales solo sobre dimensiones, el cubo es el del dataset sin filtrar y los
+    # filtros se aplican como drill-down: cambiar un filtro no vuelve a materializarlo
+    base = st.session_state.get("cubo_base")
+    globales, version_cubo = {}, version
+    with st.spinner("Materializando cubo..."):
+        if base and base["version_filtrada"] == version and set(base["filtros"]) <= set(dims):
+            version_cubo = base["version"]
+            cubo = construir_cubo(base["df"], version_cubo, tuple(dims), valores_cubo)
+            globales = _filtros_en_celdas(cubo, base["df"], version_cubo, base["filtros"])
+        else:
+            cubo = construir_cubo(df, version, tuple(dims), valores_cubo)
+    st.caption(
+        f"Cubo: {format_lat_number(cubo['celdas'], decimals=0)} celdas sobre "
+        f"{format_lat_number(len(dims), decimals=0)} dimensiones "
+        f"(desde {format_lat_number(cubo['filas'], decimals=0)} filas, "
+        f"{format_lat_number(cubo['segundos'], decimals=2)} s)."
+    )
+
+    c1, c2 = st.columns(2)
+    with c1:
+        filas = st.multiselect("Filas", dims, default=dims[:1], key="pivot_filas")
+        valores = st.multiselect("Valores", list(valores_cubo), default=list(valores_cubo[:1]), key="pivot_valores")
+    with c2:
+        opciones_col = ["(ninguna)"] + [d for d in dims if d not in filas]
+        columna = st.selectbox("Columnas", opciones_col, key="pivot_columna")
+        etiqueta_est = st.selectbox("Estadístico", list(ESTADISTICOS_CUBO), index=2, key="pivot_estadistico")
+    estadistico = ESTADISTICOS_CUBO[etiqueta_est]
+
+    if not valores:
+        st.warning("Selecciona al menos una columna de valores.")
+        return
+
+    filtros = {}
+    with st.expander("Drill-down (filtrar celdas del cubo)", expanded=False):
+        for d in dims:
+            cats = cubo["categorias"][d]
+            # opciones = posiciones en el cubo; la clave lleva la versión para no reutilizar
+            # posiciones de otro dataset
+            elegidos = st.multiselect(
+                d,
+                globales.get(d, list(range(len(cats)))),
+                format_func=lambda k, cats=cats: ETIQUETA_SIN_DATO if pd.isna(cats[k]) else str(cats[k]),
+                key=f"pivot_drill_{d}_{version_cubo}",
+            )
+            if elegidos:
+                filtros[d] = elegidos
+            elif d in globales:
+                filtros[d] = globales[d]
+
+    claves = tuple(filas) + (() if columna == "(ninguna)" else (columna,))
+    inicio = datetime.now()
+    tabla = rollup_cubo(cubo, claves, tuple(valores), estadistico, filtros)
+    total = rollup_cubo(cubo, (), tuple(valores), estadistico, filtros)
+    ms = (datetime.now() - inicio).total_seconds() * 1000
+
+    if columna != "(ninguna)":
+        tabla = tabla.unstack(columna) if filas else tabla.T
+        if len(valores) == 1 and isinstance(tabla.columns, pd.MultiIndex):
+            tabla = tabla.droplevel(0, axis=1)
+    if isinstance(tabla.columns, pd.MultiIndex):
+        tabla.columns = [" | ".join(map(str, c)) for c in tabla.columns]
+    else:
+        tabla.columns = [str(c) for c in tabla.columns]
+    vista = tabla.reset_index() if filas else tabla
+
+    decimales = 0 if estadistico == "count" else 2
+    st.dataframe(style_latino(vista, decimals=decimales), use_container_width=True, height=420)
+    st.caption(
+        f"{format_lat_number(len(tabla), decimals=0)} filas · roll-up desde el cubo en "
+        f"{format_lat_number(ms, decimals=1)} ms"
+    )
+    cols_total = st.columns(min(len(valores), 4))
+    for i, v in enumerate(valores):
+        cols_total[i % len(cols_total)].metric(
+            f"{etiqueta_est} total · {v}", format_lat_number(total[v].iloc[0], decimals=decimales)
+        )
+
+    st.download_button(
+        "⬇️ Descargar Tabla Dinámica (CSV)",
+        df_to_csv_bytes(vista),
+        file_name="tabla_dinamica.csv",
+        mime="text/csv",
+        key="pivot_descarga",
+    )
+
+
+# =========================
+# SERIES DE TIEMPO (REMUESTREO Y VENTANAS MÓVILES)
+# =========================
+# frecuencia de período de pandas; cada punto queda rotulado con el inicio del período
+FRECUENCIAS_REMUESTREO = {"Hora": "h", "Día": "D", "Semana": "W", "Mes": "M", "Año": "Y"}
+MEDIDAS_REMUESTREO = {k: v for k, v in MEDIDAS_AGREGACION.items() if v != "p"}
+MAX_PUNTOS_REMUESTREO = 5_000_000  # grilla regular (grupos × períodos) máxima
+MAX_GRUPOS_GRAFICO = 10
+SIN_GRUPO = "(sin grupo)"
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def remuestrear_serie(_df: pd.DataFrame, version: str, fecha_col: str, valores: tuple, freq: str, grupo, medida: str):
+    """
+    Agrega `valores` por (grupo, período de `freq`) en una sola pasada de groupby sobre
+    ordinales de período enteros, y completa cada grupo con una grilla regular desde su
+    primer a su último período (huecos = NaN; 0 para suma y conteo, como resample).
+    Devuelve un DataFrame largo [grupo] + [fecha_col] + valores, ordenado por grupo y fecha.
+    """
+    fechas = _df[fecha_col]
+    if getattr(fechas.dt, "tz", None) is not None:
+        fechas = fechas.dt.tz_localize(None)
+    ok = fechas.notna().to_numpy()
+    ordinal = fechas[ok].dt.to_period(freq).array.asi8
+    if grupo:
+        codigos, etiquetas = pd.factorize(_df[grupo][ok], sort=True)
+        ok_grupo = codigos >= 0
+        codigos, ordinal = codigos[ok_grupo], ordinal[ok_grupo]
+        datos = _df.loc[ok, list(valores)].iloc[ok_grupo]
+    else:
+        codigos, etiquetas = np.zeros(len(ordinal), dtype=np.int64), pd.Index([SIN_GRUPO])
+        datos = _df.loc[ok, list(valores)]
+
+    columnas = [grupo or SIN_GRUPO, fecha_col] + list(valores)
+    if len(ordinal) == 0:
+        return pd.DataFrame(columns=columnas)
+
+    agregado = datos.groupby([codigos, ordinal], sort=True).agg(medida)
+
+    # grilla regular por grupo: como el índice viene ordenado, el primer y último
+    # ordinal de cada grupo son su mínimo y máximo
+    g = agregado.index.get_level_values(0).to_numpy()
+    o = agregado.index.get_level_values(1).to_numpy()
+    grupos, primera = np.unique(g, return_index=True)
+    ultima = np.r_[primera[1:], len(g)] - 1
+    largos = o[ultima] - o[primera] + 1
+    if largos.sum() > MAX_PUNTOS_REMUESTREO:
+        raise ValueError(
+            f"La grilla remuestreada tendría {format_lat_number(largos.sum(), decimals=0)} puntos; "
+            "elige una frecuencia más gruesa o filtra grupos."
+        )
+    g_grilla = np.repeat(grupos, largos)
+    desplazamiento = np.arange(largos.sum()) - np.repeat(np.cumsum(largos) - largos, largos)
+    o_grilla = np.repeat(o[primera], largos) + desplazamiento
+    agregado = agregado.reindex(pd.MultiIndex.from_arrays([g_grilla, o_grilla]))
+    if medida in ("sum", "count"):
+        agregado = agregado.fillna(0)
+
+    res = agregado.reset_index(drop=True)
+    res.insert(0, fecha_col, pd.PeriodIndex.from_ordinals(o_grilla, freq=freq).start_time)
+    res.insert(0, grupo or SIN_GRUPO, np.asarray(etiquetas)[g_grilla])
+    return res
+
+
+def _ventana_movil(v: np.ndarray, inicio_grupo: np.ndarray, ventana: int, min_periodos: int):
+    """
+    Suma y media móviles de `ventana` períodos sobre todas las columnas de `v` a la vez,
+    con sumas acumuladas: cada ventana es cs[i] - cs[max(i-ventana, inicio del grupo)].
+    Los NaN no suman y la ventana vale NaN si tiene menos de `min_periodos` datos.
+    """
+    validos = ~np.isnan(v)
+    cs = np.vstack([np.zeros((1, v.shape[1])), np.cumsum(np.where(validos, v, 0.0), axis=0)])
+    cc = np.vstack([np.zeros((1, v.shape[1])), np.cumsum(validos, axis=0)])
+    i = np.arange(len(v))
+    lo = np.maximum(i - ventana + 1, inicio_grupo)
+    suma = cs[i + 1] - cs[lo]
+    n = cc[i + 1] - cc[lo]
+    suficiente = n >= min_periodos
+    suma = np.where(suficiente, suma, np.nan)
+    media = np.divide(suma, n, out=np.full_like(suma, np.nan), where=suficiente & (n > 0))
+    return suma, media
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def ventanas_moviles(_serie: pd.DataFrame, clave: str, grupo_col: str, valores: tuple, ventana: int, min_periodos: int):
+    """Agrega a la serie remuestreada las columnas '<v> · suma móvil' y '<v> · media móvil'."""
+    codigos = pd.factorize(_serie[grupo_col], sort=False)[0]
+    cambios = np.r_[True, codigos[1:] != codigos[:-1]]
+    inicio_grupo = np.maximum.accumulate(np.where(cambios, np.arange(len(codigos)), 0))
+    v = _serie[list(valores)].to_numpy(dtype="float64", na_value=np.nan)
+    suma, media = _ventana_movil(v, inicio_grupo, ventana, min_periodos)
+    out = _serie.copy()
+    for j, c in enumerate(valores):
+        out[f"{c} · suma móvil"] = suma[:, j]
+        out[f"{c} · media móvil"] = media[:, j]
+    return out
+
+
+def seccion_series_tiempo(df: pd.DataFrame, scale_mode: str, version: str):
+    st.header("Series de Tiempo")
+
+    cols_fecha = df.select_dtypes(include=["datetime", "datetimetz"]).columns.tolist()
+    cols_num = columnas_numericas(df)
+    if not cols_fecha:
+        st.info("No hay columnas de fecha. Define una con el tipo 'Fecha' en la configuración de tipos.")
+        return
+    if not cols_num:
+        st.warning("No hay columnas numéricas disponibles.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        fecha_col = st.selectbox("Columna de fecha", cols_fecha, key="ts_fecha")
+        frecuencia = st.selectbox("Frecuencia", list(FRECUENCIAS_REMUESTREO), index=1, key="ts_frecuencia")
+    with c2:
+        valores = st.multiselect("Variables", cols_num, default=cols_num[:1], key="ts_valores")
+        etiqueta_medida = st.selectbox("Agregación", list(MEDIDAS_REMUESTREO), key="ts_agregacion")
+    with c3:
+        grupo = st.selectbox("Agrupar por", [SIN_GRUPO] + columnas_no_numericas(df), key="ts_grupo")
+        moviles = st.multiselect("Ventana móvil", ["Media móvil", "Suma móvil"], key="ts_moviles")
+
+    if not valores:
+        st.info("Selecciona al menos una variable.")
+        return
+    grupo = None if grupo == SIN_GRUPO else grupo
+    grupo_col = grupo or SIN_GRUPO
+    freq = FRECUENCIAS_REMUESTREO[frecuencia]
+    medida = MEDIDAS_REMUESTREO[etiqueta_medida]
+
+    ventana = min_periodos = None
+    if moviles:
+        v1, v2 = st.columns(2)
+        with v1:
+            ventana = st.slider(f"Ventana (en períodos de {frecuencia.lower()})", 2, 120, 7, key="ts_ventana")
+        with v2:
+            min_periodos = st.slider("Mínimo de datos en la ventana", 1, ventana, ventana, key="ts_min_periodos")
+
+    inicio = datetime.now()
+    try:
+        serie = remuestrear_serie(df, version, fecha_col, tuple(valores), freq, grupo, medida)
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    clave = version_dataset(version, fecha_col, valores, freq, grupo, medida)
+    if moviles:
+        serie = ventanas_moviles(serie, clave, grupo_col, tuple(valores), ventana, min_periodos)
+        clave = version_dataset(clave, ventana, min_periodos)
+    ms = (datetime.now() - inicio).total_seconds() * 1000
+    st.caption(
+        f"{format_lat_number(len(df), decimals=0)} filas → {format_lat_number(len(serie), decimals=0)} "
+        f"períodos ({format_lat_number(ms, decimals=1)} ms)"
+    )
+
+    grupos = serie[grupo_col].drop_duplicates().tolist()
+    grupos_graf = st.multiselect(
+        "Grupos a graficar", grupos, default=grupos[:min(5, len(grupos))], key="ts_grupos_graf",
+        max_selections=MAX_GRUPOS_GRAFICO,
+    ) if grupo else grupos
+
+    cols_movil = [f"{v} · {m.split()[0].lower()} móvil" for v in valores for m in moviles]
+    factor, unit_label = _escala_agregado(serie, list(valores) + cols_movil, medida, scale_mode)
+    titulo = f"{etiqueta_medida} por {frecuencia.lower()} de {', '.join(valores)}"
+    spec = {"grafico": "series_tiempo", "clave": clave, "escala": scale_mode, "grupos": grupos_graf, "moviles": moviles}
+
+    if PLOTLY_AVAILABLE:
+        def construir():
+            fig = go.Figure()
+            sub = serie[serie[grupo_col].isin(grupos_graf)]
+            for g, datos_g in sub.groupby(grupo_col, sort=False):
+                prefijo = f"{g} · " if grupo else ""
+                for v in valores:
+                    fig.add_trace(go.Scatter(
+                        x=datos_g[fecha_col], y=scale_values(datos_g[v].values, factor),
+                        mode="lines", name=f"{prefijo}{v}",
+                    ))
+                for c in cols_movil:
+                    fig.add_trace(go.Scatter(
+                        x=datos_g[fecha_col], y=scale_values(datos_g[c].values, factor),
+                        mode="lines", name=f"{prefijo}{c}", line=dict(dash="dash"),
+                    ))
+            fig.update_layout(height=500, xaxis_title=fecha_col, yaxis_title=f"Valores (en {unit_label})")
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
+            fig = apply_plotly_latino_format(fig, decimals=0)
+            return fig, []
+
+        mostrar_figura_plotly(spec, construir)
+    else:
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            sub = serie[serie[grupo_col].isin(grupos_graf)]
+            for g, datos_g in sub.groupby(grupo_col, sort=False):
+                prefijo = f"{g} · " if grupo else ""
+                for v in valores:
+                    ax.plot(datos_g[fecha_col], scale_values(datos_g[v].values, factor), label=f"{prefijo}{v}", linewidth=1.5)
+                for c in cols_movil:
+                    ax.plot(datos_g[fecha_col], scale_values(datos_g[c].values, factor), "--", label=f"{prefijo}{c}", linewidth=1.5)
+            ax.set_xlabel(fecha_col, fontsize=12)
+            ax.set_ylabel(f"Valores (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+            ax.legend(fontsize=9)
+            ax.grid(True, alpha=0.3)
+            plt.setp(ax.get_xticklabels(), rotation=30, ha="right")
+            fig.tight_layout()
             ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-            st.pyplot(fig)
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
+
+    if not grupo:
+        serie = serie.drop(columns=SIN_GRUPO)
+    with st.expander("Serie remuestreada", expanded=False):
+        mostrar_grilla_paginada(serie, clave, key="ts_grilla", decimals=2, height=400)
+        st.download_button(
+            "⬇️ Descargar Serie (CSV)",
+            csv_dataset_cacheado(serie, clave),
+            file_name="serie_remuestreada.csv",
+            mime="text/csv",
+            key="ts_descarga",
+        )
+
 
+# =========================
+# CORRELACIONES (PARES COMPLETOS)
+# =========================
+METODOS_CORRELACION = {"Pearson": "pearson", "Spearman": "spearman"}
+FILAS_POR_BLOQUE_CORR = 200_000
+MAX_PARES_TABLA = 50
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def matriz_correlacion(_df: pd.DataFrame, version: str, cols: tuple, metodo: str = "pearson"):
+    """
+    Correlación con observaciones completas por par, para todas las columnas a la vez.
+    Con M = máscara de válidos y X = datos con NaN→0, cada término que necesita el par (i, j)
+    sobre las filas válidas en ambas es un producto de matrices:
+        n = MᵀM,  Σx_i|j = XᵀM,  Σx_i²|j = (X²)ᵀM,  Σx_i·x_j = XᵀX.
+    Los productos se hacen en float32 por bloques de filas y se acumulan en float64; antes,
+    cada columna se estandariza (float64) para que la resta de medias no pierda precisión.
+    Spearman usa rangos globales de cada columna (sobre sus filas válidas) y aplica Pearson
+    por pares: es exacto sin faltantes y una aproximación con faltantes, porque el Spearman
+    estricto re-rankea dentro de las filas comunes de cada par.
+    Devuelve (r, n) como arrays p × p.
+    """
+    datos = _df[list(cols)]
+    if metodo == "spearman":
+        datos = datos.rank(method="average")
+    X = datos.to_numpy(dtype="float64", na_value=np.nan)
+    valido = ~np.isnan(X)
+    media = np.nanmean(X, axis=0)
+    desv = np.nanstd(X, axis=0)
+    desv[~(desv > 0)] = 1.0
+    X = np.where(valido, (X - media) / desv, 0.0)
+
+    p = X.shape[1]
+    n = np.zeros((p, p))
+    s = np.zeros((p, p))
+    s2 = np.zeros((p, p))
+    sxy = np.zeros((p, p))
+    for i in range(0, len(X), FILAS_POR_BLOQUE_CORR):
+        Xb = X[i:i + FILAS_POR_BLOQUE_CORR].astype(np.float32)
+        Mb = valido[i:i + FILAS_POR_BLOQUE_CORR].astype(np.float32)
+        n += Mb.T @ Mb
+        s += Xb.T @ Mb
+        s2 += (Xb * Xb).T @ Mb
+        sxy += Xb.T @ Xb
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cov = sxy - s * s.T / n
+        var_i = s2 - s * s / n          # varianza de i sobre las filas válidas en j
+        r = cov / np.sqrt(var_i * var_i.T)
+    r = np.clip(r, -1.0, 1.0)
+    r[n < 3] = np.nan
+    np.fill_diagonal(r, np.where(np.diag(n) >= 3, 1.0, np.nan))
+    return r, n.astype(np.int64)
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def orden_por_clusters(r: np.ndarray) -> np.ndarray:
+    """Orden de las columnas según un clustering jerárquico (enlace promedio) sobre 1 − |r|."""
+    from scipy.cluster.hierarchy import leaves_list, linkage
+    from scipy.spatial.distance import squareform
+
+    if len(r) < 3:
+        return np.arange(len(r))
+    d = 1.0 - np.abs(np.nan_to_num(r, nan=0.0))
+    d = (d + d.T) / 2
+    np.fill_diagonal(d, 0.0)
+    return leaves_list(linkage(squareform(np.clip(d, 0, None), checks=False), method="average"))
+
+
+def pares_mas_correlacionados(r: np.ndarray, n: np.ndarray, cols, min_pares: int, limite: int = MAX_PARES_TABLA) -> pd.DataFrame:
+    i, j = np.triu_indices(len(cols), k=1)
+    rij, nij = r[i, j], n[i, j]
+    ok = ~np.isnan(rij) & (nij >= min_pares)
+    i, j, rij, nij = i[ok], j[ok], rij[ok], nij[ok]
+    top = np.argsort(-np.abs(rij), kind="stable")[:limite]
+    nombres = np.asarray(cols, dtype=object)
+    return pd.DataFrame({
+        "Variable 1": nombres[i[top]],
+        "Variable 2": nombres[j[top]],
+        "Correlación": rij[top],
+        "Pares completos": nij[top],
+    })
+
+
+def seccion_correlaciones(df: pd.DataFrame, version: str):
+    st.header("Correlaciones")
+
+    cols_num = columnas_numericas(df)
+    if len(cols_num) < 2:
+        st.warning("Se necesitan al menos 2 columnas numéricas.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        etiqueta_metodo = st.selectbox("Método", list(METODOS_CORRELACION), key="corr_metodo")
+    with c2:
+        min_pares = st.number_input("Mínimo de pares completos", 3, 1_000_000, 10, key="corr_min_pares")
+    with c3:
+        agrupar = st.toggle("Ordenar por clusters", value=True, key="corr_clusters")
+    excluidas = st.multiselect("Excluir columnas", cols_num, key="corr_excluidas")
+    cols = [c for c in cols_num if c not in excluidas]
+    if len(cols) < 2:
+        st.warning("Deja al menos 2 columnas.")
+        return
+    metodo = METODOS_CORRELACION[etiqueta_metodo]
+
+    inicio = datetime.now()
+    with st.spinner("Calculando correlaciones..."):
+        r, n = matriz_correlacion(df, version, tuple(cols), metodo)
+    r = np.where(n >= min_pares, r, np.nan)
+    orden = orden_por_clusters(r) if agrupar else np.arange(len(cols))
+    ms = (datetime.now() - inicio).total_seconds() * 1000
+    st.caption(
+        f"{format_lat_number(len(cols), decimals=0)} columnas · "
+        f"{format_lat_number(len(cols) * (len(cols) - 1) // 2, decimals=0)} pares "
+        f"({format_lat_number(ms, decimals=0)} ms)"
+        + (" · Spearman con rangos globales: aproximado cuando hay faltantes." if metodo == "spearman" else "")
+    )
+
+    etiquetas = [cols[k] for k in orden]
+    r_ord = r[np.ix_(orden, orden)]
+    titulo = f"Correlación de {etiqueta_metodo} (pares completos)"
+    spec = {"grafico": "correlacion", "version": version, "metodo": metodo, "cols": cols,
+            "min_pares": int(min_pares), "clusters": agrupar}
+    if PLOTLY_AVAILABLE:
+        def construir():
+            fig = go.Figure(go.Heatmap(
+                z=np.round(r_ord, 3), x=etiquetas, y=etiquetas,
+                zmin=-1, zmax=1, colorscale="RdBu", reversescale=True,
+                hovertemplate="%{y} · %{x}<br>r = %{z:.3f}<extra></extra>",
+            ))
+            lado = min(900, max(450, 14 * len(etiquetas)))
+            fig.update_layout(
+                title=titulo, height=lado, separators=".,",
+                xaxis=dict(showticklabels=len(etiquetas) <= 80),
+                yaxis=dict(showticklabels=len(etiquetas) <= 80, autorange="reversed"),
+            )
+            return fig, []
+
+        mostrar_figura_plotly(spec, construir)
     else:
-        data = df[[x_col, y_col]].dropna()
-        data_plot = data.copy()
-        data_plot[y_col] = scale_values(data_plot[y_col].values, factor)
-
-        if PLOTLY_AVAILABLE:
-            fig = px.box(data_plot, x=x_col, y=y_col)
-            fig.update_layout(height=500, yaxis_title=f"{y_col} (en {unit_label})")
-            fig = set_title_with_unit_plotly(fig, f"Box Plot de {y_col} por {x_col}", unit_label)
+        def construir():
+            lado = min(14, max(6, 0.25 * len(etiquetas)))
+            fig, ax = plt.subplots(figsize=(lado, lado))
+            im = ax.imshow(r_ord, cmap="RdBu_r", vmin=-1, vmax=1)
+            if len(etiquetas) <= 80:
+                ax.set_xticks(range(len(etiquetas)), etiquetas, rotation=90, fontsize=7)
+                ax.set_yticks(range(len(etiquetas)), etiquetas, fontsize=7)
+            ax.set_title(titulo, fontsize=14)
+            fig.colorbar(im, ax=ax, fraction=0.046)
+            fig.tight_layout()
+            return fig, []
+
+        mostrar_figura_matplotlib(spec, construir)
+
+    st.subheader("Pares más correlacionados")
+    pares = pares_mas_correlacionados(r, n, cols, int(min_pares))
+    st.dataframe(style_latino(pares, decimals=3), use_container_width=True, hide_index=True)
+
+    matriz = pd.DataFrame(r, index=cols, columns=cols).reset_index(names="Variable")
+    st.download_button(
+        "⬇️ Descargar Matriz de Correlación (CSV)",
+        df_to_csv_bytes(matriz),
+        file_name=f"correlacion_{metodo}.csv",
+        mime="text/csv",
+        key="corr_descarga",
+    )
+
+
+# =========================
+# PRONÓSTICO DE SERIES (ETS / ARIMA / SARIMAX)
+# =========================
+MODELOS_PRONOSTICO = ["ETS", "ARIMA", "SARIMAX"]
+PERIODO_ESTACIONAL = {"h": 24, "D": 7, "W": 52, "M": 12, "Y": 1}
+NIVELES_CONFIANZA = {"80%": 0.20, "90%": 0.10, "95%": 0.05}
+MAX_SERIES_PRONOSTICO = 500
+MIN_OBS_PRONOSTICO = 8
+
+
+def _con_limite_de_tiempo(segundos: float, fn):
+    """Ejecuta fn() cortándola con SIGALRM tras `segundos` (solo en el hilo principal de un proceso Unix)."""
+    if not segundos or not hasattr(signal, "SIGALRM"):
+        return fn()
+
+    def _alarma(signum, frame):
+        raise TimeoutError
+
+    previo = signal.signal(signal.SIGALRM, _alarma)
+    signal.setitimer(signal.ITIMER_REAL, segundos)
+    try:
+        return fn()
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previo)
+
+
+def _iniciar_proceso_pronostico():
+    # Inicializador de cada proceso: importar statsmodels aquí y no dentro del ajuste,
+    # para que el tiempo de importación no consuma el límite de la primera serie.
+    from statsmodels.tsa.exponential_smoothing.ets import ETSModel  # noqa: F401
+    from statsmodels.tsa.statespace.sarimax import SARIMAX  # noqa: F401
+
+
+def _pronosticar_una(clave, inicio: str, valores: np.ndarray, freq: str, spec: dict):
+    # Nivel de módulo para poder ejecutarse en un ProcessPoolExecutor; el límite de tiempo
+    # usa SIGALRM, que funciona porque cada tarea corre en el hilo principal de su proceso.
+    # Los imports quedan fuera de _con_limite_de_tiempo (ya cargados por el inicializador).
+    from statsmodels.tsa.exponential_smoothing.ets import ETSModel
+    from statsmodels.tsa.statespace.sarimax import SARIMAX
+
+    t0 = datetime.now()
+    salida = {"clave": clave, "estado": "ok", "aic": np.nan, "pronostico": None}
+    y = pd.Series(valores, index=pd.period_range(start=inicio, periods=len(valores), freq=freq))
+    h, alfa, s = spec["horizonte"], spec["alfa"], spec["periodo"]
+
+    def ajustar():
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            if spec["modelo"] == "ETS":
+                estacional = spec["estacional"] and s > 1 and y.notna().sum() >= 2 * s
+                modelo = ETSModel(
+                    y.interpolate(limit_direction="both"), error="add",
+                    trend=spec["tendencia"], damped_trend=spec["amortiguada"] and spec["tendencia"] is not None,
+                    seasonal="add" if estacional else None, seasonal_periods=s if estacional else None,
+                ).fit(disp=False)
+                marco = modelo.get_prediction(start=len(y), end=len(y) + h - 1).summary_frame(alpha=alfa)
+                marco = marco.rename(columns={"pi_lower": "inferior", "pi_upper": "superior"})
+            else:
+                estacional = spec["modelo"] == "SARIMAX" and s > 1
+                modelo = SARIMAX(
+                    y, order=spec["orden"],
+                    seasonal_order=tuple(spec["orden_estacional"]) + (s,) if estacional else (0, 0, 0, 0),
+                    trend="c" if spec["orden"][1] == 0 else None,
+                ).fit(disp=False)
+                marco = modelo.get_forecast(h).summary_frame(alpha=alfa)
+                marco = marco.rename(columns={"mean_ci_lower": "inferior", "mean_ci_upper": "superior"})
+            return modelo.aic, marco[["mean", "inferior", "superior"]]
+
+    try:
+        salida["aic"], marco = _con_limite_de_tiempo(spec["limite_segundos"], ajustar)
+        marco.index = marco.index.to_timestamp()
+        salida["pronostico"] = marco
+    except TimeoutError:
+        salida["estado"] = f"tiempo agotado ({spec['limite_segundos']} s)"
+    except Exception as e:
+        salida["estado"] = f"error: {e}"
+    salida["segundos"] = (datetime.now() - t0).total_seconds()
+    return salida
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def pronosticar_series(_serie: pd.DataFrame, clave: str, grupo_col: str, fecha_col: str, valores: tuple, freq: str, spec_json: str):
+    """
+    Un modelo por serie (grupo × variable) sobre la serie ya remuestreada, repartidos en un
+    ProcessPoolExecutor; cada ajuste tiene su propio límite de tiempo y un fallo o un
+    tiempo agotado solo afecta a su serie; si un proceso muere (memoria, señal), las series
+    que no alcanzaron a terminar quedan registradas con error en vez de abortar todo.
+    Devuelve (pronósticos en formato largo, tabla de estado por serie).
+    """
+    spec = json.loads(spec_json)
+    tareas = []
+    for g, datos_g in _serie.groupby(grupo_col, sort=False):
+        inicio = str(pd.Timestamp(datos_g[fecha_col].iloc[0]))
+        for v in valores:
+            y = datos_g[v].to_numpy(dtype="float64")
+            if np.isfinite(y).sum() >= MIN_OBS_PRONOSTICO:
+                tareas.append(((g, v), inicio, y))
+
+    resultados = []
+    workers = max(1, min(len(tareas), os.cpu_count() or 1))
+    with ProcessPoolExecutor(max_workers=workers, initializer=_iniciar_proceso_pronostico) as ex:
+        futuros = {ex.submit(_pronosticar_una, clave_s, ini, y, freq, spec): clave_s for clave_s, ini, y in tareas}
+        for fut in as_completed(futuros):
+            try:
+                resultados.append(fut.result())
+            except BrokenProcessPool:
+                resultados.append({"clave": futuros[fut], "estado": "error: el proceso de ajuste terminó abruptamente",
+                                   "aic": np.nan, "pronostico": None, "segundos": np.nan})
+            except Exception as e:
+                resultados.append({"clave": futuros[fut], "estado": f"error: {e}",
+                                   "aic": np.nan, "pronostico": None, "segundos": np.nan})
+
+    estado, marcos = [], []
+    for r in resultados:
+        g, v = r["clave"]
+        estado.append({grupo_col: g, "variable": v, "estado": r["estado"], "AIC": r["aic"], "segundos": r["segundos"]})
+        if r["pronostico"] is not None:
+            m = r["pronostico"].rename(columns={"mean": "pronostico"}).rename_axis(fecha_col).reset_index()
+            m.insert(0, "variable", v)
+            m.insert(0, grupo_col, g)
+            marcos.append(m)
+    columnas = [grupo_col, "variable", fecha_col, "pronostico", "inferior", "superior"]
+    pronosticos = pd.concat(marcos, ignore_index=True) if marcos else pd.DataFrame(columns=columnas)
+    tabla_estado = pd.DataFrame(estado, columns=[grupo_col, "variable", "estado", "AIC", "segundos"])
+    return pronosticos, tabla_estado.sort_values([grupo_col, "variable"]).reset_index(drop=True)
+
+
+def seccion_pronostico(df: pd.DataFrame, scale_mode: str, version: str):
+    st.subheader("Pronóstico de Series")
+
+    cols_fecha = df.select_dtypes(include=["datetime", "datetimetz"]).columns.tolist()
+    cols_num = columnas_numericas(df)
+    if not cols_fecha:
+        st.info("No hay columnas de fecha. Define una con el tipo 'Fecha' en la configuración de tipos.")
+        return
+    if not cols_num:
+        st.warning("No hay columnas numéricas disponibles.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        fecha_col = st.selectbox("Columna de fecha", cols_fecha, key="fc_fecha")
+        frecuencia = st.selectbox("Frecuencia", list(FRECUENCIAS_REMUESTREO), index=3, key="fc_frecuencia")
+    with c2:
+        valores = st.multiselect("Variables", cols_num, default=cols_num[:1], key="fc_valores")
+        etiqueta_medida = st.selectbox("Agregación", list(MEDIDAS_REMUESTREO), key="fc_agregacion")
+    with c3:
+        grupo = st.selectbox("Una serie por", [SIN_GRUPO] + columnas_no_numericas(df), key="fc_grupo")
+        modelo = st.selectbox("Modelo", MODELOS_PRONOSTICO, key="fc_modelo")
+
+    if not valores:
+        st.info("Selecciona al menos una variable.")
+        return
+    freq = FRECUENCIAS_REMUESTREO[frecuencia]
+    grupo = None if grupo == SIN_GRUPO else grupo
+    grupo_col = grupo or SIN_GRUPO
+
+    d1, d2, d3, d4 = st.columns(4)
+    with d1:
+        horizonte = st.number_input("Horizonte (períodos)", 1, 500, PERIODO_ESTACIONAL[freq] if freq != "Y" else 5, key="fc_horizonte")
+    with d2:
+        periodo = st.number_input("Período estacional", 1, 400, PERIODO_ESTACIONAL[freq], key="fc_periodo")
+    with d3:
+        nivel = st.selectbox("Intervalo", list(NIVELES_CONFIANZA), index=2, key="fc_nivel")
+    with d4:
+        limite = st.number_input("Límite por ajuste (s)", 1, 600, 30, key="fc_limite")
+
+    spec = {
+        "modelo": modelo, "horizonte": int(horizonte), "periodo": int(periodo),
+        "alfa": NIVELES_CONFIANZA[nivel], "limite_segundos": int(limite),
+    }
+    if modelo == "ETS":
+        e1, e2, e3 = st.columns(3)
+        with e1:
+            tendencia = st.selectbox("Tendencia", ["Ninguna", "Aditiva"], index=1, key="fc_tendencia")
+        with e2:
+            amortiguada = st.toggle("Tendencia amortiguada", value=True, key="fc_amortiguada")
+        with e3:
+            estacional = st.toggle("Estacionalidad aditiva", value=periodo > 1, key="fc_estacional")
+        spec.update(tendencia=None if tendencia == "Ninguna" else "add", amortiguada=amortiguada, estacional=estacional)
+    else:
+        o = st.columns(6 if modelo == "SARIMAX" else 3)
+        orden = [int(o[i].number_input(n, 0, 5, v, key=f"fc_{n}")) for i, (n, v) in enumerate([("p", 1), ("d", 1), ("q", 1)])]
+        spec["orden"] = orden
+        if modelo == "SARIMAX":
+            spec["orden_estacional"] = [
+                int(o[3 + i].number_input(n, 0, 2, v, key=f"fc_{n}")) for i, (n, v) in enumerate([("P", 1), ("D", 0), ("Q", 1)])
+            ]
+
+    try:
+        serie = remuestrear_serie(df, version, fecha_col, tuple(valores), freq, grupo, MEDIDAS_REMUESTREO[etiqueta_medida])
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        return
+    n_series = serie[grupo_col].nunique() * len(valores)
+    if n_series > MAX_SERIES_PRONOSTICO:
+        st.warning(
+            f"Hay {format_lat_number(n_series, decimals=0)} series; el máximo es "
+            f"{format_lat_number(MAX_SERIES_PRONOSTICO, decimals=0)}. Usa filtros globales o menos variables."
+        )
+        return
+
+    clave = version_dataset(version, fecha_col, valores, freq, grupo, etiqueta_medida)
+    spec_json = json.dumps(spec, sort_keys=True)
+    # ajustar cientos de modelos es caro: solo al pulsar, y luego se mantiene mientras no cambie la configuración
+    if not st.button("Pronosticar", type="primary", key="fc_ejecutar") and st.session_state.get("fc_ultimo") != clave + spec_json:
+        st.caption(f"{format_lat_number(n_series, decimals=0)} series listas para pronosticar.")
+        return
+    st.session_state["fc_ultimo"] = clave + spec_json
+    inicio = datetime.now()
+    with st.spinner(f"Ajustando {format_lat_number(n_series, decimals=0)} modelos en paralelo..."):
+        pronosticos, estado = pronosticar_series(serie, clave, grupo_col, fecha_col, tuple(valores), freq, spec_json)
+    seg = (datetime.now() - inicio).total_seconds()
+    ok = int((estado["estado"] == "ok").sum())
+    st.caption(
+        f"{format_lat_number(ok, decimals=0)} de {format_lat_number(len(estado), decimals=0)} series ajustadas · "
+        f"{format_lat_number(seg, decimals=1)} s de reloj · "
+        f"{format_lat_number(estado['segundos'].sum(), decimals=1)} s de cómputo"
+    )
+    if pronosticos.empty:
+        st.warning("Ninguna serie pudo ajustarse.")
+        st.dataframe(estado, use_container_width=True, hide_index=True)
+        return
+
+    claves = pronosticos[[grupo_col, "variable"]].drop_duplicates()
+    etiquetas = [f"{g} · {v}" if grupo else v for g, v in claves.itertuples(index=False)]
+    elegida = st.selectbox("Serie a graficar", etiquetas, key="fc_serie")
+    g, v = claves.iloc[etiquetas.index(elegida)]
+    hist = serie.loc[serie[grupo_col] == g, [fecha_col, v]]
+    fut = pronosticos[(pronosticos[grupo_col] == g) & (pronosticos["variable"] == v)]
+
+    factor, unit_label = get_scale_factor_and_label(
+        scale_mode, np.nanmax(np.abs(np.r_[hist[v].to_numpy(dtype="float64"), fut["superior"].to_numpy(dtype="float64")]))
+    )
+    titulo = f"Pronóstico {modelo} de {elegida}"
+    spec_grafico = {"grafico": "pronostico", "clave": clave, "spec": spec, "serie": elegida, "escala": scale_mode}
+    if PLOTLY_AVAILABLE:
+        def construir():
+            fig = go.Figure()
+            fig.add_trace(go.Scatter(x=hist[fecha_col], y=scale_values(hist[v].values, factor), mode="lines", name="Histórico"))
+            fig.add_trace(go.Scatter(
+                x=np.r_[fut[fecha_col].values, fut[fecha_col].values[::-1]],
+                y=np.r_[scale_values(fut["superior"].values, factor), scale_values(fut["inferior"].values, factor)[::-1]],
+                fill="toself", line=dict(width=0), opacity=0.25, name=f"Intervalo {nivel}", hoverinfo="skip",
+            ))
+            fig.add_trace(go.Scatter(
+                x=fut[fecha_col], y=scale_values(fut["pronostico"].values, factor), mode="lines", name="Pronóstico",
+                line=dict(dash="dash"),
+            ))
+            fig.update_layout(height=500, xaxis_title=fecha_col, yaxis_title=f"{v} (en {unit_label})")
+            fig = set_title_with_unit_plotly(fig, titulo, unit_label)
             fig = apply_plotly_latino_format(fig, decimals=0)
-            st.plotly_chart(fig, use_container_width=True, config=PLOTLY_CONFIG)
-        else:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            data_plot.boxplot(column=y_col, by=x_col, ax=ax)
-            plt.suptitle("")
-            set_title_with_unit_matplotlib(ax, f"Box Plot de {y_col} por {x_col}", unit_label)
-            plt.xticks(rotation=45, ha="right")
+            return fig, []
+
+        mostrar_figura_plotly(spec_grafico, construir)
+    else:
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            ax.plot(hist[fecha_col], scale_values(hist[v].values, factor), label="Histórico", linewidth=1.5)
+            ax.fill_between(fut[fecha_col], scale_values(fut["inferior"].values, factor), scale_values(fut["superior"].values, factor),
+                            alpha=0.25, label=f"Intervalo {nivel}")
+            ax.plot(fut[fecha_col], scale_values(fut["pronostico"].values, factor), "--", label="Pronóstico", linewidth=2)
+            ax.set_xlabel(fecha_col, fontsize=12)
+            ax.set_ylabel(f"{v} (en {unit_label})", fontsize=12)
+            set_title_with_unit_matplotlib(ax, titulo, unit_label)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
             ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-            st.pyplot(fig)
+            fig.tight_layout()
+            return fig, []
+
+        mostrar_figura_matplotlib(spec_grafico, construir)
+
+    with st.expander("Estado de los ajustes", expanded=False):
+        st.dataframe(style_latino(estado, decimals=2), use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Descargar Pronósticos (CSV)",
+        df_to_csv_bytes(pronosticos),
+        file_name="pronosticos.csv",
+        mime="text/csv",
+        key="fc_descarga",
+    )
+
+
+# =========================
+# DETECCIÓN DE OUTLIERS (MÉTODOS ROBUSTOS POR GRUPO)
+# =========================
+METODOS_OUTLIERS = ["Mediana/MAD", "Cercas IQR", "Z-score móvil", "IsolationForest"]
+UMBRAL_OUTLIERS = {"Mediana/MAD": 3.5, "Cercas IQR": 1.5, "Z-score móvil": 3.0}
+COLUMNA_OUTLIER = "es_outlier"
+MIN_FILAS_ISOLATION = 20
+MAX_MODELOS_ISOLATION = 32
+
+
+def _cuantiles_por_grupo(X: pd.DataFrame, codigos: np.ndarray, n_grupos: int, version: str, medidas: tuple) -> dict:
+    """Mediana/percentiles por grupo con el motor común de agregación. Devuelve {medida: G × columnas}."""
+    tmp = X.assign(_grupo_outlier=codigos)
+    res = agregar_por_grupos(tmp, version, ("_grupo_outlier",), tuple(X.columns), medidas)
+    res = res.reindex(np.arange(n_grupos))
+    return {m: res.xs(m, axis=1, level="medida")[list(X.columns)].to_numpy() for m in medidas}
+
+
+def _zscore_movil(X: np.ndarray, codigos: np.ndarray, orden: np.ndarray, ventana: int, centro: np.ndarray) -> np.ndarray:
+    """
+    |z| de cada lectura frente a las `ventana` lecturas anteriores de su grupo (sin incluirse):
+    sumas móviles de x, x² y conteos con el mismo kernel de sumas acumuladas de Series de Tiempo.
+    `centro` (filas × columnas) es la mediana del grupo de cada fila: restarla antes de acumular
+    evita que grupos con niveles distintos inflen el total acumulado de x² y que la resta
+    de la ventana se cancele (la varianza de la ventana no cambia al trasladar los datos).
+    """
+    Xo = (X - np.nan_to_num(centro))[orden]
+    co = codigos[orden]
+    cambios = np.r_[True, co[1:] != co[:-1]]
+    inicio_grupo = np.maximum.accumulate(np.where(cambios, np.arange(len(co)), 0))
+    validos = np.where(np.isnan(Xo), np.nan, 1.0)
+    suma, _ = _ventana_movil(np.hstack([Xo, Xo * Xo, validos]), inicio_grupo, ventana, 2)
+    v = X.shape[1]
+    s1, s2, n = suma[:, :v], suma[:, v:2 * v], suma[:, 2 * v:]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        media = s1 / n
+        desv = np.sqrt(np.maximum(s2 / n - media ** 2, 0) * n / (n - 1))
+    # ventana de las lecturas anteriores: el valor en i-1, si sigue en el mismo grupo
+    media_prev = np.vstack([np.full((1, v), np.nan), media[:-1]])
+    desv_prev = np.vstack([np.full((1, v), np.nan), desv[:-1]])
+    media_prev[cambios] = np.nan
+    z_ordenado = np.abs(Xo - media_prev) / np.where(desv_prev > 0, desv_prev, np.nan)
+    z = np.empty_like(z_ordenado)
+    z[orden] = z_ordenado
+    return z
+
+
+def _isolation_forest_lote(bloques, contaminacion: float, semilla: int):
+    # Nivel de módulo para poder ejecutarse en un ProcessPoolExecutor: un bosque por grupo.
+    from sklearn.ensemble import IsolationForest
+
+    salida = []
+    for X in bloques:
+        modelo = IsolationForest(n_estimators=100, contamination=contaminacion, random_state=semilla)
+        salida.append(modelo.fit_predict(X) == -1)
+    return salida
+
+
+def _isolation_forest_por_grupo(X: np.ndarray, codigos: np.ndarray, contaminacion: float) -> np.ndarray:
+    """IsolationForest multivariado por grupo; los grupos se reparten en lotes entre procesos."""
+    completas = ~np.isnan(X).any(axis=1) & (codigos >= 0)
+    filas = np.flatnonzero(completas)
+    orden = filas[np.argsort(codigos[filas], kind="stable")]
+    grupos, inicios, tamanos = np.unique(codigos[orden], return_index=True, return_counts=True)
+    aptos = [(i, t) for i, t in zip(inicios, tamanos) if t >= MIN_FILAS_ISOLATION]
+    marca = np.zeros(len(X), dtype=bool)
+    if not aptos:
+        return marca
+
+    workers = max(1, min(len(aptos), os.cpu_count() or 1))
+    if workers == 1:
+        for (i, t), m in zip(aptos, _isolation_forest_lote([X[orden[i:i + t]] for i, t in aptos], contaminacion, 0)):
+            marca[orden[i:i + t]] = m
+        return marca
+
+    por_lote = -(-len(aptos) // (4 * workers))
+    lotes = [aptos[i:i + por_lote] for i in range(0, len(aptos), por_lote)]
+    with ProcessPoolExecutor(max_workers=workers) as ex:
+        futuros = {ex.submit(_isolation_forest_lote, [X[orden[i:i + t]] for i, t in lote], contaminacion, 0): lote for lote in lotes}
+        for fut in as_completed(futuros):
+            for (i, t), m in zip(futuros[fut], fut.result()):
+                marca[orden[i:i + t]] = m
+    return marca
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def detectar_outliers(_df: pd.DataFrame, version: str, valores: tuple, grupo, metodo: str,
+                      umbral: float = 3.5, orden_col=None, ventana: int = 24, contaminacion: float = 0.01) -> pd.DataFrame:
+    """
+    Marca outliers por grupo y variable, sin bucles por grupo en los métodos robustos:
+    - Mediana/MAD: |x − mediana| / (1,4826·MAD) > umbral;
+    - Cercas IQR: fuera de [Q1 − umbral·IQR, Q3 + umbral·IQR];
+    - Z-score móvil: |z| > umbral frente a las `ventana` lecturas anteriores (orden por `orden_col`);
+    - IsolationForest: multivariado sobre todas las `valores`, un modelo por grupo en paralelo;
+      con más de MAX_MODELOS_ISOLATION grupos, un único bosque sobre las variables
+      estandarizadas dentro de cada grupo con mediana/MAD.
+    Devuelve un DataFrame booleano alineado con `_df` (una columna por variable, o
+    'multivariado' para IsolationForest).
+    """
+    X = _df[list(valores)].astype("float64")
+    if grupo:
+        codigos, etiquetas = pd.factorize(_df[grupo])
+    else:
+        codigos, etiquetas = np.zeros(len(_df), dtype=np.int64), [None]
+    codigos = codigos.astype(np.int64)
+    G = len(etiquetas)
+    clave = version_dataset(version, "outliers", grupo, valores)
+
+    Xn = X.to_numpy()
+    if metodo == "IsolationForest":
+        if G > MAX_MODELOS_ISOLATION:
+            med = _cuantiles_por_grupo(X, codigos, G, clave, ("median",))["median"]
+            desvios = pd.DataFrame(np.abs(Xn - med[codigos]), columns=X.columns)
+            mad = _cuantiles_por_grupo(desvios, codigos, G, version_dataset(clave, "mad"), ("median",))["median"]
+            escala = np.where(mad > 0, 1.4826 * mad, 1.0)
+            Xn = (Xn - med[codigos]) / escala[codigos]
+            codigos_modelo = np.where(codigos >= 0, 0, -1)
+        else:
+            codigos_modelo = codigos
+        return pd.DataFrame({"multivariado": _isolation_forest_por_grupo(Xn, codigos_modelo, contaminacion)})
+
+    if metodo == "Mediana/MAD":
+        med = _cuantiles_por_grupo(X, codigos, G, clave, ("median",))["median"]
+        desvios = pd.DataFrame(np.abs(Xn - med[codigos]), columns=X.columns)
+        mad = _cuantiles_por_grupo(desvios, codigos, G, version_dataset(clave, "mad"), ("median",))["median"]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            marca = desvios.to_numpy() / (1.4826 * mad[codigos]) > umbral
+    elif metodo == "Cercas IQR":
+        q = _cuantiles_por_grupo(X, codigos, G, clave, ("p25", "p75"))
+        iqr = q["p75"] - q["p25"]
+        marca = (Xn < (q["p25"] - umbral * iqr)[codigos]) | (Xn > (q["p75"] + umbral * iqr)[codigos])
+    else:
+        orden_extra = _df[orden_col].to_numpy() if orden_col else np.arange(len(_df))
+        orden = np.lexsort((orden_extra, codigos))
+        med = _cuantiles_por_grupo(X, codigos, G, clave, ("median",))["median"]
+        marca = _zscore_movil(Xn, codigos, orden, ventana, med[codigos]) > umbral
+
+    marca &= (codigos >= 0)[:, None]
+    return pd.DataFrame(marca, columns=list(valores))
+
+
+def anexar_marcas_outliers(df: pd.DataFrame, version: str):
+    """
+    Si se guardaron marcas para esta versión del dataset, las agrega como columna booleana
+    COLUMNA_OUTLIER (disponible para los filtros globales y todas las secciones).
+    """
+    guardadas = st.session_state.get("outliers_guardados")
+    if not guardadas or guardadas["version"] != version or len(guardadas["marca"]) != len(df):
+        return df, version
+    return df.assign(**{COLUMNA_OUTLIER: guardadas["marca"]}), version_dataset(version, COLUMNA_OUTLIER, guardadas["clave"])
+
+
+def seccion_outliers(df: pd.DataFrame, version: str):
+    st.header("Detección de Outliers")
+    st.caption(
+        "Se calcula sobre el dataset completo (antes de los filtros globales) para que la marca pueda "
+        "guardarse como columna y usarse luego como filtro."
+    )
+
+    cols_num = [c for c in columnas_numericas(df) if c != COLUMNA_OUTLIER]
+    if not cols_num:
+        st.warning("No hay columnas numéricas disponibles.")
+        return
+
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        metodo = st.selectbox("Método", METODOS_OUTLIERS, key="out_metodo")
+    with c2:
+        valores = st.multiselect("Variables", cols_num, default=cols_num[:1], key="out_valores")
+    with c3:
+        grupo = st.selectbox("Por grupo", ["(ninguno)"] + [c for c in df.columns if c not in valores], key="out_grupo")
+    grupo = None if grupo == "(ninguno)" else grupo
+
+    umbral, orden_col, ventana, contaminacion = 3.5, None, 24, 0.01
+    d1, d2 = st.columns(2)
+    if metodo == "IsolationForest":
+        with d1:
+            contaminacion = st.slider("Proporción esperada de outliers", 0.001, 0.2, 0.01, 0.001, format="%.3f", key="out_contaminacion")
+        if grupo and df[grupo].nunique() > MAX_MODELOS_ISOLATION:
+            with d2:
+                st.caption(
+                    f"Más de {MAX_MODELOS_ISOLATION} grupos: se entrena un único bosque sobre las variables "
+                    "estandarizadas dentro de cada grupo (mediana/MAD)."
+                )
+    else:
+        with d1:
+            umbral = st.slider("Umbral", 0.5, 10.0, UMBRAL_OUTLIERS[metodo], 0.1, key=f"out_umbral_{metodo}")
+        if metodo == "Z-score móvil":
+            with d2:
+                opciones_orden = ["(orden de filas)"] + [c for c in df.columns if c not in valores and c != grupo]
+                orden_col = st.selectbox("Ordenar por", opciones_orden, key="out_orden")
+                orden_col = None if orden_col == "(orden de filas)" else orden_col
+                ventana = st.slider("Ventana (lecturas anteriores)", 3, 500, 24, key="out_ventana")
+
+    if not valores:
+        st.info("Selecciona al menos una variable.")
+        return
+
+    inicio = datetime.now()
+    try:
+        with st.spinner("Detectando outliers..."):
+            marcas = detectar_outliers(df, version, tuple(valores), grupo, metodo, umbral, orden_col, ventana, contaminacion)
+    except ImportError:
+        st.error("Para usar IsolationForest, instala: pip install scikit-learn")
+        return
+    seg = (datetime.now() - inicio).total_seconds()
+    marca = marcas.to_numpy().any(axis=1)
+
+    m1, m2, m3 = st.columns(3)
+    m1.metric("Lecturas marcadas", format_lat_number(int(marca.sum()), decimals=0))
+    m2.metric("Porcentaje", f"{format_lat_number(100 * marca.mean() if len(marca) else 0, decimals=2)}%")
+    m3.metric("Tiempo", f"{format_lat_number(seg, decimals=2)} s")
+
+    resumen = marcas.groupby(df[grupo].to_numpy() if grupo else np.zeros(len(df), dtype=int)).sum()
+    if grupo:
+        resumen = resumen.rename_axis(grupo).reset_index()
+        resumen["Total marcadas"] = resumen[list(marcas.columns)].sum(axis=1)
+        resumen = resumen.sort_values("Total marcadas", ascending=False)
+        st.subheader("Outliers por grupo")
+        st.dataframe(style_latino(resumen, decimals=0), use_container_width=True, hide_index=True, height=300)
+
+    st.subheader("Lecturas marcadas")
+    clave_marcas = version_dataset(version, metodo, valores, grupo, umbral, orden_col, ventana, contaminacion)
+    marcadas = df[marca].reset_index(drop=True)
+    mostrar_grilla_paginada(marcadas, clave_marcas, key="out_grilla", decimals=2, height=400)
+
+    b1, b2, b3 = st.columns(3)
+    with b1:
+        st.download_button(
+            "⬇️ Descargar Outliers (CSV)",
+            csv_dataset_cacheado(marcadas, clave_marcas),
+            file_name="outliers.csv",
+            mime="text/csv",
+            key="out_descarga",
+        )
+    with b2:
+        if st.button(f"Guardar como columna '{COLUMNA_OUTLIER}'", key="out_guardar"):
+            st.session_state["outliers_guardados"] = {"version": version, "clave": clave_marcas, "marca": marca}
+            st.rerun()
+    with b3:
+        guardadas = st.session_state.get("outliers_guardados")
+        if guardadas and guardadas["version"] == version:
+            if st.button(f"Quitar columna '{COLUMNA_OUTLIER}'", key="out_quitar"):
+                del st.session_state["outliers_guardados"]
+                st.rerun()
+            st.caption(f"La columna '{COLUMNA_OUTLIER}' está disponible en Filtros Globales y en todas las secciones.")
 
 
 # =========================
 # PROYECCIONES Y ECONOMETRÍA
 # =========================
-def seccion_proyecciones(df: pd.DataFrame, scale_mode: str):
+LOESS_FRAC = 0.66
+LOESS_PUNTOS_AJUSTE = {"2.000": 2_000, "5.000": 5_000, "20.000": 20_000, "50.000": 50_000, "Todos": None}
+LOESS_PUNTOS_CONTROL = 100
+LOESS_EXACTO_MAX = 20_000  # sobre esto, LOESS exacto con iteraciones robustas tarda minutos
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def ajustar_loess(_x: np.ndarray, _y: np.ndarray, version: str, x_col: str, y_col: str,
+                  frac: float = LOESS_FRAC, iteraciones: int = 3, delta_rel: float = 0.01, max_puntos=5_000) -> dict:
+    """
+    LOESS escalable. Tres aproximaciones sobre el LOESS exacto de statsmodels:
+    - `delta`: solo se ajusta localmente cada delta_rel·rango(x) y se interpola linealmente entre medio;
+    - si hay más de `max_puntos` filas, el ajuste se hace sobre una submuestra equiespaciada
+      en el orden de x (conserva la distribución de x);
+    - la curva resultante se evalúa en todas las filas con np.interp.
+    El error frente al LOESS exacto se mide en LOESS_PUNTOS_CONTROL cuantiles de x usando
+    todas las filas; como el exacto con iteraciones robustas es justamente el costo que se
+    evita, la comparación usa la variante sin iteraciones robustas (mismas aproximaciones).
+    Devuelve predicciones en el orden de x (`orden`) y el resumen del error.
+    """
+    from statsmodels.nonparametric.smoothers_lowess import lowess
+
+    inicio = datetime.now()
+    orden = np.argsort(_x, kind="stable")
+    xs, ys = _x[orden].astype("float64"), _y[orden].astype("float64")
+    n = len(xs)
+    rango = float(xs[-1] - xs[0])
+
+    def _aproximado(it):
+        if max_puntos and n > max_puntos:
+            sel = np.unique(np.linspace(0, n - 1, max_puntos).round().astype(np.int64))
+            xa, ya = xs[sel], ys[sel]
+        else:
+            xa, ya = xs, ys
+        curva = lowess(ya, xa, frac=frac, it=it, delta=delta_rel * rango, return_sorted=True)
+        return curva, len(xa)
+
+    curva, puntos_ajuste = _aproximado(iteraciones)
+    pred = np.interp(xs, curva[:, 0], curva[:, 1])
+    segundos = (datetime.now() - inicio).total_seconds()
+
+    control = np.unique(np.quantile(xs, np.linspace(0.01, 0.99, LOESS_PUNTOS_CONTROL)))
+    exacto = lowess(ys, xs, frac=frac, it=0, delta=0.0, xvals=control)
+    curva0 = curva if iteraciones == 0 else _aproximado(0)[0]
+    aprox = np.interp(control, curva0[:, 0], curva0[:, 1])
+    dif = np.abs(aprox - exacto)
+    escala = float(np.std(ys)) or 1.0
+
+    return {
+        "orden": orden,
+        "pred": pred,
+        "puntos_ajuste": puntos_ajuste,
+        "segundos": segundos,
+        "error_max": float(np.nanmax(dif)),
+        "error_medio": float(np.nanmean(dif)),
+        "error_rel": float(np.nanmax(dif)) / escala,
+    }
+
+
+def _controles_loess(n: int):
+    """Parámetros del LOESS escalable: (frac, iteraciones, delta_rel, max_puntos)."""
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        frac = st.slider("Fracción (frac)", 0.05, 1.0, LOESS_FRAC, 0.01, key="loess_frac")
+    with c2:
+        iteraciones = st.slider("Iteraciones robustas", 0, 3, 3, key="loess_it")
+    with c3:
+        delta_pct = st.slider(
+            "Delta (% del rango de X)", 0.0, 5.0, 1.0, 0.1, key="loess_delta",
+            help="Se ajusta localmente cada delta y se interpola entre medio. 0 = ajustar en cada punto.",
+        )
+    with c4:
+        etiqueta = st.selectbox("Puntos de ajuste", list(LOESS_PUNTOS_AJUSTE), index=1, key="loess_puntos")
+    max_puntos = LOESS_PUNTOS_AJUSTE[etiqueta]
+    if delta_pct == 0 and iteraciones > 0 and min(n, max_puntos or n) > LOESS_EXACTO_MAX:
+        st.warning(
+            "LOESS exacto (delta 0) con iteraciones robustas sobre más de "
+            f"{format_lat_number(LOESS_EXACTO_MAX, decimals=0)} puntos puede tardar minutos."
+        )
+    return frac, iteraciones, delta_pct / 100.0, max_puntos
+
+
+GRADO_MAX_COMPARACION = 5
+PLIEGUES_CV = {"Sin validación cruzada": 0, "5 pliegues": 5, "10 pliegues": 10}
+
+
+def _ajustes_anidados(x: np.ndarray, y: np.ndarray, grado_max: int, centro: float, escala: float):
+    """
+    Todos los polinomios de grado 1..grado_max con una sola QR de la Vandermonde más ancha
+    (x estandarizada para que esté bien condicionada). Como las primeras k columnas de Q
+    generan las primeras k de la Vandermonde, el modelo de grado k-1 es Q[:, :k] @ (Qᵀy)[:k].
+    Si X tiene pocos valores distintos, la Vandermonde pierde rango: desde la primera columna
+    con |R_jj| ≤ tol·max|R_jj| (tol como el rcond de np.polyfit) los grados no son estimables
+    y no se ajustan. Devuelve (betas en la base estandarizada, ajustados n × grado estimable,
+    grado estimable).
+    """
+    from scipy.linalg import solve_triangular
+
+    z = (x - centro) / escala
+    V = np.vander(z, grado_max + 1, increasing=True)
+    Q, R = np.linalg.qr(V)
+    diag = np.abs(np.diag(R))
+    tol = max(V.shape) * np.finfo(float).eps
+    deficientes = np.flatnonzero(diag <= tol * diag.max())
+    grado_estimable = min(grado_max, int(deficientes[0]) - 1) if len(deficientes) else grado_max
+
+    qty = Q.T @ y
+    betas, ajustados = [], np.empty((len(y), max(grado_estimable, 0)))
+    acumulado = Q[:, 0] * qty[0]
+    for grado in range(1, grado_estimable + 1):
+        k = grado + 1
+        acumulado = acumulado + Q[:, grado] * qty[grado]
+        ajustados[:, grado - 1] = acumulado
+        betas.append(solve_triangular(R[:k, :k], qty[:k]))
+    return betas, ajustados, grado_estimable
+
+
+def _cv_pliegue(x_ent, y_ent, x_prueba, y_prueba, grado_max: int, centro: float, escala: float):
+    # Nivel de módulo para poder ejecutarse en un ProcessPoolExecutor: ECM de prueba por grado
+    # (NaN para los grados que no son estimables con las filas de entrenamiento del pliegue).
+    betas, _, _ = _ajustes_anidados(x_ent, y_ent, grado_max, centro, escala)
+    z = (x_prueba - centro) / escala
+    ecm = [float(np.mean((y_prueba - np.polynomial.polynomial.polyval(z, b)) ** 2)) for b in betas]
+    return ecm + [np.nan] * (grado_max - len(betas))
+
+
+def validacion_cruzada(x: np.ndarray, y: np.ndarray, grado_max: int, pliegues: int, centro: float, escala: float):
+    """RMSE de validación cruzada K-fold por grado; los pliegues corren en paralelo (un proceso por pliegue)."""
+    asignacion = np.random.default_rng(0).permutation(len(x)) % pliegues
+    tareas = [
+        (x[asignacion != f], y[asignacion != f], x[asignacion == f], y[asignacion == f], grado_max, centro, escala)
+        for f in range(pliegues)
+    ]
+    workers = min(pliegues, os.cpu_count() or 1)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as ex:
+            ecm = list(ex.map(_cv_pliegue, *zip(*tareas)))
+    else:
+        ecm = [_cv_pliegue(*t) for t in tareas]
+    pesos = np.bincount(asignacion, minlength=pliegues)
+    return np.sqrt(np.average(np.array(ecm), axis=0, weights=pesos))
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def comparar_modelos(_x: np.ndarray, _y: np.ndarray, version: str, x_col: str, y_col: str,
+                     grado_max: int = GRADO_MAX_COMPARACION, pliegues: int = 0) -> dict:
+    """
+    Lineal y polinomios hasta `grado_max` en una pasada (ver _ajustes_anidados), con R², RMSE,
+    AIC y BIC (log-verosimilitud gaussiana completa, como statsmodels) y RMSE de validación
+    cruzada opcional. Solo entran los grados estimables (ver _ajustes_anidados). Devuelve la
+    tabla, los ajustados por grado, los coeficientes en X (de mayor a menor grado, como
+    np.polyfit), el grado estimable y el número de valores distintos de X.
+    """
+    x, y = _x.astype("float64"), _y.astype("float64")
+    n = len(y)
+    centro, escala = float(np.mean(x)), float(np.std(x)) or 1.0
+    betas, ajustados, grado_estimable = _ajustes_anidados(x, y, grado_max, centro, escala)
+    grados = np.arange(1, grado_estimable + 1)
+
+    scr = ((y[:, None] - ajustados) ** 2).sum(axis=0)
+    sct = float(((y - y.mean()) ** 2).sum())
+    k = grados + 1
+    llf = -n / 2 * (np.log(2 * np.pi) + np.log(scr / n) + 1)
+    tabla = pd.DataFrame({
+        "Modelo": ["Lineal" if g == 1 else f"Polinomial grado {g}" for g in grados],
+        "Grado": grados,
+        "Parámetros": k,
+        "R²": 1 - scr / sct if sct > 0 else np.nan,
+        "RMSE": np.sqrt(scr / n),
+        "AIC": -2 * llf + 2 * k,
+        "BIC": -2 * llf + k * np.log(n),
+    })
+    if pliegues and grado_estimable:
+        tabla[f"RMSE CV ({pliegues} pliegues)"] = validacion_cruzada(x, y, grado_estimable, pliegues, centro, escala)
+
+    dominio = [centro - escala, centro + escala]
+    coeficientes = [
+        np.polynomial.Polynomial(b, domain=dominio, window=[-1, 1]).convert().coef[::-1] for b in betas
+    ]
+    return {
+        "tabla": tabla,
+        "ajustados": ajustados,
+        "coeficientes": coeficientes,
+        "grado_estimable": grado_estimable,
+        "valores_distintos": int(len(np.unique(x))) if grado_estimable < grado_max else None,
+    }
+
+
+def _aviso_rango(ajuste: dict, grado: int) -> str:
+    """Explica por qué los grados desde grado_estimable + 1 hasta `grado` no se ajustaron."""
+    desde = ajuste["grado_estimable"] + 1
+    grados = f"grado {desde}" if desde == grado else f"grados {desde} a {grado}"
+    distintos = ajuste["valores_distintos"]
+    texto_x = "un único valor" if distintos == 1 else f"solo {format_lat_number(distintos, decimals=0)} valores distintos"
+    return (
+        f"X tiene {texto_x}: "
+        f"los polinomios de {grados} no son estimables (la matriz de diseño pierde rango) y se omiten."
+    )
+
+
+def _ecuacion_polinomio(coeffs) -> str:
+    grado = len(coeffs) - 1
+    if grado == 1:
+        return f"Y = {coeffs[0]:.4f}·X + {coeffs[1]:.4f}"
+    return "Y = " + " + ".join([f"{coeffs[i]:.4f}·X^{grado-i}" for i in range(len(coeffs))])
+
+
+TIPOS_BANDA = ["σ de residuos", "Bootstrap (pares)"]
+NIVELES_BOOTSTRAP = {"90%": 0.10, "95%": 0.05, "99%": 0.01}
+REPLICAS_POR_BLOQUE = 64
+MEMORIA_BLOQUE_BOOTSTRAP = 64 * 2**20  # bytes de pesos por bloque de réplicas
+MEMORIA_TRAMO_BOOTSTRAP = 2 * 2**20  # bytes de potencias por tramo de filas: cabe en caché
+MEMORIA_BOOTSTRAP = 512 * 2**20  # tope para todos los bloques en curso a la vez
+PUNTOS_BANDA = 200
+
+
+def _bloque_bootstrap(V: np.ndarray, y: np.ndarray, Vg: np.ndarray, replicas: int, semilla) -> np.ndarray:
+    """
+    `replicas` remuestreos de filas a la vez. Remuestrear n filas con reposición equivale a
+    pesos de conteo multinomiales (n; 1/n, …, 1/n); cada fila de pesos se sortea con un
+    bincount de n índices (mucho más rápido que rng.multinomial con n categorías) directo
+    sobre la matriz de pesos (replicas × n), sin matriz de índices. Como V es de Vandermonde,
+    X'WX[a, b] = Σ w·z^(a+b): basta acumular las 2k − 1 sumas de potencias (una matriz de
+    Hankel) y X'Wy, por tramos de filas, con productos de matrices de los pesos contra las
+    potencias (tramo × (2k − 1)) y V·y (tramo × k) armadas ahí y acotadas por
+    MEMORIA_TRAMO_BOOTSTRAP sea cual sea el grado. Los coeficientes salen de un
+    np.linalg.solve por lote. Devuelve las curvas en la grilla (replicas × puntos).
+    """
+    n, k = V.shape
+    rng = np.random.default_rng(semilla)
+    W = np.empty((replicas, n))
+    for r in range(replicas):
+        W[r] = np.bincount(rng.integers(0, n, size=n), minlength=n)
+
+    # por fila del tramo: 2k − 1 potencias + k de V·y + la columna de pesos copiada
+    filas = max(1, MEMORIA_TRAMO_BOOTSTRAP // (8 * (3 * k + replicas)))
+    momentos = np.zeros((replicas, 2 * k - 1))
+    Xty = np.zeros((replicas, k))
+    for i in range(0, n, filas):
+        Vt = V[i:i + filas]
+        Wt = W[:, i:i + filas]
+        # potencias z^0..z^(k−1) de V y z^k..z^(2k−2) como z^a · z^(k−1)
+        momentos += Wt @ np.hstack([Vt, Vt[:, 1:] * Vt[:, -1:]])
+        Xty += Wt @ (Vt * y[i:i + filas, None])
+    XtX = momentos[:, np.add.outer(np.arange(k), np.arange(k))]
+    beta = np.linalg.solve(XtX + 1e-12 * np.eye(k), Xty[:, :, None])[:, :, 0]
+    return beta @ Vg.T
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def bandas_bootstrap(_x: np.ndarray, _y: np.ndarray, version: str, x_col: str, y_col: str,
+                     grado: int, replicas: int = 1000, alfa: float = 0.05) -> dict:
+    """
+    Bandas de confianza de la curva polinomial por bootstrap de pares (remuestreo de filas),
+    válidas con heterocedasticidad. Las réplicas se reparten en bloques entre hilos (los
+    productos de NumPy liberan el GIL) con semillas independientes, así el resultado no
+    depende del número de núcleos. El tamaño del bloque sale de MEMORIA_BLOQUE_BOOTSTRAP
+    (hasta REPLICAS_POR_BLOQUE réplicas) y los hilos, de MEMORIA_BOOTSTRAP: con n grande
+    los bloques se achican en vez de crecer la memoria. Fuera de los bloques solo se
+    guardan V y la grilla (n × k): los productos cruzados se arman por tramo en cada bloque.
+    - banda puntual: percentiles α/2 y 1−α/2 de las réplicas en cada punto de la grilla;
+    - banda simultánea (sup-t): ajuste ± c·se, con c el cuantil 1−α del máximo
+      |réplica − ajuste| / se sobre la grilla; cubre toda la curva a la vez.
+    """
+    x, y = _x.astype("float64"), _y.astype("float64")
+    centro, escala = float(np.mean(x)), float(np.std(x)) or 1.0
+    V = np.vander((x - centro) / escala, grado + 1, increasing=True)
+    grilla = np.linspace(x.min(), x.max(), PUNTOS_BANDA)
+    Vg = np.vander((grilla - centro) / escala, grado + 1, increasing=True)
+    ajuste = Vg @ np.linalg.lstsq(V, y, rcond=None)[0]
+
+    n, k = V.shape
+    # pesos float64: 8 bytes por fila y réplica; cada bloque en curso suma además un tramo de filas
+    por_bloque = max(1, min(REPLICAS_POR_BLOQUE, MEMORIA_BLOQUE_BOOTSTRAP // (8 * n)))
+    hilos = max(1, min(os.cpu_count() or 1, MEMORIA_BOOTSTRAP // (8 * n * por_bloque + MEMORIA_TRAMO_BOOTSTRAP)))
+    bloques = [min(por_bloque, replicas - i) for i in range(0, replicas, por_bloque)]
+    semillas = np.random.SeedSequence(0).spawn(len(bloques))
+    inicio = datetime.now()
+    with ThreadPoolExecutor(max_workers=hilos) as ex:
+        curvas = np.vstack(list(ex.map(lambda a: _bloque_bootstrap(V, y, Vg, *a), zip(bloques, semillas))))
+    segundos = (datetime.now() - inicio).total_seconds()
+
+    inferior, superior = np.quantile(curvas, [alfa / 2, 1 - alfa / 2], axis=0)
+    se = curvas.std(axis=0, ddof=1)
+    se[se == 0] = np.finfo(float).tiny
+    c = float(np.quantile(np.max(np.abs(curvas - ajuste) / se, axis=1), 1 - alfa))
+    return {
+        "grilla": grilla,
+        "ajuste": ajuste,
+        "inferior": inferior,
+        "superior": superior,
+        "sim_inferior": ajuste - c * se,
+        "sim_superior": ajuste + c * se,
+        "c": c,
+        "segundos": segundos,
+    }
+
+
+def seccion_proyecciones(df: pd.DataFrame, scale_mode: str, version: str):
     st.header("Proyecciones y Econometría")
 
+    modo = st.radio("Modo", ["Regresión", "Pronóstico de series"], horizontal=True, key="pred_modo")
+    if modo == "Pronóstico de series":
+        seccion_pronostico(df, scale_mode, version)
+        return
+
     cols_num = columnas_numericas(df)
     if len(cols_num) < 2:
         st.warning("Se necesitan al menos 2 columnas numéricas para realizar regresiones.")
@@ -1036,16 +4233,35 @@ def seccion_proyecciones(df: pd.DataFrame, scale_mode: str):
 
     col3, col4 = st.columns(2)
     with col3:
-        tipo_regresion = st.selectbox("Tipo de regresión", ["Regresión Lineal", "Regresión LOESS", "Regresión Polinomial"])
+        tipo_regresion = st.selectbox(
+            "Tipo de regresión", ["Regresión Lineal", "Regresión LOESS", "Regresión Polinomial", "Comparar modelos"]
+        )
     with col4:
         sigma_val = st.slider("Intervalo de confianza (sigma)", 0.5, 4.0, 2.0, 0.1)
 
+    col5, col6, col7 = st.columns(3)
+    with col5:
+        tipo_banda = st.selectbox("Banda de confianza", TIPOS_BANDA, key="pred_banda")
+    if tipo_banda == "Bootstrap (pares)":
+        with col6:
+            replicas = st.select_slider("Réplicas", [200, 500, 1000, 2000, 5000], value=1000, key="pred_replicas")
+        with col7:
+            nivel_boot = st.selectbox("Nivel", list(NIVELES_BOOTSTRAP), index=1, key="pred_nivel_boot")
+
     if tipo_regresion == "Regresión Polinomial":
         grado = st.slider("Grado del polinomio", 2, 5, 2)
+    elif tipo_regresion == "Comparar modelos":
+        c5, c6 = st.columns(2)
+        with c5:
+            grado = st.slider("Grado máximo", 2, GRADO_MAX_COMPARACION, GRADO_MAX_COMPARACION, key="cmp_grado")
+        with c6:
+            pliegues = PLIEGUES_CV[st.selectbox("Validación cruzada", list(PLIEGUES_CV), index=1, key="cmp_cv")]
     else:
         grado = 1
 
     data_clean = df[[x_col, y_col]].dropna()
+    if tipo_regresion == "Regresión LOESS":
+        loess_params = _controles_loess(len(data_clean))
     if len(data_clean) < 10:
         st.warning("Se necesitan al menos 10 observaciones válidas.")
         return
@@ -1053,37 +4269,75 @@ def seccion_proyecciones(df: pd.DataFrame, scale_mode: str):
     x = data_clean[x_col].values
     y = data_clean[y_col].values
 
-    if tipo_regresion == "Regresión Lineal":
-        coeffs = np.polyfit(x, y, 1)
-        poly = np.poly1d(coeffs)
-        predictions = poly(x)
-        st.info(f"**Ecuación:** Y = {coeffs[0]:.4f}·X + {coeffs[1]:.4f}")
-    elif tipo_regresion == "Regresión Polinomial":
-        coeffs = np.polyfit(x, y, grado)
-        poly = np.poly1d(coeffs)
-        predictions = poly(x)
-        ecuacion = " + ".join([f"{coeffs[i]:.4f}·X^{grado-i}" for i in range(len(coeffs))])
-        st.info(f"**Ecuación:** Y = {ecuacion}")
+    if tipo_regresion in ("Regresión Lineal", "Regresión Polinomial"):
+        ajuste = comparar_modelos(x, y, version, x_col, y_col, grado_max=grado)
+        if ajuste["grado_estimable"] < grado:
+            st.warning(_aviso_rango(ajuste, grado))
+            return
+        predictions = ajuste["ajustados"][:, grado - 1]
+        st.info(f"**Ecuación:** {_ecuacion_polinomio(ajuste['coeficientes'][grado - 1])}")
+    elif tipo_regresion == "Comparar modelos":
+        with st.spinner("Ajustando modelos..."):
+            ajuste = comparar_modelos(x, y, version, x_col, y_col, grado_max=grado, pliegues=pliegues)
+        tabla = ajuste["tabla"]
+        if ajuste["grado_estimable"] < grado:
+            st.warning(_aviso_rango(ajuste, grado))
+        if tabla.empty:
+            return
+        criterio = next((c for c in tabla.columns if c.startswith("RMSE CV") and tabla[c].notna().any()), "BIC")
+        mejor = int(tabla.loc[tabla[criterio].idxmin(), "Grado"])
+        st.dataframe(style_latino(tabla, decimals=4), use_container_width=True, hide_index=True)
+        st.caption(
+            f"Todos los modelos salen de una sola QR de la matriz de Vandermonde de grado {grado}. "
+            f"Mejor según {criterio}: {tabla.loc[mejor - 1, 'Modelo']}."
+        )
+        modelos = tabla["Modelo"].tolist()
+        elegido = st.selectbox("Modelo a graficar", modelos, index=mejor - 1, key="cmp_modelo")
+        g = modelos.index(elegido)
+        predictions = ajuste["ajustados"][:, g]
+        st.info(f"**Ecuación:** {_ecuacion_polinomio(ajuste['coeficientes'][g])}")
     else:
         try:
-            import statsmodels.api as sm
-            lowess = sm.nonparametric.lowess
-            result = lowess(y, x, frac=0.66)
-            sorted_idx = np.argsort(x)
-            x = x[sorted_idx]
-            y = y[sorted_idx]
-            predictions = result[:, 1][sorted_idx]
-            st.info("**LOESS:** Ajuste local ponderado (sin ecuación explícita).")
+            with st.spinner("Ajustando LOESS..."):
+                ajuste = ajustar_loess(x, y, version, x_col, y_col, *loess_params)
         except ImportError:
             st.error("Para usar LOESS, instala: pip install statsmodels")
             return
+        x = x[ajuste["orden"]]
+        y = y[ajuste["orden"]]
+        predictions = ajuste["pred"]
+        st.info("**LOESS:** Ajuste local ponderado (sin ecuación explícita).")
+        st.caption(
+            f"Ajuste sobre {format_lat_number(ajuste['puntos_ajuste'], decimals=0)} de "
+            f"{format_lat_number(len(x), decimals=0)} puntos en {format_lat_number(ajuste['segundos'], decimals=2)} s. "
+            f"Error frente a LOESS exacto (sin iteraciones robustas, {LOESS_PUNTOS_CONTROL} puntos de control): "
+            f"máx. {format_lat_number(ajuste['error_max'], decimals=4)}, "
+            f"medio {format_lat_number(ajuste['error_medio'], decimals=4)} "
+            f"({format_lat_number(100 * ajuste['error_rel'], decimals=2)}% de la desviación de Y)."
+        )
 
+    # los outliers siguen marcándose con la banda σ de residuos, use o no bootstrap
     residuals = y - predictions
     std_dev = np.std(residuals)
     upper_bound = predictions + (sigma_val * std_dev)
     lower_bound = predictions - (sigma_val * std_dev)
     outliers_mask = (y > upper_bound) | (y < lower_bound)
 
+    bandas = None
+    if tipo_banda == "Bootstrap (pares)":
+        if tipo_regresion == "Regresión LOESS":
+            st.info("El bootstrap está disponible para los modelos lineal y polinomiales; LOESS usa la banda σ.")
+        else:
+            grado_banda = g + 1 if tipo_regresion == "Comparar modelos" else grado
+            with st.spinner(f"Bootstrap con {format_lat_number(replicas, decimals=0)} réplicas..."):
+                bandas = bandas_bootstrap(x, y, version, x_col, y_col, grado_banda, replicas, NIVELES_BOOTSTRAP[nivel_boot])
+            st.caption(
+                f"Bootstrap de pares: {format_lat_number(replicas, decimals=0)} réplicas en "
+                f"{format_lat_number(bandas['segundos'], decimals=2)} s. La banda simultánea usa "
+                f"c = {format_lat_number(bandas['c'], decimals=2)} errores estándar en vez de ≈1,96 por punto. "
+                f"Outliers marcados con la banda {format_lat_number(sigma_val, decimals=1)}σ de residuos."
+            )
+
     factor, unit_label = get_scale_factor_and_label(scale_mode, np.nanmax(np.abs(y)) if len(y) else 0.0)
 
     y_s = scale_values(y, factor)
@@ -1093,26 +4347,433 @@ def seccion_proyecciones(df: pd.DataFrame, scale_mode: str):
 
     st.subheader(f"Resultados: {y_col} vs {x_col}")
 
-    fig, ax = plt.subplots(figsize=(12, 7))
-    ax.scatter(x[~outliers_mask], y_s[~outliers_mask], alpha=0.5, label="Datos normales", s=50)
-    ax.scatter(x[outliers_mask], y_s[outliers_mask], alpha=0.7, label="Outliers", marker="x", s=100, linewidths=2)
+    def construir():
+        fig, ax = plt.subplots(figsize=(12, 7))
+        ax.scatter(x[~outliers_mask], y_s[~outliers_mask], alpha=0.5, label="Datos normales", s=50)
+        ax.scatter(x[outliers_mask], y_s[outliers_mask], alpha=0.7, label="Outliers", marker="x", s=100, linewidths=2)
+
+        sorted_idx = np.argsort(x)
+        ax.plot(x[sorted_idx], pred_s[sorted_idx], linewidth=2, label="Predicción")
+        if bandas is None:
+            ax.fill_between(x[sorted_idx], lo_s[sorted_idx], up_s[sorted_idx], alpha=0.2, label=f"IC {sigma_val}σ")
+        else:
+            ax.fill_between(
+                bandas["grilla"], scale_values(bandas["inferior"], factor), scale_values(bandas["superior"], factor),
+                alpha=0.3, label=f"IC bootstrap {nivel_boot} (puntual)",
+            )
+            for lim in ("sim_inferior", "sim_superior"):
+                ax.plot(
+                    bandas["grilla"], scale_values(bandas[lim], factor), "--", linewidth=1.2, color="gray",
+                    label=f"IC bootstrap {nivel_boot} (simultánea)" if lim == "sim_inferior" else None,
+                )
 
-    sorted_idx = np.argsort(x)
-    ax.plot(x[sorted_idx], pred_s[sorted_idx], linewidth=2, label="Predicción")
-    ax.fill_between(x[sorted_idx], lo_s[sorted_idx], up_s[sorted_idx], alpha=0.2, label=f"IC {sigma_val}σ")
+        ax.set_xlabel(x_col, fontsize=12)
+        ax.set_ylabel(f"{y_col} (en {unit_label})", fontsize=12)
+        set_title_with_unit_matplotlib(ax, f"{y_col} vs {x_col}", unit_label)
+        ax.legend(fontsize=10)
+        ax.grid(True, alpha=0.3)
+        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+        return fig, []
 
-    ax.set_xlabel(x_col, fontsize=12)
-    ax.set_ylabel(f"{y_col} (en {unit_label})", fontsize=12)
-    set_title_with_unit_matplotlib(ax, f"{y_col} vs {x_col}", unit_label)
-    ax.legend(fontsize=10)
-    ax.grid(True, alpha=0.3)
-    ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
-    st.pyplot(fig)
+    spec = {
+        "grafico": "proyeccion", "version": version, "escala": scale_mode, "x": x_col, "y": y_col,
+        "tipo": tipo_regresion, "grado": g + 1 if tipo_regresion == "Comparar modelos" else grado,
+        "loess": loess_params if tipo_regresion == "Regresión LOESS" else None,
+        "sigma": sigma_val, "bootstrap": (replicas, nivel_boot) if bandas is not None else None,
+    }
+    mostrar_figura_matplotlib(spec, construir)
+
+
+# =========================
+# MODO FUERA DE MEMORIA (PYARROW.DATASET)
+# =========================
+MEDIDAS_FUERA_DE_MEMORIA = ["Suma", "Promedio", "Conteo", "Mínimo", "Máximo"]  # fusionables por lote
+_PARCIALES = ("sum", "count", "min", "max")
+UNIDADES_FECHA = {"Sin agrupar": None, "Año": "year", "Mes": "month", "Día": "day", "Hora": "hour"}
+
+
+def _dataset_parquet(ruta: str):
+    import pyarrow.dataset as ds
+
+    return ds.dataset(ruta, format="parquet", partitioning="hive")
+
+
+@st.cache_data(show_spinner=False, max_entries=64)
+def valores_distintos_parquet(ruta: str, firma: str, col: str, limite: int = 1000):
+    """Valores distintos de una columna leyendo solo esa columna. Devuelve (valores, truncado)."""
+    import pyarrow.compute as pc
+
+    vistos = set()
+    for lote in _dataset_parquet(ruta).to_batches(columns=[col]):
+        vistos.update(pc.unique(lote.column(0)).to_pylist())
+        if len(vistos) > limite:
+            break
+    valores = sorted(v for v in vistos if v is not None)
+    return valores[:limite], len(valores) > limite
+
+
+def _expresion_filtros(filtros, esquema):
+    """Filtros [col, "rango"|"fechas"|"en", ...] -> expresión de pyarrow.dataset (None si no hay)."""
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    expr = None
+    for col, op, *args in filtros:
+        campo = ds.field(col)
+        if op == "en":
+            partes = [campo.isin(args[0])]
+        elif op == "fechas":
+            tipo = esquema.field(col).type
+            desde, hasta = pd.Timestamp(args[0]), pd.Timestamp(args[1]) + pd.Timedelta(days=1)
+            if pa.types.is_timestamp(tipo):
+                desde, hasta = desde.to_pydatetime(), hasta.to_pydatetime()
+            else:
+                desde, hasta = desde.date(), hasta.date()
+            partes = [campo >= pa.scalar(desde, type=tipo), campo < pa.scalar(hasta, type=tipo)]
+        else:
+            lo, hi = args
+            partes = ([campo >= lo] if lo is not None else []) + ([campo <= hi] if hi is not None else [])
+        for parte in partes:
+            expr = parte if expr is None else expr & parte
+    return expr
+
+
+def _preparar_lote(tabla, claves, fechas: dict):
+    """Trunca las claves de fecha a la unidad pedida y decodifica claves diccionario."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    for c in claves:
+        i = tabla.schema.get_field_index(c)
+        col = tabla.column(i)
+        if pa.types.is_dictionary(col.type):
+            col = col.cast(col.type.value_type)
+        if fechas.get(c):
+            col = pc.floor_temporal(col, unit=fechas[c])
+        tabla = tabla.set_column(i, c, col)
+    return tabla
+
+
+def _fusionar_parciales(parciales, claves, valores):
+    """Combina agregados parciales (suma, conteo, mín., máx. por grupo) en uno solo con el mismo esquema."""
+    import pyarrow as pa
+
+    tabla = pa.concat_tables(parciales)
+    aggs = [(f"{c}_{f}", "sum" if f in ("sum", "count") else f) for c in valores for f in _PARCIALES]
+    res = tabla.group_by(claves).aggregate(aggs)
+    # "x_sum_sum" -> "x_sum": mismo esquema que un parcial, para seguir fusionando
+    return res.rename_columns([n if n in claves else n.rsplit("_", 1)[0] for n in res.column_names])
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def agregar_fuera_de_memoria(ruta: str, firma: str, spec_json: str, lote_filas: int = 1_000_000):
+    """
+    Agregación por grupos sin cargar el dataset: el filtro y la selección de columnas se
+    empujan a pyarrow.dataset (se saltan row groups y particiones que no aplican, y solo se
+    leen las columnas usadas); cada lote se reduce a suma/conteo/mín./máx. por grupo y los
+    parciales se fusionan cada tanto, así la memoria depende del número de grupos, no de filas.
+    Devuelve (DataFrame agregado, filas leídas).
+    """
+    import pyarrow as pa
+
+    spec = json.loads(spec_json)
+    claves, valores, medidas, fechas = spec["claves"], spec["valores"], spec["medidas"], spec["fechas"]
+
+    dataset = _dataset_parquet(ruta)
+    scanner = dataset.scanner(
+        columns=list(dict.fromkeys(claves + valores)),
+        filter=_expresion_filtros(spec["filtros"], dataset.schema),
+        batch_size=lote_filas,
+    )
+
+    parciales, filas = [], 0
+    aggs = [(c, f) for c in valores for f in _PARCIALES]
+    for lote in scanner.to_batches():
+        if not lote.num_rows:
+            continue
+        filas += lote.num_rows
+        tabla = _preparar_lote(pa.Table.from_batches([lote]), claves, fechas)
+        parciales.append(tabla.group_by(claves).aggregate(aggs))
+        if len(parciales) >= 64:
+            parciales = [_fusionar_parciales(parciales, claves, valores)]
+
+    nombres = [f"{c} ({m.lower()})" for c in valores for m in medidas]
+    if not parciales:
+        return pd.DataFrame(columns=claves + nombres), 0
+
+    total = _fusionar_parciales(parciales, claves, valores).to_pandas()
+    out = total[claves].copy()
+    for c in valores:
+        for m in medidas:
+            nombre = f"{c} ({m.lower()})"
+            if m == "Promedio":
+                conteo = total[f"{c}_count"].to_numpy(dtype="float64")
+                suma = total[f"{c}_sum"].to_numpy(dtype="float64")
+                out[nombre] = np.divide(suma, conteo, out=np.full(len(total), np.nan), where=conteo > 0)
+            else:
+                parcial = {"Suma": "sum", "Conteo": "count", "Mínimo": "min", "Máximo": "max"}[m]
+                out[nombre] = total[f"{c}_{parcial}"]
+    if claves:
+        out = out.sort_values(claves, kind="stable", na_position="last")
+    return out.reset_index(drop=True), filas
+
+
+def _controles_filtros_parquet(ruta: str, firma: str, esquema):
+    import pyarrow as pa
+
+    filtro_cols = st.multiselect("Filtrar por", esquema.names, key="odc_filtro_cols")
+    filtros = []
+    for c in filtro_cols:
+        tipo = esquema.field(c).type
+        if pa.types.is_integer(tipo) or pa.types.is_floating(tipo) or pa.types.is_decimal(tipo):
+            c1, c2 = st.columns(2)
+            lo = c1.number_input(f"{c} desde", value=None, key=f"odc_{c}_desde")
+            hi = c2.number_input(f"{c} hasta", value=None, key=f"odc_{c}_hasta")
+            if lo is not None or hi is not None:
+                filtros.append([c, "rango", lo, hi])
+        elif pa.types.is_timestamp(tipo) or pa.types.is_date(tipo):
+            rango = st.date_input(f"{c} entre", value=(), key=f"odc_{c}_fechas")
+            if len(rango) == 2:
+                filtros.append([c, "fechas", str(rango[0]), str(rango[1])])
+        else:
+            valores, truncado = valores_distintos_parquet(ruta, firma, c)
+            elegidos = st.multiselect(f"{c} en", valores, key=f"odc_{c}_en")
+            if truncado:
+                st.caption(f"Se listan los primeros {format_lat_number(len(valores), decimals=0)} valores de {c}.")
+            if elegidos:
+                filtros.append([c, "en", elegidos])
+    return filtros
+
+
+def pagina_fuera_de_memoria(ruta: str, firma: str, scale_mode: str, fuente: dict):
+    """
+    Exploración de datasets más grandes que la memoria. Con fuente Parquet (`ruta`), filtros y
+    agregación donde solo el agregado llega a pandas; en todos los casos, estadística
+    descriptiva por lotes del archivo original (`fuente`, ver seccion_perfil_por_lotes).
+    """
+    st.header("Análisis Fuera de Memoria")
+    opciones = (["Agregación"] if ruta else []) + ["Estadística descriptiva por lotes"]
+    modo = st.radio("Análisis", opciones, horizontal=True, key="odc_modo")
+    if modo == "Estadística descriptiva por lotes":
+        seccion_perfil_por_lotes(fuente)
+        return
+
+    import pyarrow as pa
+
+    dataset = _dataset_parquet(ruta)
+    esquema = dataset.schema
+    n_archivos = len(dataset.files)
+    st.info(
+        f"**Fuente Parquet:** {os.path.basename(ruta.rstrip(os.sep))}"
+        f" | **Archivos:** {format_lat_number(n_archivos, decimals=0)}"
+        f" | **Columnas:** {format_lat_number(len(esquema.names), decimals=0)}"
+    )
+
+    es_num = lambda t: pa.types.is_integer(t) or pa.types.is_floating(t) or pa.types.is_decimal(t)
+    cols_num = [f.name for f in esquema if es_num(f.type)]
+
+    st.subheader("Filtros")
+    filtros = _controles_filtros_parquet(ruta, firma, esquema)
+
+    st.subheader("Agregación")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        claves = st.multiselect("Agrupar por", esquema.names, key="odc_claves")
+    with c2:
+        valores = st.multiselect("Variables", [c for c in cols_num if c not in claves], key="odc_valores")
+    with c3:
+        medidas = st.multiselect("Medidas", MEDIDAS_FUERA_DE_MEMORIA, default=["Promedio"], key="odc_medidas")
+
+    fechas = {}
+    for c in claves:
+        tipo = esquema.field(c).type
+        if pa.types.is_timestamp(tipo) or pa.types.is_date(tipo):
+            unidad = st.selectbox(f"Agrupar {c} por", list(UNIDADES_FECHA), index=2, key=f"odc_{c}_unidad")
+            if UNIDADES_FECHA[unidad]:
+                fechas[c] = UNIDADES_FECHA[unidad]
+
+    if not valores or not medidas:
+        st.info("Selecciona al menos una variable y una medida.")
+        return
+
+    spec_json = json.dumps(
+        {"claves": claves, "valores": valores, "medidas": medidas, "fechas": fechas, "filtros": filtros},
+        sort_keys=True, ensure_ascii=False, default=str,
+    )
+    inicio = datetime.now()
+    with st.spinner("Agregando sobre los archivos Parquet..."):
+        try:
+            resultado, filas = agregar_fuera_de_memoria(ruta, firma, spec_json)
+        except Exception as e:
+            st.error(f"❌ No se pudo agregar: {e}")
+            return
+    segundos = (datetime.now() - inicio).total_seconds()
+
+    st.caption(
+        f"Filas leídas (tras el filtro): {format_lat_number(filas, decimals=0)} · "
+        f"Grupos: {format_lat_number(len(resultado), decimals=0)} · "
+        f"Tiempo: {format_lat_number(segundos, decimals=2)} s"
+    )
+
+    version = version_dataset(ruta, firma, spec_json)
+    mostrar_grilla_paginada(resultado, version, key="grid_fuera_memoria", decimals=2, height=400)
+    st.download_button(
+        "⬇️ Descargar agregado (CSV)",
+        csv_dataset_cacheado(resultado, version),
+        file_name="agregado_fuera_de_memoria.csv",
+        mime="text/csv",
+    )
+
+    if not resultado.empty:
+        st.divider()
+        seccion_ilustraciones(resultado, scale_mode, version)
+
+
+# =========================
+# CONSULTA SQL (DUCKDB)
+# =========================
+CONSULTA_SQL_INICIAL = "SELECT *\nFROM datos\nLIMIT 100"
+
+
+def ruta_parquet_fuente(path: str, sheet, firma: str):
+    """Archivo o carpeta Parquet equivalente al dataset elegido (None si no hay)."""
+    if not PYARROW_AVAILABLE:
+        return None
+    if os.path.isdir(path) or ext_archivo(path) == ".parquet":
+        return path
+    if ext_archivo(path) in [".xlsx", ".xls", ".xlsb"]:
+        try:
+            return parquet_de_hoja(path, 0 if sheet is None else sheet, firma)
+        except Exception:
+            return None
+    return None
+
+
+@st.cache_data(show_spinner=False, max_entries=16)
+def ejecutar_sql(_df: pd.DataFrame, version: str, ruta_parquet, consulta: str):
+    """
+    Ejecuta `consulta` en DuckDB (motor vectorizado, en memoria) y devuelve (resultado, segundos).
+    Tablas disponibles:
+    - datos: el dataset de análisis (ya limpio y tipado), sin copiarlo.
+    - datos_parquet: la fuente Parquet leída directo del disco, con filtros y columnas
+      empujados al lector (si existe).
+    El acceso a archivos desde SQL queda deshabilitado: solo se consultan esas dos tablas.
+    La clave de caché es (version, ruta_parquet, consulta).
+    """
+    con = duckdb.connect()
+    try:
+        con.register("datos", _df)
+        if ruta_parquet:
+            con.register("datos_parquet", _dataset_parquet(ruta_parquet))
+        con.execute("SET enable_external_access = false")
+        con.execute("SET lock_configuration = true")
+        inicio = datetime.now()
+        resultado = con.execute(consulta).df()
+        return resultado, (datetime.now() - inicio).total_seconds()
+    finally:
+        con.close()
+
+
+def dataset_desde_sql(df: pd.DataFrame, version: str, ruta_parquet):
+    """
+    Si el usuario eligió analizar el resultado de su consulta, devuelve (resultado, versión);
+    si no, (df, version). Así las demás secciones reciben el resultado como dataset.
+    """
+    consulta = st.session_state.get("sql_consulta")
+    if not (DUCKDB_AVAILABLE and consulta and st.session_state.get("sql_como_dataset")):
+        return df, version
+    try:
+        resultado, _ = ejecutar_sql(df, version, ruta_parquet, consulta)
+    except Exception as e:
+        st.warning(f"⚠️ No se pudo usar la consulta SQL como dataset ({e}); se usa el dataset original.")
+        return df, version
+    st.info(
+        f"Las secciones analizan el **resultado de la consulta SQL** "
+        f"({format_lat_number(len(resultado), decimals=0)} filas). "
+        "Desactívalo en la sección Consulta SQL para volver al dataset original."
+    )
+    return resultado, version_dataset(version, "sql", consulta)
+
+
+def seccion_consulta_sql(df: pd.DataFrame, version: str, ruta_parquet):
+    st.header("Consulta SQL")
+
+    if not DUCKDB_AVAILABLE:
+        st.warning("⚠️ DuckDB no está instalado. Instala con: pip install duckdb")
+        return
+
+    tablas = "`datos` (dataset limpio y tipado)"
+    if ruta_parquet:
+        tablas += " y `datos_parquet` (archivo Parquet leído directo del disco)"
+    st.caption(f"Tablas disponibles: {tablas}. Sintaxis SQL de DuckDB.")
+
+    # los widgets pierden su estado al cambiar de sección: la consulta y la opción de
+    # usarla como dataset se guardan en claves propias ("sql_consulta", "sql_como_dataset")
+    if "sql_consulta_texto" not in st.session_state:
+        st.session_state["sql_consulta_texto"] = st.session_state.get("sql_consulta", CONSULTA_SQL_INICIAL)
+    with st.form("form_sql"):
+        texto = st.text_area("Consulta", key="sql_consulta_texto", height=160)
+        ejecutar = st.form_submit_button("Ejecutar", type="primary")
+    if ejecutar:
+        st.session_state["sql_consulta"] = texto
+
+    consulta = st.session_state.get("sql_consulta")
+    if not consulta:
+        st.info("Escribe una consulta y presiona Ejecutar.")
+        return
+
+    inicio = datetime.now()
+    try:
+        with st.spinner("Ejecutando consulta..."):
+            resultado, segundos = ejecutar_sql(df, version, ruta_parquet, consulta)
+    except Exception as e:
+        st.error(f"❌ Error en la consulta: {e}")
+        return
+    respuesta = (datetime.now() - inicio).total_seconds()
+
+    desde_cache = " (resultado en caché)" if respuesta < segundos / 2 else ""
+    st.caption(
+        f"Filas: {format_lat_number(len(resultado), decimals=0)} · "
+        f"Columnas: {format_lat_number(resultado.shape[1], decimals=0)} · "
+        f"Tiempo de ejecución: {format_lat_number(segundos, decimals=3)} s{desde_cache}"
+    )
+
+    version_resultado = version_dataset(version, "sql", consulta)
+    mostrar_grilla_paginada(resultado, version_resultado, key="grid_sql", decimals=2, height=400)
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.download_button(
+            "⬇️ Descargar resultado (CSV)",
+            csv_dataset_cacheado(resultado, version_resultado),
+            file_name="consulta_sql.csv",
+            mime="text/csv",
+        )
+    with col2:
+        st.session_state["sql_como_dataset_widget"] = st.session_state.get("sql_como_dataset", False)
+        st.toggle(
+            "Usar este resultado en las demás secciones",
+            key="sql_como_dataset_widget",
+            on_change=lambda: st.session_state.update(sql_como_dataset=st.session_state["sql_como_dataset_widget"]),
+            help="Estadística, Ilustraciones y Proyecciones analizarán el resultado de la consulta.",
+        )
 
 
 # =========================
 # MAIN APPLICATION
 # =========================
+SECCIONES = [
+    ("estadistica", "Estadística Descriptiva"),
+    ("ilustraciones", "Ilustraciones"),
+    ("proyecciones", "Proyecciones y Econometría"),
+    ("sql", "Consulta SQL"),
+    ("pivot", "Tabla Dinámica"),
+    ("series", "Series de Tiempo"),
+    ("correlaciones", "Correlaciones"),
+    ("outliers", "Detección de Outliers"),
+]
+
+
 def data_multiple():
     st.title("Sistema Integral de Análisis de Datos")
     st.caption("Análisis completo: Estadística · Visualizaciones · Proyecciones")
@@ -1137,10 +4798,11 @@ def data_multiple():
     archivo = st.sidebar.selectbox("Archivo", files, key="file_selector")
     path = os.path.join(DATA_DIR, archivo)
     ext = ext_archivo(path)
+    firma = firma_archivo(path)
 
     sheet = None
     if ext in [".xlsx", ".xls", ".xlsb"]:
-        sheets = obtener_sheets_excel(path)
+        sheets = obtener_sheets_excel(path, firma)
         if not sheets:
             st.sidebar.error("No se pudieron listar las hojas de Excel.")
             st.stop()
@@ -1158,17 +4820,38 @@ def data_multiple():
         index=0
     )
 
+    puede_fuera_de_memoria = PYARROW_AVAILABLE and (
+        os.path.isdir(path) or ext in [".parquet", ".xlsx", ".xls", ".xlsb"]
+    )
+    # el CSV se puede recorrer por trozos: admite el perfil por lotes, no la agregación Parquet
+    if puede_fuera_de_memoria or ext in [".csv", ".tsv", ".txt"]:
+        st.sidebar.header("Modo de Ejecución")
+        fuera_de_memoria = st.sidebar.toggle(
+            "Fuera de memoria",
+            value=os.path.isdir(path),
+            help="Analiza el archivo sin cargar el dataset completo: estadística descriptiva por lotes "
+                 "(con las opciones de limpieza) y, con Parquet, filtros y agregación sobre los archivos.",
+        )
+        if fuera_de_memoria:
+            ruta_pq = None
+            if puede_fuera_de_memoria:
+                ruta_pq = path if os.path.isdir(path) or ext == ".parquet" else parquet_de_hoja(path, sheet, firma)
+            if ruta_pq or not puede_fuera_de_memoria:
+                fuente = {
+                    "path": path, "sheet": sheet, "firma": firma,
+                    "drop_blank": drop_blank, "auto_numeric": auto_numeric, "umbral": umbral,
+                }
+                pagina_fuera_de_memoria(ruta_pq, firma_archivo(ruta_pq) if ruta_pq else None, scale_mode, fuente)
+                return
+            st.sidebar.warning("No se pudo preparar la copia Parquet de la hoja; se usa el modo en memoria.")
+
     with st.spinner("📥 Cargando dataset..."):
         try:
-            df = leer_archivo(path, sheet_name=sheet)
+            df = cargar_dataset_limpio(path, sheet, firma, drop_blank, auto_numeric, umbral)
         except Exception as e:
             st.error(f"❌ Error al leer el archivo: {e}")
             st.stop()
 
-    df = limpiar_df(df, drop_blank=drop_blank)
-    if auto_numeric and not df.empty:
-        df = intentar_convertir_numericos(df, umbral=umbral)
-
     # ✅ INFO con formato latino (no usar {len(df):,} porque pone coma)
     st.info(
         f"**Dataset:** {archivo}"
@@ -1179,6 +4862,27 @@ def data_multiple():
 
     st.divider()
     df_typed = panel_tipado(df)
+    version = version_dataset(
+        path, sheet, firma, drop_blank, auto_numeric, umbral,
+        sorted(st.session_state.get("col_types", {}).items()),
+    )
+
+    # las marcas de outliers se calculan y guardan sobre el dataset sin filtrar
+    df_datos, version_datos = df_typed, version
+    df_typed, version = anexar_marcas_outliers(df_typed, version)
+
+    df_base, version_base = df_typed, version
+    df_typed, version, filtros_globales = panel_filtros_globales(
+        df_typed, version, prefijo=version_dataset(path, sheet)[:8]
+    )
+    if filtros_globales:
+        st.info(
+            f"Filtros globales activos: se analizan {format_lat_number(len(df_typed), decimals=0)} "
+            f"de {format_lat_number(len(df), decimals=0)} filas."
+        )
+
+    with st.spinner("🧊 Materializando cubo de dimensiones..."):
+        registrar_cubo_base(df_base, version_base, filtros_globales, version)
 
     with st.expander("Vista Previa del Dataset", expanded=False):
         st.dataframe(style_latino(df_typed.head(100), decimals=2), use_container_width=True, height=400)
@@ -1187,38 +4891,50 @@ def data_multiple():
 
     st.subheader("Selecciona una Sección de Análisis")
 
-    col1, col2, col3 = st.columns(3)
-    with col1:
-        if st.button("Estadística Descriptiva", use_container_width=True, type="primary"):
-            st.session_state["seccion_activa"] = "estadistica"
-    with col2:
-        if st.button("Ilustraciones", use_container_width=True, type="primary"):
-            st.session_state["seccion_activa"] = "ilustraciones"
-    with col3:
-        if st.button("Proyecciones y Econometría", use_container_width=True, type="primary"):
-            st.session_state["seccion_activa"] = "proyecciones"
+    for fila in range(0, len(SECCIONES), 3):
+        cols = st.columns(3)
+        for col, (clave, etiqueta) in zip(cols, SECCIONES[fila:fila + 3]):
+            with col:
+                if st.button(etiqueta, use_container_width=True, type="primary"):
+                    st.session_state["seccion_activa"] = clave
 
     if "seccion_activa" not in st.session_state:
         st.session_state["seccion_activa"] = None
 
     st.divider()
 
+    ruta_pq = ruta_parquet_fuente(path, sheet, firma)
+    if st.session_state["seccion_activa"] != "sql":
+        df_analisis, version_analisis = dataset_desde_sql(df_typed, version, ruta_pq)
+    else:
+        df_analisis, version_analisis = df_typed, version
+
     if st.session_state["seccion_activa"] == "estadistica":
-        seccion_estadistica_descriptiva(df_typed)
+        seccion_estadistica_descriptiva(df_analisis)
     elif st.session_state["seccion_activa"] == "ilustraciones":
-        seccion_ilustraciones(df_typed, scale_mode)
+        seccion_ilustraciones(df_analisis, scale_mode, version_analisis)
     elif st.session_state["seccion_activa"] == "proyecciones":
-        seccion_proyecciones(df_typed, scale_mode)
+        seccion_proyecciones(df_analisis, scale_mode, version_analisis)
+    elif st.session_state["seccion_activa"] == "sql":
+        seccion_consulta_sql(df_typed, version, ruta_pq)
+    elif st.session_state["seccion_activa"] == "pivot":
+        seccion_tabla_dinamica(df_analisis, version_analisis)
+    elif st.session_state["seccion_activa"] == "series":
+        seccion_series_tiempo(df_analisis, scale_mode, version_analisis)
+    elif st.session_state["seccion_activa"] == "correlaciones":
+        seccion_correlaciones(df_analisis, version_analisis)
+    elif st.session_state["seccion_activa"] == "outliers":
+        seccion_outliers(df_datos, version_datos)
     else:
         st.info("Selecciona una sección de análisis usando los botones superiores.")
 
     st.divider()
     st.header("Dataset Completo")
-    st.dataframe(style_latino(df_typed, decimals=2), use_container_width=True, height=500)
+    mostrar_grilla_paginada(df_typed, version, key="grid_completo", decimals=2, height=500)
 
     st.download_button(
         "⬇️ Descargar Dataset Procesado (CSV)",
-        df_to_csv_bytes(df_typed),
+        csv_dataset_cacheado(df_typed, version),
         file_name=f"{archivo.split('.')[0]}_procesado.csv",
         mime="text/csv",
     )
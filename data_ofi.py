@@ -2,6 +2,7 @@ import os
 from io import BytesIO
 from datetime import datetime
 import re
+import hashlib
 
 import numpy as np
 import pandas as pd
@@ -17,6 +18,15 @@ try:
 except ImportError:
     pass
 
+# Formato latino compartido con data.py (vectorizado con format_lat_array)
+from data import PLOTLY_CONFIG, mpl_lat_formatter, style_latino, apply_plotly_latino_format
+# Grilla paginada: orden y filtro en el servidor, al navegador solo va la página visible
+from data import mostrar_grilla_paginada, version_dataset, firma_archivo
+# Figuras de Matplotlib cacheadas como PNG y cerradas al rasterizar (sin fugas entre reruns)
+from data import mostrar_figura_matplotlib
+# LOESS escalable (delta + submuestra + interpolación) compartido con data.py
+from data import ajustar_loess
+
 # Configuración inicial
 DATA_DIR = "archivos_subidos/datos"
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -132,6 +142,14 @@ def columnas_no_numericas(df):
 def df_to_csv_bytes(df: pd.DataFrame) -> bytes:
     return df.to_csv(index=False).encode("utf-8")
 
+def huella_datos(data) -> str:
+    """Hash del contenido (sin índice): esta página no lleva versión del dataset y lo usa como clave de caché."""
+    return hashlib.sha1(pd.util.hash_pandas_object(data, index=False).values.tobytes()).hexdigest()[:16]
+
+def mostrar_plotly(fig):
+    """Dibuja una figura Plotly con formato latino (separadores, ticks y hover de data.py)."""
+    st.plotly_chart(apply_plotly_latino_format(fig, decimals=2), use_container_width=True, config=PLOTLY_CONFIG)
+
 # =========================
 # CONVERSIÓN ROBUSTA DE FECHAS
 # =========================
@@ -322,10 +340,10 @@ def seccion_estadistica_descriptiva(df: pd.DataFrame):
     na["% NA"] = (na["Cantidad NA"] / len(d) * 100).round(2) if len(d) else 0.0
     
     st.subheader("Resumen Estadístico")
-    st.dataframe(desc, use_container_width=True, height=360)
+    st.dataframe(style_latino(desc, decimals=2), use_container_width=True, height=360)
     
     st.subheader("Análisis de Valores Faltantes")
-    st.dataframe(na, use_container_width=True, height=320)
+    st.dataframe(style_latino(na, decimals=2), use_container_width=True, height=320)
     
     col1, col2 = st.columns(2)
     with col1:
@@ -455,25 +473,30 @@ def render_bar_chart_mejorado(df, cols_num, cols_cat):
             barmode='group',
             height=500
         )
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        x = np.arange(len(cat_order))
-        width = 0.8 / len(num_cols)
-        
-        for i, num_col in enumerate(num_cols):
-            grouped = data.groupby(cat_col, sort=False)[num_col].mean()
-            grouped = grouped.reindex(cat_order)
-            ax.bar(x + i * width, grouped.values, width, label=num_col)
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            x = np.arange(len(cat_order))
+            width = 0.8 / len(num_cols)
+            
+            for i, num_col in enumerate(num_cols):
+                grouped = data.groupby(cat_col, sort=False)[num_col].mean()
+                grouped = grouped.reindex(cat_order)
+                ax.bar(x + i * width, grouped.values, width, label=num_col)
+            
+            ax.set_xlabel(cat_col)
+            ax.set_ylabel("Valores")
+            ax.set_title(f"Comparación por {cat_col}")
+            ax.set_xticks(x + width * (len(num_cols) - 1) / 2)
+            ax.set_xticklabels(cat_order, rotation=45, ha='right')
+            ax.legend()
+            ax.grid(True, alpha=0.3)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
         
-        ax.set_xlabel(cat_col)
-        ax.set_ylabel("Valores")
-        ax.set_title(f"Comparación por {cat_col}")
-        ax.set_xticks(x + width * (len(num_cols) - 1) / 2)
-        ax.set_xticklabels(cat_order, rotation=45, ha='right')
-        ax.legend()
-        ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+        spec = {"grafico": "barras", "datos": huella_datos(data), "x": cat_col, "y": num_cols}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_line_chart_mejorado(df, cols_num, cols_cat):
     if not cols_num:
@@ -502,18 +525,23 @@ def render_line_chart_mejorado(df, cols_num, cols_cat):
         fig = px.line(data, x=x_col, y=y_cols, title=f"Tendencia de {', '.join(y_cols)}",
                      markers=True)
         fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for y_col in y_cols:
-            ax.plot(data[x_col], data[y_col], marker='o', label=y_col, linewidth=2)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel("Valores", fontsize=12)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.xticks(rotation=30, ha='right')
-        plt.tight_layout()
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for y_col in y_cols:
+                ax.plot(data[x_col], data[y_col], marker='o', label=y_col, linewidth=2)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel("Valores", fontsize=12)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            plt.xticks(rotation=30, ha='right')
+            plt.tight_layout()
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
+        
+        spec = {"grafico": "lineas", "datos": huella_datos(data), "x": x_col, "y": y_cols}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_pie_chart_mejorado(df, cols_cat):
     if not cols_cat:
@@ -549,12 +577,16 @@ def render_pie_chart_mejorado(df, cols_cat):
     if PLOTLY_AVAILABLE:
         fig = px.pie(values=vc.values, names=vc.index, title=f"Distribución de {cat_col}")
         fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(10, 10))
-        ax.pie(vc.values, labels=vc.index, autopct='%1.1f%%', startangle=90)
-        ax.set_title(f"Distribución de {cat_col}", fontsize=14)
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(10, 10))
+            ax.pie(vc.values, labels=vc.index, autopct='%1.1f%%', startangle=90)
+            ax.set_title(f"Distribución de {cat_col}", fontsize=14)
+            return fig, []
+        
+        spec = {"grafico": "pastel", "datos": huella_datos(vc.reset_index()), "x": cat_col}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_scatter_multiple(df, cols_num):
     """Gráfico de dispersión con múltiples variables Y"""
@@ -594,17 +626,22 @@ def render_scatter_multiple(df, cols_num):
             yaxis_title="Valores",
             height=500
         )
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for y_col in y_cols:
-            ax.scatter(data[x_col], data[y_col], label=y_col, alpha=0.6, s=50)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel("Valores", fontsize=12)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.tight_layout()
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for y_col in y_cols:
+                ax.scatter(data[x_col], data[y_col], label=y_col, alpha=0.6, s=50)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel("Valores", fontsize=12)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            plt.tight_layout()
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
+        
+        spec = {"grafico": "dispersion_multiple", "datos": huella_datos(data), "x": x_col, "y": y_cols}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_scatter_chart_plotly(df, cols_num):
     if len(cols_num) < 2:
@@ -622,15 +659,20 @@ def render_scatter_chart_plotly(df, cols_num):
     if PLOTLY_AVAILABLE:
         fig = px.scatter(data, x=x_col, y=y_col, title=f"{y_col} vs {x_col}")
         fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.scatter(data[x_col], data[y_col], alpha=0.6, s=50)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.set_ylabel(y_col, fontsize=12)
-        ax.set_title(f"{y_col} vs {x_col}")
-        ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.scatter(data[x_col], data[y_col], alpha=0.6, s=50)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.set_ylabel(y_col, fontsize=12)
+            ax.set_title(f"{y_col} vs {x_col}")
+            ax.grid(True, alpha=0.3)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
+        
+        spec = {"grafico": "dispersion", "datos": huella_datos(data), "x": x_col, "y": y_col}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_area_chart_mejorado(df, cols_num, cols_cat):
     if not cols_num:
@@ -657,16 +699,21 @@ def render_area_chart_mejorado(df, cols_num, cols_cat):
     if PLOTLY_AVAILABLE:
         fig = px.area(data, x=x_col, y=y_cols, title=f"Área: {', '.join(y_cols)}")
         fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(12, 6))
-        for y_col in y_cols:
-            ax.fill_between(range(len(data)), data[y_col], alpha=0.5, label=y_col)
-        ax.set_xlabel(x_col, fontsize=12)
-        ax.legend(fontsize=10)
-        ax.grid(True, alpha=0.3)
-        plt.tight_layout()
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(12, 6))
+            for y_col in y_cols:
+                ax.fill_between(range(len(data)), data[y_col], alpha=0.5, label=y_col)
+            ax.set_xlabel(x_col, fontsize=12)
+            ax.legend(fontsize=10)
+            ax.grid(True, alpha=0.3)
+            plt.tight_layout()
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
+        
+        spec = {"grafico": "area", "datos": huella_datos(data), "x": x_col, "y": y_cols}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_histogram_plotly(df, cols_num):
     if not cols_num:
@@ -681,15 +728,21 @@ def render_histogram_plotly(df, cols_num):
     if PLOTLY_AVAILABLE:
         fig = px.histogram(data, nbins=bins, title=f"Histograma de {col}")
         fig.update_layout(height=500)
-        st.plotly_chart(fig, use_container_width=True)
+        mostrar_plotly(fig)
     else:
-        fig, ax = plt.subplots(figsize=(10, 6))
-        ax.hist(data, bins=bins, edgecolor='black')
-        ax.set_xlabel(col, fontsize=12)
-        ax.set_ylabel("Frecuencia", fontsize=12)
-        ax.set_title(f"Histograma de {col}")
-        ax.grid(True, alpha=0.3)
-        st.pyplot(fig)
+        def construir():
+            fig, ax = plt.subplots(figsize=(10, 6))
+            ax.hist(data, bins=bins, edgecolor='black')
+            ax.set_xlabel(col, fontsize=12)
+            ax.set_ylabel("Frecuencia", fontsize=12)
+            ax.set_title(f"Histograma de {col}")
+            ax.grid(True, alpha=0.3)
+            ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=0))
+            ax.xaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+            return fig, []
+        
+        spec = {"grafico": "histograma", "datos": huella_datos(data), "x": col, "bins": bins}
+        mostrar_figura_matplotlib(spec, construir)
 
 def render_boxplot_plotly(df, cols_num, cols_cat):
     if not cols_num:
@@ -710,26 +763,333 @@ def render_boxplot_plotly(df, cols_num, cols_cat):
         if PLOTLY_AVAILABLE:
             fig = px.box(data, y=y_col, title=f"Box Plot de {y_col}")
             fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
+            mostrar_plotly(fig)
         else:
-            fig, ax = plt.subplots(figsize=(8, 6))
-            ax.boxplot(data[y_col].values)
-            ax.set_ylabel(y_col, fontsize=12)
-            ax.set_title(f"Box Plot de {y_col}")
-            st.pyplot(fig)
+            def construir():
+                fig, ax = plt.subplots(figsize=(8, 6))
+                ax.boxplot(data[y_col].values)
+                ax.set_ylabel(y_col, fontsize=12)
+                ax.set_title(f"Box Plot de {y_col}")
+                ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+                return fig, []
+            
+            spec = {"grafico": "caja", "datos": huella_datos(data), "y": y_col}
+            mostrar_figura_matplotlib(spec, construir)
     else:
         data = df[[x_col, y_col]].dropna()
         if PLOTLY_AVAILABLE:
             fig = px.box(data, x=x_col, y=y_col, title=f"Box Plot de {y_col} por {x_col}")
             fig.update_layout(height=500)
-            st.plotly_chart(fig, use_container_width=True)
+            mostrar_plotly(fig)
         else:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            data.boxplot(column=y_col, by=x_col, ax=ax)
-            plt.suptitle("")
-            ax.set_title(f"Box Plot de {y_col} por {x_col}")
-            plt.xticks(rotation=45, ha='right')
-            st.pyplot(fig)
+            def construir():
+                fig, ax = plt.subplots(figsize=(10, 6))
+                data.boxplot(column=y_col, by=x_col, ax=ax)
+                plt.suptitle("")
+                ax.set_title(f"Box Plot de {y_col} por {x_col}")
+                plt.xticks(rotation=45, ha='right')
+                ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+                return fig, []
+            
+            spec = {"grafico": "caja", "datos": huella_datos(data), "x": x_col, "y": y_col}
+            mostrar_figura_matplotlib(spec, construir)
+
+# =========================
+# REGRESIÓN POR GRUPOS (OLS VECTORIZADO)
+# =========================
+def _suma_por_grupo(codigos: np.ndarray, n_grupos: int, A: np.ndarray, B: np.ndarray, pesos=None) -> np.ndarray:
+    """
+    Σ_i w_i · A_iᵀ B_i por grupo (G × p × q) con un bincount por par de columnas,
+    sin materializar productos fila a fila de tamaño n × p × q.
+    """
+    p, q = A.shape[1], B.shape[1]
+    out = np.empty((n_grupos, p, q))
+    simetrica = A is B
+    for i in range(p):
+        for j in range(i if simetrica else 0, q):
+            w = A[:, i] * B[:, j] if pesos is None else A[:, i] * B[:, j] * pesos
+            out[:, i, j] = np.bincount(codigos, weights=w, minlength=n_grupos)
+            if simetrica:
+                out[:, j, i] = out[:, i, j]
+    return out
+
+
+def _inversas_por_grupo(XtX: np.ndarray, n_obs: np.ndarray, k: int):
+    """Inversas por lote de las X'X; grupos con pocas observaciones o singulares quedan en NaN."""
+    validos = (n_obs > k) & (np.linalg.cond(XtX) < 1e12)
+    seguras = np.where(validos[:, None, None], XtX, np.eye(k))
+    inversas = np.linalg.inv(seguras)
+    inversas[~validos] = np.nan
+    return inversas, validos
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def ols_por_grupo(_df: pd.DataFrame, version: str, y_col: str, x_cols: tuple, grupo_col: str, robusto: bool = True) -> pd.DataFrame:
+    """
+    Un OLS con constante por cada grupo de `grupo_col`, todos a la vez:
+    - ecuaciones normales X'X y X'y por grupo con bincount (una pasada por par de columnas);
+    - coeficientes con una inversión por lote (np.linalg.inv sobre G × k × k);
+    - errores estándar clásicos o HC1: (n/(n-k)) · (X'X)⁻¹ (Σ e² x xᵀ) (X'X)⁻¹, también por lote.
+    Las X se escalan por su desviación estándar antes de invertir (mejor condicionamiento)
+    y los resultados se devuelven en las unidades originales.
+    Devuelve una tabla ordenada: grupo, variable, coeficiente, error estándar, t, p-valor, n, R².
+    """
+    from scipy import stats
+
+    datos = _df[[grupo_col, y_col] + list(x_cols)].dropna()
+    codigos, grupos = pd.factorize(datos[grupo_col], sort=True)
+    G = len(grupos)
+    y = datos[y_col].to_numpy(dtype="float64")
+    Xc = datos[list(x_cols)].to_numpy(dtype="float64")
+    escala = Xc.std(axis=0)
+    escala[escala == 0] = 1.0
+    X = np.column_stack([np.ones(len(y)), Xc / escala])
+    k = X.shape[1]
+
+    n_obs = np.bincount(codigos, minlength=G)
+    XtX = _suma_por_grupo(codigos, G, X, X)
+    Xty = _suma_por_grupo(codigos, G, X, y[:, None])[:, :, 0]
+    inv, validos = _inversas_por_grupo(XtX, n_obs, k)
+    beta = np.einsum("gij,gj->gi", inv, Xty)
+
+    e = y - np.einsum("ij,ij->i", X, beta[codigos])
+    gl = np.maximum(n_obs - k, 1)
+    scr = np.bincount(codigos, weights=e * e, minlength=G)
+    if robusto:
+        meat = _suma_por_grupo(codigos, G, X, X, pesos=e * e)
+        cov = np.einsum("gij,gjk,gkl->gil", inv, meat, inv) * (n_obs / gl)[:, None, None]
+    else:
+        cov = inv * (scr / gl)[:, None, None]
+
+    sy = np.bincount(codigos, weights=y, minlength=G)
+    sct = np.bincount(codigos, weights=y * y, minlength=G) - sy ** 2 / np.maximum(n_obs, 1)
+    r2 = np.where(sct > 0, 1 - scr / np.where(sct > 0, sct, 1), np.nan)
+
+    factor = np.r_[1.0, 1.0 / escala]
+    coef = beta * factor
+    se = np.sqrt(np.clip(np.diagonal(cov, axis1=1, axis2=2), 0, None)) * factor
+    t = coef / se
+    p = 2 * stats.t.sf(np.abs(t), df=gl[:, None])
+
+    variables = ["const"] + list(x_cols)
+    tabla = pd.DataFrame({
+        grupo_col: np.repeat(np.asarray(grupos), k),
+        "variable": np.tile(variables, G),
+        "coeficiente": coef.ravel(),
+        "error_estandar": se.ravel(),
+        "t": t.ravel(),
+        "p_valor": p.ravel(),
+        "n": np.repeat(n_obs, k),
+        "r2": np.repeat(r2, k),
+        "estimable": np.repeat(validos, k),
+    })
+    return tabla
+
+
+def seccion_ols_por_grupo(df: pd.DataFrame, y_ols: str, xs_ols, robust: bool):
+    st.subheader("Regresión por Grupos")
+    st.caption("La misma especificación OLS estimada por separado en cada grupo (estación, región, ...).")
+    
+    candidatos = [c for c in df.columns if c not in [y_ols] + list(xs_ols)]
+    grupo_col = st.selectbox("Agrupar por", ["(ninguno)"] + candidatos, key="ols_grupo_col")
+    if grupo_col == "(ninguno)":
+        return
+    
+    usados = df[[grupo_col, y_ols] + list(xs_ols)]
+    version = huella_datos(usados)
+    
+    inicio = datetime.now()
+    tabla = ols_por_grupo(usados, version, y_ols, tuple(xs_ols), grupo_col, robust)
+    seg = (datetime.now() - inicio).total_seconds()
+    
+    n_grupos = tabla[grupo_col].nunique()
+    no_estimables = tabla.loc[~tabla["estimable"], grupo_col].nunique()
+    st.caption(
+        f"{n_grupos:,} grupos en {seg:.2f} s · errores {'HC1' if robust else 'clásicos'}"
+        + (f" · {no_estimables:,} grupos sin observaciones suficientes o con X colineales (NaN)" if no_estimables else "")
+    )
+    
+    var_ver = st.selectbox("Variable", tabla["variable"].unique().tolist(), index=min(1, len(xs_ols)), key="ols_grupo_var")
+    st.dataframe(
+        style_latino(tabla[tabla["variable"] == var_ver].drop(columns="estimable"), decimals=4),
+        use_container_width=True,
+        height=400,
+    )
+    
+    st.download_button(
+        "⬇️ Descargar Coeficientes por Grupo (CSV)",
+        df_to_csv_bytes(tabla),
+        file_name="ols_por_grupo.csv",
+        mime="text/csv",
+    )
+
+
+# =========================
+# REGRESIÓN DE PANEL (EFECTOS FIJOS)
+# =========================
+def _restar_medias(M: np.ndarray, codigos: np.ndarray, n_grupos: int, conteo: np.ndarray) -> np.ndarray:
+    """M menos la media de su grupo, columna a columna con bincount (sin matrices de dummies)."""
+    medias = np.column_stack([np.bincount(codigos, weights=M[:, j], minlength=n_grupos) for j in range(M.shape[1])])
+    return M - (medias / np.maximum(conteo, 1)[:, None])[codigos]
+
+
+def transformacion_within(M: np.ndarray, efectos, tol: float = 1e-10, max_iter: int = 1000):
+    """
+    Proyecta M fuera de los efectos fijos. Con un efecto es una sola resta de medias;
+    con dos, proyecciones alternadas (restar medias del primero, luego del segundo, ...)
+    hasta que ninguna columna cambie más de `tol` relativo a su escala.
+    `efectos` es una lista de (códigos, n_grupos).
+    Devuelve (M transformada, iteraciones, convergió); sin convergencia en `max_iter`
+    iteraciones, M es la última aproximación y los coeficientes no son confiables.
+    """
+    conteos = [np.bincount(c, minlength=g) for c, g in efectos]
+    escala = np.maximum(np.abs(M).max(axis=0), 1e-300)
+    iteraciones = 0
+    for iteraciones in range(1, max_iter + 1):
+        anterior = M
+        for (c, g), cnt in zip(efectos, conteos):
+            M = _restar_medias(M, c, g, cnt)
+        if len(efectos) == 1 or np.max(np.abs(M - anterior) / escala) < tol:
+            return M, iteraciones, True
+    return M, iteraciones, False
+
+
+def _anidado_en(codigos: np.ndarray, n_grupos: int, cluster: np.ndarray, n_clusters: int) -> bool:
+    """Un efecto está anidado en el cluster si cada nivel cae en un solo cluster: pares (nivel, cluster) únicos = niveles."""
+    pares = np.unique(codigos.astype(np.int64) * n_clusters + cluster)
+    return len(pares) == n_grupos
+
+
+@st.cache_data(show_spinner=False, max_entries=32)
+def regresion_efectos_fijos(_df: pd.DataFrame, version: str, y_col: str, x_cols: tuple, efectos: tuple, cluster_col=None) -> dict:
+    """
+    Panel con efectos fijos de una o dos vías por transformación within: y y las X se
+    proyectan fuera de los efectos y se estima OLS sin constante sobre los residuos.
+    Los grados de libertad descuentan los niveles absorbidos (G₁, o G₁ + G₂ − 1 con dos vías).
+    Errores estándar clásicos o agrupados por `cluster_col`: los puntajes Σ x̃ e de cada
+    cluster salen de bincount (nunca se forma una matriz de dummies), con la corrección
+    G/(G−1)·(n−1)/(n−k). Un efecto anidado en el cluster (cada nivel en un solo cluster)
+    no suma a k; uno no anidado suma sus niveles absorbidos, como sus dummies en un OLS.
+    """
+    from scipy import stats
+
+    columnas = list(dict.fromkeys([y_col, *x_cols, *efectos] + ([cluster_col] if cluster_col else [])))
+    datos = _df[columnas].dropna()
+    n, k = len(datos), len(x_cols)
+
+    codigos_efectos = []
+    for e in efectos:
+        c, niveles = pd.factorize(datos[e])
+        codigos_efectos.append((c, len(niveles)))
+    M = datos[[y_col] + list(x_cols)].to_numpy(dtype="float64")
+    Mt, iteraciones, convergio = transformacion_within(M, codigos_efectos)
+    yt, Xt = Mt[:, 0], Mt[:, 1:]
+
+    XtX = Xt.T @ Xt
+    inv = np.linalg.pinv(XtX) if np.linalg.cond(XtX) > 1e12 else np.linalg.inv(XtX)
+    beta = inv @ (Xt.T @ yt)
+    e = yt - Xt @ beta
+
+    absorbidos = sum(g for _, g in codigos_efectos) - (len(codigos_efectos) - 1)
+    gl = max(n - k - absorbidos, 1)
+    scr = float(e @ e)
+
+    if cluster_col:
+        cl, niveles_cl = pd.factorize(datos[cluster_col])
+        G = len(niveles_cl)
+        puntajes = np.column_stack([np.bincount(cl, weights=Xt[:, j] * e, minlength=G) for j in range(k)])
+        no_anidados = [g for c, g in codigos_efectos if not _anidado_en(c, g, cl, G)]
+        # con dos efectos no anidados, uno de los niveles es redundante (como en absorbidos)
+        k_corr = k + sum(no_anidados) - max(len(no_anidados) - 1, 0)
+        correccion = G / max(G - 1, 1) * (n - 1) / max(n - k_corr, 1)
+        cov = inv @ (puntajes.T @ puntajes) @ inv * correccion
+        gl_t = max(G - 1, 1)
+    else:
+        G = None
+        cov = inv * scr / gl
+        gl_t = gl
+
+    se = np.sqrt(np.clip(np.diag(cov), 0, None))
+    t = beta / se
+    sct = float(yt @ yt)
+    return {
+        "tabla": pd.DataFrame({
+            "variable": list(x_cols),
+            "coeficiente": beta,
+            "error_estandar": se,
+            "t": t,
+            "p_valor": 2 * stats.t.sf(np.abs(t), df=gl_t),
+        }),
+        "n": n,
+        "niveles": {ef: g for ef, (_, g) in zip(efectos, codigos_efectos)},
+        "clusters": G,
+        "r2_within": 1 - scr / sct if sct > 0 else np.nan,
+        "gl": gl,
+        "iteraciones": iteraciones,
+        "convergio": convergio,
+    }
+
+
+def seccion_efectos_fijos(df: pd.DataFrame, y_ols: str, xs_ols):
+    st.subheader("Regresión de Panel (Efectos Fijos)")
+    st.caption(
+        "Efectos fijos absorbidos por transformación within (resta de medias por grupo; "
+        "proyecciones alternadas para dos vías), sin columnas dummy."
+    )
+    
+    candidatos = [c for c in df.columns if c not in [y_ols] + list(xs_ols)]
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        efecto_1 = st.selectbox("Efecto fijo 1", ["(ninguno)"] + candidatos, key="fe_efecto_1")
+    with c2:
+        efecto_2 = st.selectbox(
+            "Efecto fijo 2 (dos vías)", ["(ninguno)"] + [c for c in candidatos if c != efecto_1], key="fe_efecto_2"
+        )
+    with c3:
+        cluster = st.selectbox("Errores agrupados por (cluster)", ["(ninguno)"] + candidatos, key="fe_cluster")
+    
+    if efecto_1 == "(ninguno)":
+        return
+    efectos = (efecto_1,) if efecto_2 == "(ninguno)" else (efecto_1, efecto_2)
+    cluster = None if cluster == "(ninguno)" else cluster
+    
+    usados = df[list(dict.fromkeys([y_ols, *xs_ols, *efectos] + ([cluster] if cluster else [])))]
+    version = huella_datos(usados)
+    
+    inicio = datetime.now()
+    try:
+        res = regresion_efectos_fijos(usados, version, y_ols, tuple(xs_ols), efectos, cluster)
+    except Exception as e:
+        st.error(f"Error al ajustar el modelo de panel: {e}")
+        return
+    seg = (datetime.now() - inicio).total_seconds()
+    
+    if not res["convergio"]:
+        st.warning(
+            f"⚠️ Las proyecciones alternadas no convergieron en {res['iteraciones']:,} iteraciones: "
+            "los coeficientes son aproximados. Suele pasar con efectos muy desbalanceados o casi colineales."
+        )
+    
+    niveles = " · ".join(f"{ef}: {g:,} niveles" for ef, g in res["niveles"].items())
+    st.caption(
+        f"{res['n']:,} observaciones · {niveles}"
+        + (f" · {res['iteraciones']} iteraciones" if len(efectos) == 2 else "")
+        + f" · {seg:.2f} s"
+    )
+    
+    m1, m2, m3 = st.columns(3)
+    m1.metric("R² within", f"{res['r2_within']:.4f}")
+    m2.metric("Grados de libertad", f"{res['gl']:,}")
+    m3.metric("Errores estándar", f"Cluster ({res['clusters']:,})" if cluster else "Clásicos")
+    
+    st.dataframe(style_latino(res["tabla"], decimals=4), use_container_width=True, hide_index=True)
+    st.download_button(
+        "⬇️ Descargar Coeficientes de Panel (CSV)",
+        df_to_csv_bytes(res["tabla"]),
+        file_name="efectos_fijos.csv",
+        mime="text/csv",
+    )
+
 
 # =========================
 # PROYECCIONES Y ECONOMETRÍA CON TEORÍA
@@ -874,18 +1234,21 @@ def seccion_proyecciones(df: pd.DataFrame):
         
     else:  # LOESS
         try:
-            import statsmodels.api as sm
-            lowess = sm.nonparametric.lowess
-            result = lowess(y, x, frac=0.66)
-            sorted_indices = np.argsort(x)
-            x = x[sorted_indices]
-            y = y[sorted_indices]
-            predictions = result[:, 1][sorted_indices]
-            
-            st.info("**LOESS:** Ajuste local ponderado (no tiene ecuación explícita)")
+            # Esta página no lleva versión del dataset: la clave de caché sale del contenido de X e Y
+            version = huella_datos(data_clean)
+            ajuste = ajustar_loess(x, y, version, x_col, y_col)
         except ImportError:
             st.error("Para usar LOESS, instala: pip install statsmodels")
             return
+        x = x[ajuste["orden"]]
+        y = y[ajuste["orden"]]
+        predictions = ajuste["pred"]
+        
+        st.info("**LOESS:** Ajuste local ponderado (no tiene ecuación explícita)")
+        st.caption(
+            f"Ajuste sobre {ajuste['puntos_ajuste']:,} de {len(x):,} puntos · error máx. frente a LOESS exacto: "
+            f"{100 * ajuste['error_rel']:.2f}% de la desviación de Y"
+        )
     
     # Calcular intervalos
     residuals = y - predictions
@@ -899,29 +1262,37 @@ def seccion_proyecciones(df: pd.DataFrame):
     # Visualización
     st.subheader(f"Resultados: {y_col} vs {x_col}")
     
-    fig, ax = plt.subplots(figsize=(12, 7))
-    
-    # Puntos normales
-    ax.scatter(x[~outliers_mask], y[~outliers_mask], alpha=0.5, label="Datos normales", s=50, color='steelblue')
-    
-    # Outliers
-    ax.scatter(x[outliers_mask], y[outliers_mask], alpha=0.7, label="Outliers", 
-               marker='x', s=100, color='red', linewidths=2)
-    
-    # Línea de regresión
-    sorted_indices = np.argsort(x)
-    ax.plot(x[sorted_indices], predictions[sorted_indices], 'b-', linewidth=2, label="Predicción")
-    
-    # Intervalo de confianza
-    ax.fill_between(x[sorted_indices], lower_bound[sorted_indices], upper_bound[sorted_indices], 
-                     alpha=0.2, color='blue', label=f"IC {sigma_val}σ")
-    
-    ax.set_xlabel(x_col, fontsize=12)
-    ax.set_ylabel(y_col, fontsize=12)
-    ax.legend(fontsize=10)
-    ax.grid(True, alpha=0.3)
+    def construir():
+        fig, ax = plt.subplots(figsize=(12, 7))
+        
+        # Puntos normales
+        ax.scatter(x[~outliers_mask], y[~outliers_mask], alpha=0.5, label="Datos normales", s=50, color='steelblue')
+        
+        # Outliers
+        ax.scatter(x[outliers_mask], y[outliers_mask], alpha=0.7, label="Outliers", 
+                   marker='x', s=100, color='red', linewidths=2)
+        
+        # Línea de regresión
+        sorted_indices = np.argsort(x)
+        ax.plot(x[sorted_indices], predictions[sorted_indices], 'b-', linewidth=2, label="Predicción")
+        
+        # Intervalo de confianza
+        ax.fill_between(x[sorted_indices], lower_bound[sorted_indices], upper_bound[sorted_indices], 
+                         alpha=0.2, color='blue', label=f"IC {sigma_val}σ")
+        
+        ax.set_xlabel(x_col, fontsize=12)
+        ax.set_ylabel(y_col, fontsize=12)
+        ax.legend(fontsize=10)
+        ax.grid(True, alpha=0.3)
+        
+        ax.yaxis.set_major_formatter(mpl_lat_formatter(decimals=2))
+        return fig, []
     
-    st.pyplot(fig)
+    spec = {
+        "grafico": "proyeccion", "datos": huella_datos(data_clean), "x": x_col, "y": y_col,
+        "tipo": tipo_regresion, "grado": grado, "sigma": sigma_val,
+    }
+    mostrar_figura_matplotlib(spec, construir)
     
     # Métricas
     col1, col2, col3 = st.columns(3)
@@ -948,7 +1319,7 @@ def seccion_proyecciones(df: pd.DataFrame):
         outliers_df["Predicción"] = predictions[outliers_mask]
         outliers_df["Residuo"] = residuals[outliers_mask]
         outliers_df["Desviaciones σ"] = (residuals[outliers_mask] / std_dev).round(2)
-        st.dataframe(outliers_df, use_container_width=True, height=300)
+        st.dataframe(style_latino(outliers_df, decimals=4), use_container_width=True, height=300)
         
         st.download_button(
             "⬇️ Descargar Outliers (CSV)",
@@ -1032,6 +1403,12 @@ def seccion_proyecciones(df: pd.DataFrame):
             st.error("Para usar OLS avanzado, instala: pip install statsmodels")
         except Exception as e:
             st.error(f"Error al ajustar el modelo: {e}")
+        
+        st.divider()
+        seccion_ols_por_grupo(df, y_ols, xs_ols, robust)
+        
+        st.divider()
+        seccion_efectos_fijos(df, y_ols, xs_ols)
 
 # =========================
 # MAIN APPLICATION
@@ -1099,7 +1476,7 @@ def data_analysis():
     
     # Vista previa
     with st.expander("👀 Vista Previa del Dataset", expanded=False):
-        st.dataframe(df_typed.head(100), use_container_width=True, height=400)
+        st.dataframe(style_latino(df_typed.head(100), decimals=2), use_container_width=True, height=400)
     
     st.divider()
     
@@ -1138,7 +1515,12 @@ def data_analysis():
     # Vista completa del dataset
     st.divider()
     st.header("📋 Dataset Completo")
-    st.dataframe(df_typed, use_container_width=True, height=500)
+    # clave barata (firma del archivo + limpieza + tipos) en vez de hashear cada celda en cada rerun
+    version = version_dataset(
+        path, sheet, firma_archivo(path), drop_blank, auto_numeric, umbral,
+        sorted(st.session_state.get("col_types", {}).items()),
+    )
+    mostrar_grilla_paginada(df_typed, version, key="ofi_grid_completo", decimals=2, height=500)
     
     # Botón de descarga
     st.download_button(
@@ -0,0 +1,376 @@
+"""
+Estadística descriptiva en una sola pasada sobre lotes (row groups de Parquet o
+trozos de CSV), con memoria acotada e independiente del número de filas.
+
+Cada columna mantiene resúmenes "fusionables" que se actualizan lote a lote:
+- Welford/Chan: conteo, media, varianza, mínimo y máximo (exactos).
+- KLL: cuantiles con error de rango acotado (cota calculada con las compactaciones hechas).
+- HyperLogLog: cantidad aproximada de valores distintos.
+- Misra-Gries / space-saving: valores más frecuentes con cota de error por conteo.
+
+No depende de Streamlit: data.py arma los lotes y muestra los resultados.
+"""
+import numpy as np
+import pandas as pd
+
+
+# =========================
+# MEDIA Y VARIANZA (WELFORD / CHAN)
+# =========================
+class ResumenMomentos:
+    """Conteo, media, M2 (suma de cuadrados centrados), mínimo y máximo, combinados por lotes."""
+
+    def __init__(self):
+        self.n = 0
+        self.media = 0.0
+        self.m2 = 0.0
+        self.minimo = np.inf
+        self.maximo = -np.inf
+
+    def actualizar(self, x: np.ndarray):
+        """`x` sin nulos. Resume el lote en forma vectorizada y lo fusiona con la fórmula de Chan."""
+        n_b = len(x)
+        if not n_b:
+            return
+        media_b = float(x.mean())
+        m2_b = float(((x - media_b) ** 2).sum())
+        n = self.n + n_b
+        delta = media_b - self.media
+        self.media += delta * n_b / n
+        self.m2 += m2_b + delta * delta * self.n * n_b / n
+        self.n = n
+        self.minimo = min(self.minimo, float(x.min()))
+        self.maximo = max(self.maximo, float(x.max()))
+
+    @property
+    def desviacion(self) -> float:
+        # misma convención que pandas (ddof=1)
+        return float(np.sqrt(self.m2 / (self.n - 1))) if self.n > 1 else np.nan
+
+
+# =========================
+# CUANTILES (KLL)
+# =========================
+class CuantilesKLL:
+    """
+    Sketch KLL (Karnin, Lang y Liberty, 2016): una pila de compactadores; el nivel h guarda
+    ítems de peso 2**h y su capacidad decrece geométricamente (factor 2/3) hacia abajo.
+
+    La cota de error no es una cifra de referencia sino la de este sketch: compactar un
+    nivel de peso w cambia el rango de cualquier consulta en 0 o ±w, con media 0 (el
+    desplazamiento par/impar es al azar). Sumando las compactaciones hechas, Hoeffding da
+    P(|error| ≥ t) ≤ 2·exp(−t² / (2·Σw²)), de donde sale `error_rango` (fracción de n).
+    """
+
+    def __init__(self, k: int = 200, semilla: int = 0):
+        self.k = k
+        self.n = 0
+        self.niveles = [np.empty(0)]
+        self._suma_w2 = 0.0
+        self._rng = np.random.default_rng(semilla)  # semilla fija: resultados reproducibles
+
+    def error_rango(self, confianza: float = 0.99) -> float:
+        """Error de rango (fracción de n) que se cumple con probabilidad `confianza`."""
+        if not self.n:
+            return 0.0
+        t = np.sqrt(2.0 * self._suma_w2 * np.log(2.0 / (1.0 - confianza)))
+        return float(min(1.0, t / self.n))
+
+    def _capacidad(self, h: int) -> int:
+        profundidad = len(self.niveles) - 1 - h
+        return max(2, int(np.ceil(self.k * (2 / 3) ** profundidad)))
+
+    def actualizar(self, x: np.ndarray):
+        if not len(x):
+            return
+        self.n += len(x)
+        self.niveles[0] = np.concatenate((self.niveles[0], x))
+        self._compactar()
+
+    def _compactar(self):
+        # un barrido hacia arriba: cada nivel lleno se compacta una vez y pasa la mitad al siguiente
+        h = 0
+        while h < len(self.niveles):
+            nivel = self.niveles[h]
+            if len(nivel) > self._capacidad(h):
+                if h + 1 == len(self.niveles):
+                    self.niveles.append(np.empty(0))
+                nivel = np.sort(nivel)
+                # con largo impar, el último ítem queda en el nivel
+                resto = nivel[len(nivel) - len(nivel) % 2:]
+                pares = nivel[: len(nivel) - len(nivel) % 2]
+                # se promueve uno de cada dos ítems (pares o impares al azar), con el doble de peso
+                promovidos = pares[self._rng.integers(2)::2]
+                self.niveles[h] = resto
+                self.niveles[h + 1] = np.concatenate((self.niveles[h + 1], promovidos))
+                self._suma_w2 += 4.0 ** h
+            h += 1
+
+    def cuantiles(self, qs) -> np.ndarray:
+        qs = np.asarray(qs, dtype="float64")
+        if not self.n:
+            return np.full(qs.shape, np.nan)
+        valores = np.concatenate(self.niveles)
+        pesos = np.concatenate([np.full(len(v), 2.0 ** h) for h, v in enumerate(self.niveles)])
+        orden = np.argsort(valores, kind="stable")
+        valores, acumulado = valores[orden], np.cumsum(pesos[orden])
+        rangos = np.clip(qs, 0.0, 1.0) * acumulado[-1]
+        idx = np.searchsorted(acumulado, rangos, side="left")
+        return valores[np.minimum(idx, len(valores) - 1)]
+
+
+# =========================
+# VALORES DISTINTOS (HYPERLOGLOG)
+# =========================
+class DistintosHLL:
+    """HyperLogLog con 2**p registros; error estándar relativo ≈ 1,04 / sqrt(2**p)."""
+
+    def __init__(self, p: int = 14):
+        self.p = p
+        self.m = 1 << p
+        self.registros = np.zeros(self.m, dtype=np.uint8)
+
+    @property
+    def error_relativo(self) -> float:
+        return 1.04 / np.sqrt(self.m)
+
+    def actualizar(self, valores: np.ndarray):
+        if not len(valores):
+            return
+        h = pd.util.hash_array(valores, categorize=True)  # uint64, vectorizado
+        indice = (h >> np.uint64(64 - self.p)).astype(np.int64)
+        # rango = posición del primer bit 1 en los 32 bits que siguen al índice
+        siguiente = ((h >> np.uint64(32 - self.p)) & np.uint64(0xFFFFFFFF)).astype("float64")
+        _, exponente = np.frexp(siguiente)  # exponente = cantidad de bits significativos
+        rango = np.where(siguiente > 0, 33 - exponente, 33).astype(np.uint8)
+        np.maximum.at(self.registros, indice, rango)
+
+    def estimar(self) -> float:
+        m = self.m
+        alfa = 0.7213 / (1 + 1.079 / m)
+        estimacion = alfa * m * m / np.sum(np.ldexp(1.0, -self.registros.astype(np.int64)))
+        ceros = int(np.count_nonzero(self.registros == 0))
+        if estimacion <= 2.5 * m and ceros:
+            # rango pequeño: conteo lineal
+            estimacion = m * np.log(m / ceros)
+        return float(estimacion)
+
+
+# =========================
+# MÁS FRECUENTES (MISRA-GRIES / SPACE-SAVING)
+# =========================
+class MasFrecuentes:
+    """
+    Resumen Misra-Gries fusionable (equivalente a space-saving) con `m` contadores.
+    Cada conteo es una cota inferior del real y lo subestima a lo sumo en
+    (n - suma de contadores) / (m + 1), así que todo valor con frecuencia mayor a
+    n / (m + 1) aparece en el resumen.
+    """
+
+    def __init__(self, m: int = 256):
+        self.m = m
+        self.n = 0
+        self.contadores = pd.Series(dtype="float64")
+
+    def actualizar(self, valores: pd.Series):
+        if not len(valores):
+            return
+        self.n += len(valores)
+        lote = valores.value_counts(sort=False).astype("float64")
+        total = self.contadores.add(lote, fill_value=0.0)
+        if len(total) > self.m:
+            # se descuenta el (m+1)-ésimo conteo a todos y se conservan los positivos
+            umbral = float(np.partition(total.to_numpy(), -(self.m + 1))[-(self.m + 1)])
+            total = total - umbral
+            total = total[total > 0]
+        self.contadores = total
+
+    @property
+    def cota_error(self) -> float:
+        return (self.n - float(self.contadores.sum())) / (self.m + 1)
+
+    def top(self, k: int = 10) -> pd.DataFrame:
+        c = self.contadores.sort_values(ascending=False, kind="stable").head(k)
+        return pd.DataFrame({
+            "valor": c.index,
+            "frecuencia_min": c.to_numpy(),
+            "frecuencia_max": c.to_numpy() + self.cota_error,
+        })
+
+
+# =========================
+# PERFIL POR LOTES
+# =========================
+CUANTILES_PERFIL = (0.25, 0.5, 0.75)
+
+
+def _es_texto(s: pd.Series) -> bool:
+    return s.dtype == object or isinstance(s.dtype, pd.StringDtype)
+
+
+def perfil_por_lotes(
+    lotes,
+    columnas,
+    k_cuantiles: int = 200,
+    p_hll: int = 14,
+    m_frecuentes: int = 256,
+    quitar_en_blanco: bool = False,
+    convertir=None,
+    umbral: float = 0.70,
+):
+    """
+    Recorre una vez los lotes (iterable de DataFrames con `columnas`) y devuelve un dict:
+    - "filas": total de filas leídas
+    - "resumen": tabla tipo describe(include="all"), estadísticos en filas y variables en columnas
+    - "cotas": error garantizado o esperado de cada estimación aproximada
+    - "faltantes": nulos por variable (exactos)
+    - "frecuentes": {variable: tabla de valores más frecuentes con intervalo de frecuencia}
+    El tipo de una columna se decide en el primer lote en que trae algún dato (un lote sin
+    datos, que el CSV lee como float64, no decide): numérica si lo es ese lote. Si después
+    una numérica trae valores que to_numeric no convierte, pasa a resumirse como texto y
+    como número a la vez, igual que una de texto (ver `convertir`); las filas numéricas
+    anteriores quedan en el resumen numérico y en el conteo, pero no en distintos ni en
+    frecuencias.
+
+    Limpieza, para que el perfil coincida con el del dataset cargado en memoria:
+    - `quitar_en_blanco`: descarta en cada lote las filas sin ningún dato (los lotes deben
+      traer todas las columnas del archivo) y, al final, las variables sin ningún dato.
+    - `convertir`: función texto -> número (NaN si no convierte). Las columnas de texto se
+      resumen a la vez como texto y como número convertido; al terminar se usa la versión
+      numérica si convirtió al menos `umbral` del total de filas, igual que en memoria.
+    """
+    filas = 0
+    tipos, nulos, sk = {}, {}, {}
+    # columnas de texto candidatas a numéricas: filas vistas, valores convertidos y sketches
+    vistos, convertidos, sk_num = {}, {}, {}
+    # filas con dato que una columna numérica resumió antes de pasar a texto
+    previos = {}
+
+    def _actualizar_numerico(resumenes, x):
+        ok = ~np.isnan(x)
+        for resumen in resumenes:
+            resumen.actualizar(x[ok])
+        return int(ok.sum())
+
+    for lote in lotes:
+        if quitar_en_blanco:
+            lote = lote.dropna(how="all")
+        filas += len(lote)
+        for c in columnas:
+            if c not in lote.columns:
+                continue
+            s = lote[c]
+            if tipos.get(c) is None:
+                nulos.setdefault(c, 0)
+                if not s.notna().any():
+                    tipos[c] = None  # sin datos todavía: el tipo queda sin decidir
+                    nulos[c] += len(s)
+                    continue
+                es_num = pd.api.types.is_numeric_dtype(s) and not pd.api.types.is_bool_dtype(s)
+                tipos[c] = "num" if es_num else "cat"
+                if es_num:
+                    sk[c] = (ResumenMomentos(), CuantilesKLL(k=k_cuantiles))
+                else:
+                    sk[c] = (DistintosHLL(p=p_hll), MasFrecuentes(m=m_frecuentes))
+                    if convertir is not None and _es_texto(s):
+                        # las filas anteriores, todas vacías, cuentan como no convertidas
+                        vistos[c], convertidos[c] = nulos[c], 0
+                        sk_num[c] = (ResumenMomentos(), CuantilesKLL(k=k_cuantiles))
+
+            if tipos[c] == "num":
+                x = pd.to_numeric(s, errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+                if not (np.isnan(x) & s.notna().to_numpy()).any():
+                    nulos[c] += len(x) - _actualizar_numerico(sk[c], x)
+                    continue
+                # valores que no son números: desde aquí se resume como texto, y lo numérico
+                # acumulado sigue como candidato (o se descarta sin `convertir`)
+                tipos[c] = "cat"
+                previos[c] = sk[c][0].n
+                if convertir is not None:
+                    vistos[c], convertidos[c] = filas - len(lote), sk[c][0].n
+                    sk_num[c] = sk[c]
+                sk[c] = (DistintosHLL(p=p_hll), MasFrecuentes(m=m_frecuentes))
+
+            if tipos[c] == "cat":
+                if c in sk_num:
+                    x = pd.to_numeric(convertir(s), errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+                    vistos[c] += len(x)
+                    convertidos[c] += _actualizar_numerico(sk_num[c], x)
+                s = s.dropna()
+                nulos[c] += int(len(lote) - len(s))
+                s = s.astype(str)  # mismo valor -> mismo hash aunque cambie el tipo entre lotes
+                sk[c][0].actualizar(s.to_numpy(dtype=object))
+                sk[c][1].actualizar(s)
+
+    for c in sk_num:
+        if vistos[c] and convertidos[c] / vistos[c] >= umbral:
+            tipos[c], sk[c] = "num", sk_num[c]
+            nulos[c] = vistos[c] - convertidos[c]
+    for c, t in tipos.items():
+        if t is None:
+            # nunca trajo datos: numérica vacía, como la lee pandas
+            tipos[c], sk[c] = "num", (ResumenMomentos(), CuantilesKLL(k=k_cuantiles))
+
+    resumen, cotas, frecuentes = {}, [], {}
+    for c in columnas:
+        if c not in tipos:
+            continue
+        if quitar_en_blanco and nulos[c] == filas:
+            del nulos[c]
+            continue
+        if tipos[c] == "num":
+            mom, kll = sk[c]
+            q = kll.cuantiles(CUANTILES_PERFIL)
+            vacia = mom.n == 0
+            resumen[c] = {
+                "count": mom.n, "mean": np.nan if vacia else mom.media, "std": mom.desviacion,
+                "min": np.nan if vacia else mom.minimo,
+                "25%": q[0], "50%": q[1], "75%": q[2], "max": np.nan if vacia else mom.maximo,
+            }
+            eps = kll.error_rango(0.99)
+            bajo = kll.cuantiles(np.subtract(CUANTILES_PERFIL, eps))
+            alto = kll.cuantiles(np.add(CUANTILES_PERFIL, eps))
+            for i, nombre in enumerate(("25%", "50%", "75%")):
+                cotas.append({
+                    "variable": c, "estadístico": nombre, "estimación": q[i],
+                    "cota inferior": bajo[i], "cota superior": alto[i],
+                    "tipo de cota": f"rango ±{eps * 100:.2f} % (99 %, cota de Hoeffding)",
+                })
+        else:
+            hll, mg = sk[c]
+            distintos = hll.estimar()
+            top = mg.top(k=10)
+            resumen[c] = {
+                "count": mg.n + previos.get(c, 0),
+                "unique": round(distintos),
+                "top": top["valor"].iloc[0] if len(top) else np.nan,
+                "freq": top["frecuencia_min"].iloc[0] if len(top) else np.nan,
+            }
+            err = 2 * hll.error_relativo
+            cotas.append({
+                "variable": c, "estadístico": "unique", "estimación": distintos,
+                "cota inferior": distintos * (1 - err), "cota superior": distintos * (1 + err),
+                "tipo de cota": f"±{err * 100:.2f} % (2 errores estándar)",
+            })
+            if len(top):
+                cotas.append({
+                    "variable": c, "estadístico": "freq", "estimación": top["frecuencia_min"].iloc[0],
+                    "cota inferior": top["frecuencia_min"].iloc[0], "cota superior": top["frecuencia_max"].iloc[0],
+                    "tipo de cota": "garantizada (Misra-Gries)",
+                })
+            frecuentes[c] = top
+
+    orden = ["count", "unique", "top", "freq", "mean", "std", "min", "25%", "50%", "75%", "max"]
+    tabla = pd.DataFrame(resumen)
+    tabla = tabla.reindex([f for f in orden if f in tabla.index])
+
+    faltantes = pd.Series(nulos, dtype="int64").sort_values(ascending=False).to_frame("Cantidad de NA")
+    faltantes["% de NA"] = (faltantes["Cantidad de NA"] / filas * 100).round(2) if filas else 0.0
+
+    return {
+        "filas": filas,
+        "resumen": tabla,
+        "cotas": pd.DataFrame(cotas),
+        "faltantes": faltantes,
+        "frecuentes": frecuentes,
+    }